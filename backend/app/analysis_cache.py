@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+from dotenv import load_dotenv
+from .cache import LRUCache
+from .fingerprint import fingerprint_error
+from .metrics import CACHE_REQUESTS
+from .records import ErrorCount
+
+load_dotenv(override=True)
+
+logger = logging.getLogger(__name__)
+
+# In-process tier
+ANALYSIS_CACHE_SIZE = int(os.getenv('ANALYSIS_CACHE_SIZE', '2048'))
+ANALYSIS_CACHE_TTL = float(os.getenv('ANALYSIS_CACHE_TTL', str(7 * 24 * 3600)))
+# Persistent SQLite tier, set ANALYSIS_CACHE_PATH to an empty string to disable it
+ANALYSIS_CACHE_PATH = os.getenv('ANALYSIS_CACHE_PATH', '.cache/analysis.sqlite3')
+ANALYSIS_CACHE_MAX_ROWS = int(os.getenv('ANALYSIS_CACHE_MAX_ROWS', '100000'))
+
+def error_set_fingerprint(errors: List[ErrorCount]) -> str:
+    """
+    Stable key for a set of ErrorCount errors. Each error is reduced to its
+    fingerprint, then de-duplicated and sorted; counts are ignored so the same
+    bug seen by different users maps to the same analysis.
+    """
+    fingerprints = sorted({
+        error.fingerprint or fingerprint_error(error.message)
+        for error in errors if error.message
+    })
+    return hashlib.sha256("\n".join(fingerprints).encode()).hexdigest()
+
+class SQLiteAnalysisStore:
+    """Persistent analysis cache in a local SQLite file with TTL and row-count eviction"""
+
+    def __init__(self, path: str, ttl: float | None = None, max_rows: int = ANALYSIS_CACHE_MAX_ROWS):
+        self.path = path
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                "fingerprint TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS analysis_cache_accessed ON analysis_cache (accessed_at)"
+            )
+        return self._conn
+
+    def get(self, fingerprint: str) -> Dict | None:
+        """Return the stored analysis for fingerprint, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value, created_at FROM analysis_cache WHERE fingerprint = ?",
+                (fingerprint,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl and row[1] + self.ttl <= now:
+                conn.execute("DELETE FROM analysis_cache WHERE fingerprint = ?", (fingerprint,))
+                conn.commit()
+                return None
+            conn.execute(
+                "UPDATE analysis_cache SET accessed_at = ? WHERE fingerprint = ?",
+                (now, fingerprint)
+            )
+            conn.commit()
+        return json.loads(row[0])
+
+    def set(self, fingerprint: str, value: Dict):
+        """Store an analysis, dropping expired and least recently used rows past max_rows"""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO analysis_cache (fingerprint, value, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (fingerprint, json.dumps(value), now, now)
+            )
+            if self.ttl:
+                conn.execute("DELETE FROM analysis_cache WHERE created_at <= ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM analysis_cache WHERE fingerprint IN ("
+                "SELECT fingerprint FROM analysis_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_rows,)
+            )
+            conn.commit()
+
+class AnalysisCache:
+    """
+    Two-tier cache of AI error analyses keyed by error_set_fingerprint: an
+    in-process LRU in front of an optional persistent store. Store hits are
+    promoted into the LRU.
+    """
+
+    def __init__(self, memory: LRUCache, store: SQLiteAnalysisStore | None = None):
+        self.memory = memory
+        self.store = store
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    async def get(self, errors: List[Dict]) -> Dict | None:
+        """Return a cached analysis for this error set, or None"""
+        fingerprint = error_set_fingerprint(errors)
+        analysis = self.memory.get(fingerprint)
+        if analysis is not None:
+            self.hits += 1
+            CACHE_REQUESTS.inc(cache="analysis", result="hit")
+            return analysis
+
+        if self.store is not None:
+            try:
+                analysis = await asyncio.to_thread(self.store.get, fingerprint)
+            except Exception as e:
+                logger.warning("Error reading analysis cache", extra={"error": str(e)})
+                analysis = None
+            if analysis is not None:
+                self.hits += 1
+                self.store_hits += 1
+                CACHE_REQUESTS.inc(cache="analysis", result="store_hit")
+                self.memory.set(fingerprint, analysis)
+                return analysis
+
+        self.misses += 1
+        CACHE_REQUESTS.inc(cache="analysis", result="miss")
+        return None
+
+    async def set(self, errors: List[Dict], analysis: Dict):
+        """Cache an analysis for this error set in every tier"""
+        fingerprint = error_set_fingerprint(errors)
+        self.memory.set(fingerprint, analysis)
+        if self.store is not None:
+            try:
+                await asyncio.to_thread(self.store.set, fingerprint, analysis)
+            except Exception as e:
+                logger.warning("Error writing analysis cache", extra={"error": str(e)})
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters for the cache and its in-process tier"""
+        return {
+            "hits": self.hits,
+            "store_hits": self.store_hits,
+            "misses": self.misses,
+            "memory": self.memory.stats(),
+            "persistent": self.store.path if self.store is not None else None
+        }
+
+analysis_cache = AnalysisCache(
+    LRUCache(max_size=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL),
+    SQLiteAnalysisStore(ANALYSIS_CACHE_PATH, ttl=ANALYSIS_CACHE_TTL) if ANALYSIS_CACHE_PATH else None
+)
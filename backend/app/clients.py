@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+logger = logging.getLogger(__name__)
+
+GEMINI_BASE_URL = os.getenv('GEMINI_BASE_URL', "https://generativelanguage.googleapis.com/v1beta/openai/")
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', "gemini-2.0-flash")
+
+class ClientRegistry:
+    """
+    Shared, lazily built clients. Each client is created by its factory the
+    first time it is requested and reused afterwards; heavy SDK imports live in
+    the factories so importing the app stays cheap. Build times are recorded
+    for the startup benchmark.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._clients: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self.build_times: Dict[str, float] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        self._factories[name] = factory
+
+    def get(self, name: str) -> Any:
+        """Return the named client, building it on first use"""
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                started = time.perf_counter()
+                client = self._factories[name]()
+                self.build_times[name] = time.perf_counter() - started
+                self._clients[name] = client
+        return client
+
+    def pop(self, name: str) -> Any:
+        """Forget the named client so the next get() builds a new one, and return it"""
+        with self._lock:
+            return self._clients.pop(name, None)
+
+    def is_built(self, name: str) -> bool:
+        return name in self._clients
+
+    async def warm_up(self, names: Iterable[str] | None = None):
+        """Build clients in a worker thread so the first request doesn't pay for them"""
+        for name in names or list(self._factories):
+            try:
+                await asyncio.to_thread(self.get, name)
+            except Exception as e:
+                logger.warning("Client warm-up failed", extra={"client": name, "error": str(e)})
+
+registry = ClientRegistry()
+
+def _build_gemini_client():
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(
+        api_key=os.getenv('GEMINI_API_KEY'),
+        base_url=GEMINI_BASE_URL,
+        # Retries and backoff are handled by the Gemini scheduler
+        max_retries=0
+    )
+
+def _build_gemini_model():
+    from agents import OpenAIChatCompletionsModel
+    return OpenAIChatCompletionsModel(model=GEMINI_MODEL, openai_client=registry.get('gemini_client'))
+
+def _build_supabase():
+    from supabase import create_client
+    return create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
+
+registry.register('gemini_client', _build_gemini_client)
+registry.register('gemini_model', _build_gemini_model)
+registry.register('supabase', _build_supabase)
+
+def get_gemini_client():
+    """AsyncOpenAI client pointed at Gemini's OpenAI-compatible endpoint"""
+    return registry.get('gemini_client')
+
+def get_gemini_model():
+    """Agents SDK chat completions model backed by the shared Gemini client"""
+    return registry.get('gemini_model')
+
+def get_supabase():
+    """Shared Supabase client"""
+    return registry.get('supabase')
@@ -1,128 +1,525 @@
+import asyncio
+import base64
+import json
+import logging
 import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from typing import List, Dict
-from supabase import create_client, Client
 from dotenv import load_dotenv
+from .clients import get_supabase
+from .error_index import error_index
+from .fingerprint import fingerprint_error
+from .metrics import UPSTREAM_SECONDS, span
+from .payloads import PayloadChunk, join_payload, split_payload
+from .records import ErrorCount, ProcessedSession
 
 load_dotenv(override=True)
 
-# Supabase configuration
-supabase_url = os.getenv('SUPABASE_URL')
-supabase_key = os.getenv('SUPABASE_KEY')
+logger = logging.getLogger(__name__)
 
-# Initialize Supabase client
-supabase: Client = create_client(supabase_url, supabase_key)
+# The Supabase client is created on first use by app.clients
+
+# Columns the analysis pipeline needs when reusing an already processed session
+SESSION_LOOKUP_COLUMNS = 'session_id,video_link,error_tags,title,description,start_time,end_time'
+# Ids per in_() query, keeps the PostgREST request URL well under proxy limits
+SESSION_LOOKUP_CHUNK_SIZE = int(os.getenv('SESSION_LOOKUP_CHUNK_SIZE', '200'))
+
+# 'inline' keeps each recording's payload in its data column, 'chunked' stores it
+# compressed in the recording_chunks table (hash text primary key, codec text,
+# data text) and keeps only the ordered chunk hashes (chunks text[]) and the raw
+# size (payload_bytes bigint) on the recording
+RECORDING_STORAGE = os.getenv('RECORDING_STORAGE', 'inline')
+# What recording listings return, never the payload itself
+RECORDING_METADATA_COLUMNS = 'id,session_id,duration' + (',payload_bytes' if RECORDING_STORAGE == 'chunked' else '')
+# Chunks per recording_chunks insert, each can be a few hundred KB
+RECORDING_CHUNK_WRITE_BATCH = int(os.getenv('RECORDING_CHUNK_WRITE_BATCH', '8'))
+# Chunk hashes per in_() lookup; each is 64 characters, so fewer fit in a request URL than session ids
+RECORDING_CHUNK_LOOKUP_SIZE = int(os.getenv('RECORDING_CHUNK_LOOKUP_SIZE', '50'))
+
+# Columns of the posthog table a listing may project
+SESSION_COLUMNS = ('session_id', 'video_link', 'error_tags', 'title', 'description', 'start_time', 'end_time')
+# Largest page list_processed_sessions returns
+SESSION_PAGE_MAX_SIZE = int(os.getenv('SESSION_PAGE_MAX_SIZE', '1000'))
+
+# Write-behind settings for SessionWriter
+SESSION_WRITE_BATCH_SIZE = int(os.getenv('SESSION_WRITE_BATCH_SIZE', '100'))
+SESSION_WRITE_FLUSH_INTERVAL = float(os.getenv('SESSION_WRITE_FLUSH_INTERVAL', '5'))
+
+@contextmanager
+def _supabase_call(operation: str):
+    """Record the duration and outcome of one Supabase request"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "2xx"
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, upstream="supabase", endpoint=operation, outcome=outcome)
+
+def _store_payload(payload: Dict) -> Dict:
+    """
+    Write a recording payload as content-addressed compressed chunks and return
+    the recording columns that point at them. Chunks already stored, by this or
+    any other recording, are not sent again.
+    """
+    hashes, chunks, size = split_payload(payload)
+    table = get_supabase().table('recording_chunks')
+    stored = set()
+    for start in range(0, len(chunks), RECORDING_CHUNK_LOOKUP_SIZE):
+        batch = [chunk.hash for chunk in chunks[start:start + RECORDING_CHUNK_LOOKUP_SIZE]]
+        with _supabase_call("select"):
+            stored.update(row['hash'] for row in table.select('hash').in_('hash', batch).execute().data)
+
+    missing = [chunk.to_row() for chunk in chunks if chunk.hash not in stored]
+    for start in range(0, len(missing), RECORDING_CHUNK_WRITE_BATCH):
+        with _supabase_call("upsert"):
+            # Another writer may store the same chunk concurrently; identical content, keep either
+            table.upsert(
+                missing[start:start + RECORDING_CHUNK_WRITE_BATCH],
+                on_conflict='hash',
+                ignore_duplicates=True
+            ).execute()
+    return {'data': None, 'chunks': hashes, 'payload_bytes': size}
+
+def attach_recording_payloads(rows: List[Dict]) -> List[Dict]:
+    """
+    Fill in the data of chunked recordings in place, fetching every distinct
+    chunk they need once and decompressing only these rows' payloads.
+    """
+    needed = list(dict.fromkeys(digest for row in rows for digest in row.get('chunks') or []))
+    if not needed:
+        return rows
+    chunks = {}
+    table = get_supabase().table('recording_chunks')
+    for start in range(0, len(needed), RECORDING_CHUNK_LOOKUP_SIZE):
+        with _supabase_call("select"):
+            result = table.select('hash,codec,data').in_('hash', needed[start:start + RECORDING_CHUNK_LOOKUP_SIZE]).execute()
+        chunks.update((row['hash'], PayloadChunk.from_row(row)) for row in result.data)
+    for row in rows:
+        if row.get('chunks'):
+            row['data'] = join_payload(row['chunks'], chunks)
+    return rows
 
 # Database functions
 def save_recording(recording_data: Dict):
-    """Save a recording to Supabase"""
+    """Save a recording to Supabase, with its payload inline or as chunks per RECORDING_STORAGE"""
     try:
-        result = supabase.table('recordings').insert({
+        row = {
             'id': recording_data.get('id'),
             'session_id': recording_data.get('session_id'),
-            'duration': recording_data.get('duration'),
-            'data': recording_data
-        }).execute()
+            'duration': recording_data.get('duration')
+        }
+        if RECORDING_STORAGE == 'chunked':
+            row.update(_store_payload(recording_data))
+        else:
+            row['data'] = recording_data
+        result = get_supabase().table('recordings').insert(row).execute()
         return result
     except Exception as e:
-        print(f"Error saving recording: {e}")
+        logger.error("Error saving recording", extra={"error": str(e)})
         return None
 
 def get_recordings_from_db() -> List[Dict]:
-    """Get all recordings from Supabase"""
+    """Get the metadata of all recordings from Supabase, without payloads"""
     try:
-        result = supabase.table('recordings').select('*').execute()
+        result = get_supabase().table('recordings').select(RECORDING_METADATA_COLUMNS).execute()
         return result.data
     except Exception as e:
-        print(f"Error getting recordings: {e}")
+        logger.error("Error getting recordings", extra={"error": str(e)})
         return []
 
-def get_recording_by_id(recording_id: str) -> Dict:
-    """Get a specific recording by ID"""
+def get_recording_by_id(recording_id: str, include_payload: bool = True) -> Dict:
+    """Get a specific recording by ID; chunked payloads are only fetched and decompressed if asked for"""
     try:
-        result = supabase.table('recordings').select('*').eq('id', recording_id).execute()
-        return result.data[0] if result.data else None
+        columns = '*' if include_payload else RECORDING_METADATA_COLUMNS
+        result = get_supabase().table('recordings').select(columns).eq('id', recording_id).execute()
+        if not result.data:
+            return None
+        return attach_recording_payloads(result.data)[0] if include_payload else result.data[0]
     except Exception as e:
-        print(f"Error getting recording: {e}")
+        logger.error("Error getting recording", extra={"recording_id": recording_id, "error": str(e)})
         return None
 
 def update_recording(recording_id: str, updates: Dict):
-    """Update a recording in Supabase"""
+    """Update a recording in Supabase; a new payload is stored as chunks in chunked mode"""
     try:
-        result = supabase.table('recordings').update(updates).eq('id', recording_id).execute()
+        if RECORDING_STORAGE == 'chunked' and updates.get('data') is not None:
+            updates = {**updates, **_store_payload(updates['data'])}
+        result = get_supabase().table('recordings').update(updates).eq('id', recording_id).execute()
         return result
     except Exception as e:
-        print(f"Error updating recording: {e}")
+        logger.error("Error updating recording", extra={"recording_id": recording_id, "error": str(e)})
         return None
 
 def delete_recording(recording_id: str):
     """Delete a recording from Supabase"""
     try:
-        result = supabase.table('recordings').delete().eq('id', recording_id).execute()
+        result = get_supabase().table('recordings').delete().eq('id', recording_id).execute()
         return result
     except Exception as e:
-        print(f"Error deleting recording: {e}")
+        logger.error("Error deleting recording", extra={"recording_id": recording_id, "error": str(e)})
         return None
 
 def get_all_recordings():
-    """Get all recordings from Supabase"""
+    """Get the metadata of all recordings from Supabase, without payloads"""
     try:
-        result = supabase.table('recordings').select('*').execute()
+        result = get_supabase().table('recordings').select(RECORDING_METADATA_COLUMNS).execute()
         return result
     except Exception as e:
-        print(f"Error getting recordings: {e}")
+        logger.error("Error getting recordings", extra={"error": str(e)})
         return None
 
-def save_processed_session(session_data: Dict):
-    """Saves the analyzed session data to the 'posthog' table using an upsert."""
-    try:
+def list_recordings(limit: int = 100, after_id: str | None = None, columns: str = RECORDING_METADATA_COLUMNS) -> List[Dict]:
+    """
+    One keyset page of the recordings table in id order: up to `limit` rows with
+    an id greater than `after_id`, metadata only unless other columns are asked
+    for. Supabase errors propagate.
+    """
+    query = get_supabase().table('recordings').select(columns)
+    if after_id is not None:
+        query = query.gt('id', after_id)
+    with _supabase_call("select"):
+        return query.order('id').limit(limit).execute().data
 
-        error_tags = [error['message'] for error in session_data.get('errors', [])]
-
-        data_to_insert = {
-            'video_link': session_data.get('embed_url'),
-            'session_id': session_data.get('session_id'),
-            'error_tags': error_tags,
-            'title': session_data.get('title'),
-            'description': session_data.get('description'),
-            'start_time': session_data.get('start_time'),
-            'end_time': session_data.get('end_time')
-        }
+def _processed_session(session_data: ProcessedSession | Dict) -> ProcessedSession:
+    """Coerce an analyzed session in the API shape into a record with fingerprinted errors"""
+    if isinstance(session_data, ProcessedSession):
+        return session_data
+    session = ProcessedSession.from_dict(session_data)
+    for error in session.errors:
+        if error.fingerprint is None:
+            error.fingerprint = fingerprint_error(error.message)
+    return session
 
+def _index_sessions(sessions: List[ProcessedSession]):
+    """Add stored sessions to the cross-session error index; a failure there never fails the write"""
+    try:
+        error_index.record(sessions)
+    except Exception as e:
+        logger.warning("Failed to update error index", extra={"sessions": len(sessions), "error": str(e)})
 
-        data_to_insert = {k: v for k, v in data_to_insert.items() if v is not None}
-        
+def save_processed_session(session_data: ProcessedSession | Dict):
+    """Saves the analyzed session data to the 'posthog' table using an upsert."""
+    session = _processed_session(session_data)
+    session_id = session.session_id
+    try:
+        data_to_insert = session.to_row()
 
-        result = supabase.table('posthog').upsert(
-            data_to_insert, 
-            on_conflict='session_id'
-        ).execute()
+        with _supabase_call("upsert"):
+            result = get_supabase().table('posthog').upsert(
+                data_to_insert, 
+                on_conflict='session_id'
+            ).execute()
         
         if result.data:
-            print(f"Successfully upserted session {session_data.get('session_id')} to Supabase.")
+            logger.debug("Upserted session", extra={"session_id": session_id})
+            _index_sessions([session])
         else:
-             print(f"Upsert call for session {session_data.get('session_id')} returned no data, which may indicate an issue.")
+            logger.warning("Upsert returned no data", extra={"session_id": session_id})
         
         return result
     except Exception as e:
-        print(f"--- FAILED to upsert session {session_data.get('session_id')} ---")
-        print(f"REASON: {e}")
-        print("----------------------------------------------------")
+        logger.error("Failed to upsert session", extra={"session_id": session_id, "error": str(e)})
         return None
 
+def save_processed_sessions(sessions: List[ProcessedSession | Dict]) -> int:
+    """
+    Upsert many analyzed sessions into the posthog table and return how many were
+    written. Rows are sent as one multi-row upsert per distinct set of columns,
+    so a row without e.g. a video_link does not null out the stored one. If a
+    batch is rejected its rows are retried one at a time. Written sessions are
+    added to the error index.
+    """
+    # A single upsert cannot touch the same session twice, keep the latest one
+    latest = {}
+    for session_data in sessions:
+        session = _processed_session(session_data)
+        if session.session_id:
+            latest[session.session_id] = session
+
+    batches = {}
+    for session in latest.values():
+        row = session.to_row()
+        batches.setdefault(tuple(sorted(row)), []).append(row)
+
+    written = set()
+    for batch in batches.values():
+        try:
+            with _supabase_call("upsert"):
+                get_supabase().table('posthog').upsert(batch, on_conflict='session_id').execute()
+            written.update(row['session_id'] for row in batch)
+            continue
+        except Exception as e:
+            logger.warning("Batch upsert failed, retrying individually", extra={"rows": len(batch), "error": str(e)})
+
+        for row in batch:
+            try:
+                with _supabase_call("upsert"):
+                    get_supabase().table('posthog').upsert(row, on_conflict='session_id').execute()
+                written.add(row['session_id'])
+            except Exception as e:
+                logger.error("Failed to upsert session", extra={"session_id": row.get('session_id'), "error": str(e)})
+
+    if written:
+        _index_sessions([session for session_id, session in latest.items() if session_id in written])
+    return len(written)
+
+class SessionWriter:
+    """
+    Write-behind buffer for processed sessions. Sessions are collected and upserted
+    to the posthog table together once `batch_size` rows are pending, once
+    `flush_interval` seconds have passed since the first pending row, or when the
+    writer is closed. Use as an async context manager to flush on exit.
+    """
+
+    def __init__(self, batch_size: int | None = None, flush_interval: float | None = None):
+        self.batch_size = batch_size or SESSION_WRITE_BATCH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else SESSION_WRITE_FLUSH_INTERVAL
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.flush_counts: List[int] = []
+        self._pending: List[ProcessedSession] = []
+        self._lock = asyncio.Lock()
+        self._timer: asyncio.Task | None = None
+
+    async def add(self, session_data: ProcessedSession | Dict):
+        """Queue an analyzed session for the next flush"""
+        self._pending.append(_processed_session(session_data))
+        if len(self._pending) >= self.batch_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self) -> int:
+        """Write all pending rows and return how many were written"""
+        async with self._lock:
+            rows, self._pending = self._pending, []
+            if self._timer is not None and self._timer is not asyncio.current_task():
+                self._timer.cancel()
+                self._timer = None
+            if not rows:
+                return 0
+            with span("upsert"):
+                written = await asyncio.to_thread(save_processed_sessions, rows)
+
+        self.rows_written += written
+        self.rows_failed += len(rows) - written
+        self.flush_counts.append(written)
+        logger.info("Flushed processed sessions", extra={"written": written, "rows": len(rows)})
+        return written
+
+    async def close(self) -> int:
+        """Flush anything still pending and stop the flush timer"""
+        return await self.flush()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
 def get_session_by_id(session_id: str) -> Dict:
     """Get a specific session by session_id from the posthog table"""
     try:
-        result = supabase.table('posthog').select('*').eq('session_id', session_id).execute()
+        result = get_supabase().table('posthog').select('*').eq('session_id', session_id).execute()
         return result.data[0] if result.data else None
     except Exception as e:
-        print(f"Error getting session {session_id}: {e}")
+        logger.error("Error getting session", extra={"session_id": session_id, "error": str(e)})
         return None
 
 def session_exists(session_id: str) -> bool:
     """Check if a session already exists in the database"""
     try:
-        result = supabase.table('posthog').select('session_id').eq('session_id', session_id).execute()
+        result = get_supabase().table('posthog').select('session_id').eq('session_id', session_id).execute()
         return len(result.data) > 0
     except Exception as e:
-        print(f"Error checking if session {session_id} exists: {e}")
-        return False 
\ No newline at end of file
+        logger.error("Error checking if session exists", extra={"session_id": session_id, "error": str(e)})
+        return False 
+
+def get_sessions_by_ids(session_ids: List[str], columns: str = SESSION_LOOKUP_COLUMNS) -> Dict[str, Dict]:
+    """
+    Get existing sessions for many session_ids from the posthog table, returned as
+    a dict keyed by session_id. Ids are looked up with one in_() query per chunk
+    and only the requested columns are fetched. Ids missing from the result do not
+    exist (or could not be read) and should be treated as new.
+    """
+    if 'session_id' not in columns.split(','):
+        columns = f'session_id,{columns}'
+
+    unique_ids = list(dict.fromkeys(session_id for session_id in session_ids if session_id))
+    sessions = {}
+    for start in range(0, len(unique_ids), SESSION_LOOKUP_CHUNK_SIZE):
+        chunk = unique_ids[start:start + SESSION_LOOKUP_CHUNK_SIZE]
+        try:
+            with _supabase_call("select"):
+                result = get_supabase().table('posthog').select(columns).in_('session_id', chunk).execute()
+        except Exception as e:
+            logger.error("Error getting sessions", extra={"sessions": len(chunk), "error": str(e)})
+            continue
+        for row in result.data:
+            sessions[row['session_id']] = row
+    return sessions
+
+def existing_session_ids(session_ids: List[str]) -> set:
+    """Return the subset of session_ids that already exist in the posthog table"""
+    return set(get_sessions_by_ids(session_ids, columns='session_id'))
+
+def encode_session_cursor(start_time: str | None, session_id: str, ascending: bool = False) -> str:
+    """Opaque cursor for the position after the (start_time, session_id) row"""
+    position = json.dumps([start_time, session_id, 'asc' if ascending else 'desc'], separators=(',', ':'))
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+def decode_session_cursor(cursor: str, ascending: bool = False) -> tuple:
+    """Return (start_time, session_id) from a cursor, raising ValueError if it is invalid; start_time may be None"""
+    try:
+        start_time, session_id, direction = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if direction != ('asc' if ascending else 'desc') or not isinstance(start_time, (str, type(None))) or not isinstance(session_id, str):
+        raise ValueError("Cursor does not belong to this listing order")
+    return start_time, session_id
+
+def _quote(value: str) -> str:
+    """Quote a value for a PostgREST or=() filter, which splits on commas and parentheses"""
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def list_processed_sessions(
+    columns: List[str] | None = None,
+    limit: int = 100,
+    cursor: str | None = None,
+    start_time_from: str | None = None,
+    start_time_to: str | None = None,
+    error_tag: str | None = None,
+    ascending: bool = False
+) -> Dict:
+    """
+    List analyzed sessions from the posthog table with keyset pagination on
+    (start_time, session_id), newest first unless `ascending`. Only `columns` are
+    fetched (start_time and session_id are always included), filters run in
+    Postgres, and each page is one indexed range scan of limit + 1 rows however
+    deep the cursor is, given an index on (start_time, session_id). Sessions
+    without a start_time come after all others in either order, by session_id,
+    unless a date filter excludes them. Returns {"rows": [...], "next_cursor": str | None}.
+    Raises ValueError for unknown columns or a bad cursor; Supabase errors propagate.
+    """
+    columns = list(dict.fromkeys(['session_id', 'start_time', *(columns or SESSION_COLUMNS)]))
+    unknown = [column for column in columns if column not in SESSION_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    limit = max(1, min(limit, SESSION_PAGE_MAX_SIZE))
+
+    query = get_supabase().table('posthog').select(','.join(columns))
+    if start_time_from:
+        query = query.gte('start_time', start_time_from)
+    if start_time_to:
+        query = query.lt('start_time', start_time_to)
+    if error_tag:
+        query = query.contains('error_tags', [error_tag])
+    if cursor:
+        start_time, session_id = decode_session_cursor(cursor, ascending)
+        operator = 'gt' if ascending else 'lt'
+        if start_time is None:
+            # Already in the trailing run of sessions without a start_time
+            query = query.is_('start_time', 'null').filter('session_id', operator, session_id)
+        else:
+            query = query.or_(
+                f"start_time.{operator}.{_quote(start_time)},"
+                f"and(start_time.eq.{_quote(start_time)},session_id.{operator}.{_quote(session_id)}),"
+                "start_time.is.null"
+            )
+    query = (
+        query.order('start_time', desc=not ascending, nullsfirst=False)
+        .order('session_id', desc=not ascending)
+        .limit(limit + 1)
+    )
+
+    with _supabase_call("select"):
+        rows = query.execute().data
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_session_cursor(rows[-1]['start_time'], rows[-1]['session_id'], ascending)
+    return {"rows": rows, "next_cursor": next_cursor}
+
+def backfill_error_index(page_size: int = SESSION_PAGE_MAX_SIZE, stop: threading.Event | None = None) -> int:
+    """
+    Record every session stored in the posthog table in the error index, oldest
+    first, one keyset page at a time. The table keeps one tag per error and no
+    counts, so each error counts once per session. The cursor is saved with
+    each page: setting `stop` ends the backfill between pages, and the next
+    call resumes where it stopped. Returns how many sessions were recorded;
+    Supabase errors propagate.
+    """
+    state = error_index.backfill_state()
+    if state["done"]:
+        return 0
+    recorded = 0
+    cursor = state["cursor"]
+    while stop is None or not stop.is_set():
+        page = list_processed_sessions(
+            columns=['error_tags', 'start_time', 'end_time'],
+            limit=page_size,
+            cursor=cursor,
+            ascending=True
+        )
+        sessions = [
+            ProcessedSession(
+                session_id=row['session_id'],
+                errors=[ErrorCount(fingerprint_error(tag), tag) for tag in row.get('error_tags') or []],
+                start_time=row.get('start_time'),
+                end_time=row.get('end_time')
+            )
+            for row in page["rows"]
+        ]
+        cursor = page["next_cursor"]
+        error_index.record_backfill_page(sessions, cursor)
+        recorded += len(sessions)
+        if cursor is None:
+            break
+    return recorded
+
+def resume_error_index_backfill(stop: threading.Event | None = None) -> int:
+    """Run or resume the error index backfill until it finishes or `stop` is set, logging the outcome"""
+    try:
+        recorded = backfill_error_index(stop=stop)
+    except Exception as e:
+        logger.warning("Error index backfill failed", extra={"error": str(e)})
+        return 0
+    if error_index.backfill_state()["done"]:
+        logger.info("Error index backfilled", extra={"sessions": recorded})
+    else:
+        logger.info("Error index backfill stopped, it resumes at the next startup", extra={"sessions": recorded})
+    return recorded
+
+def get_checkpoint(name: str) -> Dict | None:
+    """
+    Get a pipeline checkpoint from the 'pipeline_checkpoints' table
+    (name text primary key, state jsonb, updated_at timestamptz), or None if
+    there is none yet. Supabase errors propagate, so a failed read is never
+    mistaken for a first run.
+    """
+    with _supabase_call("select"):
+        result = get_supabase().table('pipeline_checkpoints').select('state').eq('name', name).execute()
+    return result.data[0]['state'] if result.data else None
+
+def save_checkpoint(name: str, state: Dict):
+    """Save a pipeline checkpoint to the 'pipeline_checkpoints' table"""
+    try:
+        result = get_supabase().table('pipeline_checkpoints').upsert({
+            'name': name,
+            'state': state,
+            'updated_at': datetime.now(timezone.utc).isoformat()
+        }, on_conflict='name').execute()
+        return result
+    except Exception as e:
+        logger.error("Error saving checkpoint", extra={"checkpoint": name, "error": str(e)})
+        return None
@@ -0,0 +1,279 @@
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List
+from dotenv import load_dotenv
+from .records import ProcessedSession
+
+load_dotenv(override=True)
+
+logger = logging.getLogger(__name__)
+
+# Local SQLite file for the cross-session error index, an empty string keeps it in memory.
+# The file is per host: each instance only indexes the sessions it stores itself
+ERROR_INDEX_PATH = os.getenv('ERROR_INDEX_PATH', '.cache/error_index.sqlite3')
+# Fill the index from the posthog table in the background at startup, resuming
+# where an interrupted backfill stopped; opt-in since it reads every stored session
+ERROR_INDEX_BACKFILL = os.getenv('ERROR_INDEX_BACKFILL', 'false').lower() in ('1', 'true', 'yes')
+# Width of the trend buckets the index keeps; coarser trends are summed from them
+ERROR_INDEX_BUCKET_SECONDS = 3600
+
+BUCKET_SECONDS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+
+_SCHEMA = (
+    # One row per error fingerprint with its running totals
+    "CREATE TABLE IF NOT EXISTS errors ("
+    "fingerprint TEXT PRIMARY KEY, message TEXT NOT NULL, "
+    "first_seen REAL NOT NULL, last_seen REAL NOT NULL, "
+    "sessions INTEGER NOT NULL, occurrences INTEGER NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS errors_sessions ON errors (sessions DESC, occurrences DESC)",
+    # Which sessions each error appeared in, and how often
+    "CREATE TABLE IF NOT EXISTS error_sessions ("
+    "fingerprint TEXT NOT NULL, session_id TEXT NOT NULL, "
+    "occurrences INTEGER NOT NULL, seen_at REAL NOT NULL, "
+    "PRIMARY KEY (fingerprint, session_id))",
+    "CREATE INDEX IF NOT EXISTS error_sessions_session ON error_sessions (session_id)",
+    "CREATE INDEX IF NOT EXISTS error_sessions_seen ON error_sessions (fingerprint, seen_at DESC)",
+    # Sessions and occurrences per error and hourly bucket of session start time
+    "CREATE TABLE IF NOT EXISTS error_buckets ("
+    "fingerprint TEXT NOT NULL, bucket INTEGER NOT NULL, "
+    "sessions INTEGER NOT NULL, occurrences INTEGER NOT NULL, "
+    "PRIMARY KEY (fingerprint, bucket))",
+    "CREATE INDEX IF NOT EXISTS error_buckets_bucket ON error_buckets (bucket)",
+    # Progress of the backfill from the posthog table, a single row
+    "CREATE TABLE IF NOT EXISTS backfill ("
+    "id INTEGER PRIMARY KEY CHECK (id = 1), cursor TEXT, done INTEGER NOT NULL)",
+)
+
+def _timestamp(value: str | datetime | None) -> float | None:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def _isoformat(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+class ErrorIndex:
+    """
+    Cross-session index of errors by fingerprint, kept in a local SQLite file.
+    Every stored session adds its errors: the sessions each error appeared in,
+    first/last seen times, session and occurrence totals, and hourly buckets
+    for trends. Re-recording a session replaces what it contributed before, so
+    reprocessing an ongoing session does not count it twice. Times are the
+    session's start time. Reads only touch these precomputed tables.
+
+    The index is local to each host and only sees the sessions that host
+    stores; with several instances, each answers for its own share. The posthog
+    table stays the source of truth: with ERROR_INDEX_BACKFILL the index is
+    filled from it, see database.backfill_error_index.
+    """
+
+    def __init__(self, path: str = ERROR_INDEX_PATH):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self.sessions_recorded = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            path = self.path or ":memory:"
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+        return self._conn
+
+    def record(self, sessions: Iterable[ProcessedSession]):
+        """Add or replace the errors of stored sessions, in one transaction"""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                for session in sessions:
+                    self._remove_session(conn, session.session_id)
+                    self._add_session(conn, session)
+                    self.sessions_recorded += 1
+
+    def backfill_state(self) -> Dict:
+        """Where the backfill from the posthog table got to: its next cursor and whether it finished"""
+        with self._lock:
+            row = self._connection().execute("SELECT cursor, done FROM backfill WHERE id = 1").fetchone()
+        return {"cursor": row[0], "done": bool(row[1])} if row else {"cursor": None, "done": False}
+
+    def record_backfill_page(self, sessions: Iterable[ProcessedSession], next_cursor: str | None):
+        """Record one backfilled page and the cursor after it in one transaction, so a stopped backfill resumes there"""
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                for session in sessions:
+                    self._remove_session(conn, session.session_id)
+                    self._add_session(conn, session)
+                    self.sessions_recorded += 1
+                conn.execute(
+                    "INSERT INTO backfill (id, cursor, done) VALUES (1, ?, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET cursor = excluded.cursor, done = excluded.done",
+                    (next_cursor, next_cursor is None)
+                )
+
+    def _remove_session(self, conn: sqlite3.Connection, session_id: str):
+        previous = conn.execute(
+            "SELECT fingerprint, occurrences, seen_at FROM error_sessions WHERE session_id = ?",
+            (session_id,)
+        ).fetchall()
+        for fingerprint, occurrences, seen_at in previous:
+            bucket = int(seen_at // ERROR_INDEX_BUCKET_SECONDS * ERROR_INDEX_BUCKET_SECONDS)
+            conn.execute(
+                "UPDATE errors SET sessions = sessions - 1, occurrences = occurrences - ? WHERE fingerprint = ?",
+                (occurrences, fingerprint)
+            )
+            conn.execute(
+                "UPDATE error_buckets SET sessions = sessions - 1, occurrences = occurrences - ? "
+                "WHERE fingerprint = ? AND bucket = ?",
+                (occurrences, fingerprint, bucket)
+            )
+        if previous:
+            conn.execute("DELETE FROM error_sessions WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM error_buckets WHERE sessions <= 0")
+            # An error no remaining session has is dropped, not kept at zero
+            conn.execute("DELETE FROM errors WHERE sessions <= 0")
+
+    def _add_session(self, conn: sqlite3.Connection, session: ProcessedSession):
+        seen_at = _timestamp(session.start_time) or _timestamp(session.end_time) or datetime.now(timezone.utc).timestamp()
+        bucket = int(seen_at // ERROR_INDEX_BUCKET_SECONDS * ERROR_INDEX_BUCKET_SECONDS)
+
+        # A session can list one fingerprint once per message variant, count it once
+        occurrences_by_fingerprint: Dict[str, int] = {}
+        messages: Dict[str, str] = {}
+        for error in session.errors:
+            if not error.fingerprint:
+                continue
+            occurrences_by_fingerprint[error.fingerprint] = occurrences_by_fingerprint.get(error.fingerprint, 0) + error.count
+            messages.setdefault(error.fingerprint, error.message)
+
+        for fingerprint, occurrences in occurrences_by_fingerprint.items():
+            conn.execute(
+                "INSERT INTO error_sessions (fingerprint, session_id, occurrences, seen_at) VALUES (?, ?, ?, ?)",
+                (fingerprint, session.session_id, occurrences, seen_at)
+            )
+            conn.execute(
+                "INSERT INTO errors (fingerprint, message, first_seen, last_seen, sessions, occurrences) "
+                "VALUES (?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT (fingerprint) DO UPDATE SET "
+                "first_seen = MIN(first_seen, excluded.first_seen), "
+                "last_seen = MAX(last_seen, excluded.last_seen), "
+                "sessions = sessions + 1, occurrences = occurrences + excluded.occurrences",
+                (fingerprint, messages[fingerprint], seen_at, seen_at, occurrences)
+            )
+            conn.execute(
+                "INSERT INTO error_buckets (fingerprint, bucket, sessions, occurrences) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT (fingerprint, bucket) DO UPDATE SET "
+                "sessions = sessions + 1, occurrences = occurrences + excluded.occurrences",
+                (fingerprint, bucket, occurrences)
+            )
+
+    def top(self, limit: int = 10, since: str | None = None, until: str | None = None) -> List[Dict]:
+        """Errors that appeared in the most sessions, overall or in a time range"""
+        since_ts, until_ts = _timestamp(since), _timestamp(until)
+        with self._lock:
+            conn = self._connection()
+            if since_ts is None and until_ts is None:
+                rows = conn.execute(
+                    "SELECT fingerprint, message, first_seen, last_seen, sessions, occurrences FROM errors "
+                    "ORDER BY sessions DESC, occurrences DESC LIMIT ?",
+                    (limit,)
+                ).fetchall()
+            else:
+                rows = conn.execute(
+                    "SELECT e.fingerprint, e.message, e.first_seen, e.last_seen, "
+                    "SUM(b.sessions) AS range_sessions, SUM(b.occurrences) AS range_occurrences "
+                    "FROM error_buckets b JOIN errors e ON e.fingerprint = b.fingerprint "
+                    "WHERE b.bucket >= ? AND b.bucket < ? "
+                    "GROUP BY b.fingerprint ORDER BY range_sessions DESC, range_occurrences DESC LIMIT ?",
+                    (
+                        (since_ts // ERROR_INDEX_BUCKET_SECONDS) * ERROR_INDEX_BUCKET_SECONDS if since_ts is not None else float("-inf"),
+                        until_ts if until_ts is not None else float("inf"),
+                        limit
+                    )
+                ).fetchall()
+        return [self._error(row) for row in rows]
+
+    def get(self, fingerprint: str) -> Dict | None:
+        """Totals for one error, or None if it was never seen"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT fingerprint, message, first_seen, last_seen, sessions, occurrences FROM errors "
+                "WHERE fingerprint = ?",
+                (fingerprint,)
+            ).fetchone()
+        return self._error(row) if row else None
+
+    def sessions(self, fingerprint: str, limit: int = 100, offset: int = 0) -> List[Dict]:
+        """Sessions an error appeared in, newest first"""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT session_id, occurrences, seen_at FROM error_sessions "
+                "WHERE fingerprint = ? ORDER BY seen_at DESC, session_id LIMIT ? OFFSET ?",
+                (fingerprint, limit, offset)
+            ).fetchall()
+        return [
+            {"session_id": session_id, "occurrences": occurrences, "seen_at": _isoformat(seen_at)}
+            for session_id, occurrences, seen_at in rows
+        ]
+
+    def trend(self, fingerprint: str, bucket: str = "day", since: str | None = None, until: str | None = None) -> List[Dict]:
+        """Sessions and occurrences of an error per hour, day or week, oldest first"""
+        width = BUCKET_SECONDS[bucket]
+        since_ts, until_ts = _timestamp(since), _timestamp(until)
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT (bucket / ?) * ? AS period, SUM(sessions), SUM(occurrences) FROM error_buckets "
+                "WHERE fingerprint = ? AND bucket >= ? AND bucket < ? "
+                "GROUP BY period ORDER BY period",
+                (
+                    width, width, fingerprint,
+                    since_ts if since_ts is not None else float("-inf"),
+                    until_ts if until_ts is not None else float("inf")
+                )
+            ).fetchall()
+        return [
+            {"bucket": _isoformat(period), "sessions": sessions, "occurrences": occurrences}
+            for period, sessions, occurrences in rows
+        ]
+
+    @staticmethod
+    def _error(row) -> Dict:
+        fingerprint, message, first_seen, last_seen, sessions, occurrences = row
+        return {
+            "fingerprint": fingerprint,
+            "message": message,
+            "first_seen": _isoformat(first_seen),
+            "last_seen": _isoformat(last_seen),
+            "sessions": sessions,
+            "occurrences": occurrences
+        }
+
+    def stats(self) -> Dict:
+        """Size of the index and how many sessions were recorded by this process"""
+        with self._lock:
+            conn = self._connection()
+            errors, sessions = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(sessions), 0) FROM errors"
+            ).fetchone()
+        return {
+            "errors": errors,
+            "session_links": sessions,
+            "sessions_recorded": self.sessions_recorded,
+            "persistent": self.path or None
+        }
+
+error_index = ErrorIndex()
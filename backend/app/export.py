@@ -0,0 +1,291 @@
+import asyncio
+import base64
+import gzip
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Tuple
+from dotenv import load_dotenv
+from . import database
+from .metrics import EXPORT_ROWS
+
+load_dotenv(override=True)
+
+logger = logging.getLogger(__name__)
+
+# Rows read from Supabase per range query
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '500'))
+# Recordings carry their full payloads, a few MB each, so far fewer per query
+EXPORT_RECORDINGS_CHUNK_SIZE = int(os.getenv('EXPORT_RECORDINGS_CHUNK_SIZE', '20'))
+# Directory file exports are written to
+EXPORT_DIR = os.getenv('EXPORT_DIR', 'exports')
+# Finished file exports kept in memory for polling
+EXPORT_HISTORY_SIZE = int(os.getenv('EXPORT_HISTORY_SIZE', '50'))
+
+EXPORT_TABLES = ("sessions", "recordings")
+EXPORT_FORMATS = ("ndjson", "ndjson.gz")
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _encode_recording_cursor(recording_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([recording_id]).encode()).decode().rstrip('=')
+
+def _decode_recording_cursor(cursor: str) -> str:
+    try:
+        (recording_id,) = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return recording_id
+
+def _fetch_chunk(table: str, cursor: str | None, limit: int, date_from: str | None, date_to: str | None) -> Tuple[List[Dict], str | None]:
+    """Read the rows after `cursor` and return them with the cursor after the last one"""
+    if table == "sessions":
+        rows = database.list_processed_sessions(
+            limit=limit,
+            cursor=cursor,
+            start_time_from=date_from,
+            start_time_to=date_to,
+            ascending=True
+        )["rows"]
+        if rows:
+            cursor = database.encode_session_cursor(rows[-1]['start_time'], rows[-1]['session_id'], ascending=True)
+        return rows, cursor
+
+    if date_from or date_to:
+        raise ValueError("Recordings cannot be filtered by date")
+    rows = database.attach_recording_payloads(database.list_recordings(
+        limit=limit,
+        after_id=_decode_recording_cursor(cursor) if cursor else None,
+        columns='*'
+    ))
+    if rows:
+        cursor = _encode_recording_cursor(rows[-1]['id'])
+    return rows, cursor
+
+class ExportProgress:
+    """Rows, bytes and throughput of one export, and the cursor to resume it from"""
+
+    def __init__(self, cursor: str | None = None):
+        self.cursor = cursor
+        self.rows = 0
+        self.chunks = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+        self._started = time.perf_counter()
+
+    def start(self):
+        """Restart the clock for a resumed export, keeping the time already spent"""
+        self._started = time.perf_counter() - self.elapsed
+
+    def chunk_done(self, rows: int, cursor: str | None):
+        self.rows += rows
+        self.chunks += 1
+        self.cursor = cursor
+        self.elapsed = time.perf_counter() - self._started
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def snapshot(self) -> Dict:
+        return {
+            "rows": self.rows,
+            "chunks": self.chunks,
+            "bytes": self.bytes,
+            "seconds": round(self.elapsed, 3),
+            "rows_per_second": round(self.rows_per_second, 1),
+            "cursor": self.cursor
+        }
+
+async def iter_export_chunks(
+    table: str,
+    cursor: str | None = None,
+    chunk_size: int | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+) -> AsyncIterator[Tuple[List[Dict], str | None]]:
+    """
+    Yield (rows, cursor) for `table` one range-bounded chunk at a time, in key
+    order and starting after `cursor`. Each yielded cursor resumes the export
+    right after that chunk. Only one chunk is held in memory at a time;
+    recordings, which carry their payloads, are read at most
+    EXPORT_RECORDINGS_CHUNK_SIZE rows at a time. The export ends on the first
+    empty chunk, so a short page (the listing's own cap, or PostgREST's
+    max-rows) is never mistaken for the last one.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"table must be one of {', '.join(EXPORT_TABLES)}")
+    if table == "sessions":
+        chunk_size = min(chunk_size or EXPORT_CHUNK_SIZE, database.SESSION_PAGE_MAX_SIZE)
+    else:
+        chunk_size = min(chunk_size or EXPORT_RECORDINGS_CHUNK_SIZE, EXPORT_RECORDINGS_CHUNK_SIZE)
+    while True:
+        rows, cursor = await asyncio.to_thread(_fetch_chunk, table, cursor, chunk_size, date_from, date_to)
+        if not rows:
+            return
+        yield rows, cursor
+
+def _check_format(format: str):
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+
+def _encode(lines: List[Dict], format: str) -> bytes:
+    """
+    Encode one chunk as NDJSON. For "ndjson.gz" each chunk is a complete gzip
+    member; concatenated members are a valid gzip file, so a resumed export can
+    simply append.
+    """
+    data = "".join(json.dumps(line, default=str) + "\n" for line in lines).encode()
+    return gzip.compress(data, compresslevel=6, mtime=0) if format == "ndjson.gz" else data
+
+async def iter_export_bytes(
+    table: str,
+    format: str = "ndjson",
+    cursor: str | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    checkpoints: bool = False,
+    progress: ExportProgress | None = None,
+    chunk_size: int | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Stream `table` as NDJSON, gzip-compressed for the "ndjson.gz" format. With
+    `checkpoints`, every chunk is followed by a {"_checkpoint": {...}} line with
+    the rows so far, rows per second and the cursor to resume after it.
+    """
+    _check_format(format)
+    progress = progress or ExportProgress(cursor)
+    async for rows, cursor in iter_export_chunks(table, cursor, chunk_size, date_from, date_to):
+        progress.chunk_done(len(rows), cursor)
+        EXPORT_ROWS.inc(len(rows), table=table, format=format)
+        data = _encode(rows + [{"_checkpoint": progress.snapshot()}] if checkpoints else rows, format)
+        progress.bytes += len(data)
+        yield data
+    logger.info("Export streamed", extra={"table": table, "format": format, **progress.snapshot()})
+
+class FileExport:
+    """
+    One export of a table to a local file, run in the background. The cursor is
+    only advanced once a chunk is on disk, and a resumed export first cuts the
+    file back to the end of that chunk, so resuming never duplicates or loses rows.
+    """
+
+    def __init__(self, table: str, format: str, date_from: str | None = None, date_to: str | None = None, cursor: str | None = None):
+        self.id = uuid.uuid4().hex
+        self.table = table
+        self.format = format
+        self.date_from = date_from
+        self.date_to = date_to
+        self.path = os.path.join(EXPORT_DIR, f"{table}-{self.id}.{format}")
+        self.status = "queued"
+        self.error = None
+        self.created_at = _now()
+        self.finished_at = None
+        self.progress = ExportProgress(cursor)
+        self.task: asyncio.Task | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    async def run(self):
+        self.status = "running"
+        self.finished_at = None
+        self.error = None
+        progress = self.progress
+        progress.start()
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "ab") as f:
+                # Drop whatever a previous run wrote after its last complete chunk
+                f.truncate(progress.bytes)
+                async for rows, cursor in iter_export_chunks(
+                    self.table, progress.cursor, date_from=self.date_from, date_to=self.date_to
+                ):
+                    data = _encode(rows, self.format)
+                    await asyncio.to_thread(self._write, f, data)
+                    progress.bytes += len(data)
+                    progress.chunk_done(len(rows), cursor)
+                    EXPORT_ROWS.inc(len(rows), table=self.table, format=self.format)
+            self.status = "completed"
+            logger.info("Export written", extra={"export_id": self.id, "path": self.path, **progress.snapshot()})
+        except asyncio.CancelledError:
+            self.status = "cancelled"
+        except Exception as e:
+            self.status = "failed"
+            self.error = str(e)
+            logger.error("Export failed", extra={"export_id": self.id, "error": self.error})
+        finally:
+            self.finished_at = _now()
+
+    @staticmethod
+    def _write(f, data: bytes):
+        f.write(data)
+        f.flush()
+
+    def snapshot(self) -> Dict:
+        return {
+            "export_id": self.id,
+            "table": self.table,
+            "format": self.format,
+            "date_from": self.date_from,
+            "date_to": self.date_to,
+            "path": self.path,
+            "status": self.status,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "progress": self.progress.snapshot(),
+            "error": self.error
+        }
+
+class ExportManager:
+    """Starts, tracks, cancels and resumes file exports in this process"""
+
+    def __init__(self, history_size: int = EXPORT_HISTORY_SIZE):
+        self.history_size = history_size
+        self._exports: Dict[str, FileExport] = {}
+
+    def start(self, table: str, format: str = "ndjson", date_from: str | None = None, date_to: str | None = None, cursor: str | None = None) -> FileExport:
+        """Start writing `table` to a file under EXPORT_DIR and return the export immediately"""
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"table must be one of {', '.join(EXPORT_TABLES)}")
+        _check_format(format)
+        export = FileExport(table, format, date_from, date_to, cursor)
+        self._exports[export.id] = export
+        self._launch(export)
+        self._prune()
+        return export
+
+    def resume(self, export_id: str) -> FileExport | None:
+        """Continue a failed or cancelled export from its last written chunk"""
+        export = self._exports.get(export_id)
+        if export is not None and export.status in ("failed", "cancelled"):
+            self._launch(export)
+        return export
+
+    def _launch(self, export: FileExport):
+        export.status = "queued"
+        export.task = asyncio.create_task(export.run())
+
+    def get(self, export_id: str) -> FileExport | None:
+        return self._exports.get(export_id)
+
+    def list(self) -> List[FileExport]:
+        return list(self._exports.values())
+
+    def cancel(self, export_id: str) -> FileExport | None:
+        export = self._exports.get(export_id)
+        if export is not None and export.task is not None and not export.finished:
+            export.task.cancel()
+        return export
+
+    def _prune(self):
+        finished = [export for export in self._exports.values() if export.finished]
+        for export in finished[:max(0, len(finished) - self.history_size)]:
+            del self._exports[export.id]
+
+export_manager = ExportManager()
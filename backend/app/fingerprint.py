@@ -0,0 +1,132 @@
+import hashlib
+import os
+import re
+from typing import Dict, Iterable, List
+from dotenv import load_dotenv
+from .records import ErrorCount
+
+load_dotenv(override=True)
+
+# Include the top stack frame in fingerprints when a stacktrace is available
+FINGERPRINT_USE_STACKTRACE = os.getenv('FINGERPRINT_USE_STACKTRACE', 'false').lower() in ('1', 'true', 'yes')
+# Normalized messages are cut to this length before hashing
+FINGERPRINT_MAX_MESSAGE_LENGTH = int(os.getenv('FINGERPRINT_MAX_MESSAGE_LENGTH', '500'))
+# How many distinct raw messages to remember between calls
+FINGERPRINT_MEMO_SIZE = int(os.getenv('FINGERPRINT_MEMO_SIZE', '50000'))
+
+# Applied in order, each pattern replaces a volatile part of a message with a placeholder
+_NORMALIZERS = [
+    (re.compile(r'(?:https?|wss?|file|blob:https?)://[^\s\'"()<>]+'), '<url>'),
+    (re.compile(r'\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b', re.IGNORECASE), '<uuid>'),
+    (re.compile(r'\b(?=[0-9a-f]*\d)(?=[0-9a-f]*[a-f])[0-9a-f]{6,}\b', re.IGNORECASE), '<hex>'),
+    (re.compile(r':\d+:\d+\b'), ':<line>:<col>'),
+    (re.compile(r'\b(?:line|col|column)\s*\d+\b', re.IGNORECASE), '<pos>'),
+    # Only long digit runs (ids, timestamps); short codes such as HTTP 404 or
+    # React error #418 tell errors apart and are kept
+    (re.compile(r'\b\d{5,}\b'), '<n>'),
+    # Minified identifiers (one or two characters) that differ between builds,
+    # only where the message names them: "t is not a function", "reading 'e'"
+    (re.compile(r'(?<![\w$])[A-Za-z_$][\w$]?(?= is not (?:a function|defined)\b)'), '<sym>'),
+    (re.compile(r"\(reading '[A-Za-z_$][\w$]?'\)"), "(reading '<sym>')"),
+    (re.compile(r'\s+'), ' '),
+]
+
+_FILENAME_NOISE = re.compile(r'[?#].*$|\.[0-9a-f]{6,}(?=\.)', re.IGNORECASE)
+
+def normalize_message(message: str) -> str:
+    """Replace URLs, uuids, hex ids, line/column positions, long numbers and minified names with placeholders"""
+    normalized = str(message)
+    for pattern, replacement in _NORMALIZERS:
+        normalized = pattern.sub(replacement, normalized)
+    return normalized.strip()[:FINGERPRINT_MAX_MESSAGE_LENGTH]
+
+def _top_frame(stacktrace) -> str:
+    """Return 'file:function' for the innermost in-app frame of a PostHog stacktrace"""
+    if not isinstance(stacktrace, dict):
+        return ''
+    frames = stacktrace.get('frames')
+    if not isinstance(frames, list) or not frames:
+        return ''
+    in_app = [frame for frame in frames if isinstance(frame, dict) and frame.get('in_app')]
+    frame = (in_app or [f for f in frames if isinstance(f, dict)] or [{}])[-1]
+    filename = _FILENAME_NOISE.sub('', str(frame.get('filename') or frame.get('source') or ''))
+    return f"{filename.rsplit('/', 1)[-1]}:{frame.get('function') or frame.get('resolved_name') or ''}"
+
+class ErrorFingerprinter:
+    """
+    Maps raw error messages to stable fingerprints. Normalization results are
+    memoized per raw message, so running over thousands of events only does the
+    regex work once per distinct message.
+    """
+
+    def __init__(self, use_stacktrace: bool = FINGERPRINT_USE_STACKTRACE, memo_size: int = FINGERPRINT_MEMO_SIZE):
+        self.use_stacktrace = use_stacktrace
+        self.memo_size = memo_size
+        self._memo: Dict[str, tuple] = {}
+
+    def _normalized(self, message: str) -> tuple:
+        entry = self._memo.get(message)
+        if entry is None:
+            normalized = normalize_message(message)
+            entry = (normalized, hashlib.sha1(normalized.encode()).hexdigest()[:16])
+            if len(self._memo) >= self.memo_size:
+                self._memo.clear()
+            self._memo[message] = entry
+        return entry
+
+    def normalize(self, message: str) -> str:
+        """Return the normalized form of a message"""
+        return self._normalized(message)[0]
+
+    def fingerprint(self, message: str, stacktrace=None) -> str:
+        """Return a 16 character fingerprint for a message and optional stacktrace"""
+        normalized, digest = self._normalized(message)
+        if self.use_stacktrace:
+            frame = _top_frame(stacktrace)
+            if frame:
+                return hashlib.sha1(f"{normalized}|{frame}".encode()).hexdigest()[:16]
+        return digest
+
+    def fingerprint_many(self, messages: Iterable[str], stacktraces: Iterable | None = None) -> List[str]:
+        """Fingerprint many messages at once, with optional stacktraces in the same order"""
+        if stacktraces is None or not self.use_stacktrace:
+            return [self._normalized(message)[1] for message in messages]
+        return [self.fingerprint(message, stack) for message, stack in zip(messages, stacktraces)]
+
+    def group(self, messages: Iterable, stacktraces: Iterable | None = None) -> List[ErrorCount]:
+        """
+        Group raw messages by fingerprint. Returns ErrorCount records in
+        first-seen order, where message is the most frequent raw variant.
+        Empty messages are skipped.
+        """
+        messages = list(messages)
+        stacktraces = list(stacktraces) if stacktraces is not None else [None] * len(messages)
+
+        groups: Dict[str, ErrorCount] = {}
+        variants: Dict[str, Dict[str, int]] = {}
+        for message, stack in zip(messages, stacktraces):
+            if not message:
+                continue
+            fingerprint = self.fingerprint(message, stack)
+            group = groups.get(fingerprint)
+            if group is None:
+                groups[fingerprint] = ErrorCount(fingerprint, message)
+                variants[fingerprint] = {message: 1}
+                continue
+            group.count += 1
+            seen = variants[fingerprint]
+            seen[message] = seen.get(message, 0) + 1
+            if seen[message] > seen[group.message]:
+                group.message = message
+
+        return list(groups.values())
+
+fingerprinter = ErrorFingerprinter()
+
+def fingerprint_error(message: str, stacktrace=None) -> str:
+    """Fingerprint a single error message with the shared fingerprinter"""
+    return fingerprinter.fingerprint(message, stacktrace)
+
+def group_errors(messages: Iterable, stacktraces: Iterable | None = None) -> List[ErrorCount]:
+    """Group raw error messages into ErrorCount entries"""
+    return fingerprinter.group(messages, stacktraces)
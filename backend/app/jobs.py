@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List
+from dotenv import load_dotenv
+from . import posthog
+from .records import ProcessedSession
+
+load_dotenv(override=True)
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs kept in memory for polling before the oldest are dropped
+JOB_HISTORY_SIZE = int(os.getenv('JOB_HISTORY_SIZE', '100'))
+# Run the analysis pipeline every N seconds, 0 disables the scheduler
+PIPELINE_SCHEDULE_SECONDS = float(os.getenv('PIPELINE_SCHEDULE_SECONDS', '0'))
+PIPELINE_SCHEDULE_INCREMENTAL = os.getenv('PIPELINE_SCHEDULE_INCREMENTAL', 'true').lower() in ('1', 'true', 'yes')
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+class Job:
+    """
+    One background run of the session analysis pipeline. Also acts as the
+    pipeline's progress reporter, so counters and partial results update as
+    sessions finish.
+    """
+
+    def __init__(self, params: Dict, trigger: str = "api"):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.trigger = trigger
+        self.status = "queued"
+        self.error = None
+        self.created_at = _now()
+        self.started_at = None
+        self.finished_at = None
+        self.done = 0
+        self.skipped = 0
+        self.failed = 0
+        self.results: List[ProcessedSession] = []
+        self.task: asyncio.Task | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def session_done(self, result: ProcessedSession):
+        self.done += 1
+        self.results.append(result)
+
+    def session_skipped(self, session_id: str, result: ProcessedSession | None):
+        self.skipped += 1
+        if result is not None:
+            self.results.append(result)
+
+    def session_failed(self, session_id: str, error: Exception):
+        self.failed += 1
+        logger.warning("Session failed", extra={"job_id": self.id, "session_id": session_id, "error": str(error)})
+
+    def snapshot(self) -> Dict:
+        """Status and progress counters, without the results"""
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "trigger": self.trigger,
+            "params": self.params,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": {
+                "done": self.done,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "results_available": len(self.results)
+            },
+            "error": self.error
+        }
+
+class JobManager:
+    """Starts, tracks and cancels background pipeline jobs in this process"""
+
+    def __init__(self, history_size: int = JOB_HISTORY_SIZE):
+        self.history_size = history_size
+        self._jobs: Dict[str, Job] = {}
+
+    def submit(self, trigger: str = "api", **params) -> Job:
+        """Start a pipeline run in the background and return its job immediately"""
+        job = Job(params, trigger)
+        self._jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job))
+        job.task.add_done_callback(lambda task: self._settle(job, task))
+        self._prune()
+        return job
+
+    async def _run(self, job: Job):
+        job.status = "running"
+        job.started_at = _now()
+        try:
+            await posthog.analyze_recordings_for_errors(progress=job, **job.params)
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = getattr(e, 'detail', None) or str(e)
+            logger.error("Job failed", extra={"job_id": job.id, "error": job.error})
+        finally:
+            job.finished_at = _now()
+
+    def _settle(self, job: Job, task: asyncio.Task):
+        # A job cancelled before it started never reaches _run's handlers
+        if task.cancelled() and not job.finished:
+            job.status = "cancelled"
+            job.finished_at = _now()
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Job | None:
+        """
+        Cancel a job. Listing stops right away; sessions already in flight are
+        allowed to finish and are saved before the job reports cancelled.
+        """
+        job = self._jobs.get(job_id)
+        if job is not None and job.task is not None and not job.finished:
+            job.status = "cancelling"
+            job.task.cancel()
+        return job
+
+    def running(self, trigger: str | None = None) -> List[Job]:
+        return [
+            job for job in self._jobs.values()
+            if not job.finished and (trigger is None or job.trigger == trigger)
+        ]
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in finished[:max(0, len(finished) - self.history_size)]:
+            del self._jobs[job.id]
+
+job_manager = JobManager()
+
+async def run_scheduler(manager: JobManager = job_manager, interval: float = PIPELINE_SCHEDULE_SECONDS, **params):
+    """
+    Submit a pipeline job every `interval` seconds. A tick is skipped while the
+    previous scheduled job is still running, so scheduled runs never overlap.
+    """
+    params.setdefault('incremental', PIPELINE_SCHEDULE_INCREMENTAL)
+    while True:
+        if manager.running(trigger="schedule"):
+            logger.info("Previous scheduled analysis is still running, skipping this tick")
+        else:
+            job = manager.submit(trigger="schedule", **params)
+            logger.info("Scheduled analysis started", extra={"job_id": job.id})
+        await asyncio.sleep(interval)
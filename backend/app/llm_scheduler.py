@@ -0,0 +1,219 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict
+from dotenv import load_dotenv
+from .backoff import jittered_backoff, retry_after_seconds
+from .metrics import UPSTREAM_SECONDS, metrics, outcome_of
+
+load_dotenv(override=True)
+
+logger = logging.getLogger(__name__)
+
+# Gemini quota, 0 disables a limit
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv('GEMINI_REQUESTS_PER_MINUTE', '60'))
+GEMINI_TOKENS_PER_MINUTE = float(os.getenv('GEMINI_TOKENS_PER_MINUTE', '1000000'))
+# Requests in flight to Gemini across the whole process
+GEMINI_MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '8'))
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '5'))
+GEMINI_BACKOFF_BASE = float(os.getenv('GEMINI_BACKOFF_BASE', '1'))
+GEMINI_BACKOFF_MAX = float(os.getenv('GEMINI_BACKOFF_MAX', '60'))
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+class GeminiUnavailable(Exception):
+    """Gemini kept rate limiting or failing after every retry"""
+
+class TokenBucket:
+    """Refills `rate_per_minute` units per minute up to one minute's worth"""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = rate_per_minute
+        self.available = rate_per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available, 0 if they are now"""
+        if not self.rate:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.available) / self.rate)
+
+    def consume(self, amount: float):
+        if self.rate:
+            self._refill()
+            self.available -= min(amount, self.capacity)
+
+def _retry_after(error: Exception) -> float | None:
+    response = getattr(error, 'response', None)
+    return retry_after_seconds(getattr(response, 'headers', None))
+
+def _is_retryable(error: Exception) -> bool:
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying"""
+    import openai
+
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    status = getattr(error, 'status_code', None)
+    return isinstance(error, openai.APIStatusError) and status is not None and (status == 429 or status >= 500)
+
+def _is_rate_limit(error: Exception) -> bool:
+    return getattr(error, 'status_code', None) == 429
+
+class GeminiScheduler:
+    """
+    Admission control for every Gemini call in the process. A request is let
+    through when both the request and token buckets allow it and fewer than
+    `concurrency` calls are in flight; waiting requests are served by priority,
+    so interactive work overtakes batch work. Retryable failures are retried
+    with full-jitter exponential backoff, and a 429's Retry-After pauses all
+    dispatching until it has passed.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = GEMINI_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = GEMINI_TOKENS_PER_MINUTE,
+        concurrency: int = GEMINI_MAX_CONCURRENCY,
+        max_retries: int = GEMINI_MAX_RETRIES,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.in_flight = 0
+        self.completed = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.gave_up = 0
+        self._waiters: list = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup: asyncio.TimerHandle | None = None
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[Any]],
+        tokens: int = 1,
+        priority: int = PRIORITY_BATCH,
+    ) -> Any:
+        """
+        Run `call()` once admitted, retrying retryable errors. `tokens` is the
+        estimated prompt plus completion size. Raises GeminiUnavailable when
+        retries are exhausted; other errors propagate unchanged.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(tokens, priority)
+            started = time.perf_counter()
+            try:
+                result = await call()
+                self.completed += 1
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, upstream="gemini", endpoint="chat", outcome="2xx")
+                return result
+            except Exception as e:
+                UPSTREAM_SECONDS.observe(
+                    time.perf_counter() - started,
+                    upstream="gemini",
+                    endpoint="chat",
+                    outcome=outcome_of(getattr(e, 'status_code', None))
+                )
+                if not _is_retryable(e):
+                    raise
+                if attempt == self.max_retries:
+                    self.gave_up += 1
+                    raise GeminiUnavailable(f"Gemini call failed after {attempt + 1} attempts: {e}") from e
+                delay = self._backoff(attempt, e)
+            finally:
+                self._release()
+
+            self.retries += 1
+            logger.warning(
+                "Gemini call failed, retrying",
+                extra={"attempt": attempt + 1, "retry_in": round(delay, 2)}
+            )
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = jittered_backoff(attempt, GEMINI_BACKOFF_BASE, GEMINI_BACKOFF_MAX, _retry_after(error))
+        if _is_rate_limit(error):
+            self.rate_limited += 1
+            # Everyone else would hit the same limit, hold all dispatching
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+    async def _acquire(self, tokens: int, priority: int):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), tokens, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just as we were cancelled, give the slot back
+                self._release()
+            raise
+
+    def _release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+
+        while self._waiters and self.in_flight < self.concurrency:
+            priority, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+
+            wait = max(
+                self._paused_until - time.monotonic(),
+                self.requests.wait_time(1),
+                self.tokens.wait_time(tokens)
+            )
+            if wait > 0:
+                self._wakeup = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+
+            heapq.heappop(self._waiters)
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            self.in_flight += 1
+            future.set_result(None)
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": sum(1 for waiter in self._waiters if not waiter[3].done()),
+            "completed": self.completed,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "gave_up": self.gave_up,
+            "paused_for": max(0.0, self._paused_until - time.monotonic())
+        }
+
+gemini_scheduler = GeminiScheduler()
+
+metrics.gauge(
+    "loopy_gemini_scheduler",
+    "Gemini scheduler state: calls in flight and waiting, and the remaining pause",
+    ["state"],
+    lambda: {
+        (state,): gemini_scheduler.stats()[state]
+        for state in ("in_flight", "waiting", "paused_for")
+    }
+)
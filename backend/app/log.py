@@ -0,0 +1,52 @@
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# 'text' for key=value lines, 'json' for one JSON object per line
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+class StructuredFormatter(logging.Formatter):
+    """Formats records with their `extra=` fields, as key=value text or as JSON"""
+
+    def __init__(self, json_output: bool = False):
+        super().__init__()
+        self.json_output = json_output
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+        timestamp = datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds")
+        if self.json_output:
+            payload = {
+                "time": timestamp,
+                "level": record.levelname,
+                "logger": record.name,
+                "message": record.getMessage(),
+                **fields
+            }
+            if record.exc_info:
+                payload["exception"] = self.formatException(record.exc_info)
+            return json.dumps(payload, default=str)
+
+        line = f"{timestamp} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+def configure_logging(level: str = LOG_LEVEL, format: str = LOG_FORMAT):
+    """Send the app's loggers to stderr at `level` with the structured formatter"""
+    handler = logging.StreamHandler()
+    handler.setFormatter(StructuredFormatter(json_output=format == 'json'))
+    logger = logging.getLogger("app")
+    logger.handlers = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
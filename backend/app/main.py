@@ -1,15 +1,70 @@
-from fastapi import FastAPI, HTTPException, Query
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from agents import Agent, Runner, trace 
-from . import posthog
+from . import database, posthog
+from .analysis_cache import analysis_cache
+from .clients import registry
+from .error_index import error_index, BUCKET_SECONDS, ERROR_INDEX_BACKFILL
+from .export import export_manager, iter_export_bytes, EXPORT_FORMATS, EXPORT_TABLES
+from .jobs import job_manager, run_scheduler, PIPELINE_SCHEDULE_SECONDS
+from .llm_scheduler import gemini_scheduler, PRIORITY_INTERACTIVE
+from .log import configure_logging
+from .metrics import metrics
+from .posthog_limiter import posthog_limiter
+from .records import ErrorEventBatch
+from .response_cache import response_cache
+from .webhooks import (
+    webhook_ingestor, parse_events, verify_signature,
+    POSTHOG_WEBHOOK_SECRET, SIGNATURE_HEADER, TIMESTAMP_HEADER
+)
+import asyncio
+import contextlib
+import json
 import os
+import threading
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the Gemini, Supabase and PostHog clients off the request path
+    warm_up = asyncio.create_task(registry.warm_up())
+    scheduler = None
+    if PIPELINE_SCHEDULE_SECONDS > 0:
+        scheduler = asyncio.create_task(run_scheduler())
+    webhook_flusher = None
+    if POSTHOG_WEBHOOK_SECRET:
+        webhook_flusher = asyncio.create_task(webhook_ingestor.run())
+    # The error index only sees sessions stored by this host, fill it from what Supabase has
+    index_backfill = None
+    stop_backfill = threading.Event()
+    if ERROR_INDEX_BACKFILL:
+        index_backfill = asyncio.create_task(asyncio.to_thread(database.resume_error_index_backfill, stop_backfill))
+    yield
+    if scheduler is not None:
+        scheduler.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await scheduler
+    if webhook_flusher is not None:
+        webhook_flusher.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await webhook_flusher
+        # Pushed errors only live in memory, analyze what is left before exiting
+        await webhook_ingestor.close()
+    if index_backfill is not None:
+        # A thread cannot be cancelled, ask it to stop after the current page
+        stop_backfill.set()
+        await index_backfill
+    warm_up.cancel()
+    await posthog.close_posthog_client()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Load environment variables
 load_dotenv(override=True)
 
+configure_logging()
+
 # Set up CORS
 origins = [
     os.getenv("FRONTEND_URL", "http://localhost:3000"),
@@ -28,11 +83,54 @@ async def root():
     return {"message": "App running on fastapi"}
 
 @app.get("/get-session-recordings")
-async def get_session_recordings():
-    return posthog.get_session_recordings()
+async def get_session_recordings(
+    request: Request,
+    date_from: str | None = Query(
+        None,
+        description="(Optional) Only return recordings that started after this date"
+    ),
+    date_to: str | None = Query(
+        None,
+        description="(Optional) Only return recordings that started before this date"
+    ),
+    min_console_errors: int | None = Query(
+        None,
+        ge=0,
+        description="(Optional) Only return recordings with at least this many console errors"
+    )
+):
+    """
+    Stream every matching session recording as NDJSON, one recording per line.
+    Responses are cached per query; a cache miss is streamed while it is cached.
+    """
+    async def produce():
+        pages = posthog.iter_session_recording_pages(
+            date_from=date_from,
+            date_to=date_to,
+            min_console_error_count=min_console_errors
+        )
+        # Fetch the first page up front so PostHog errors still produce a proper status code
+        first_page = await anext(pages, [])
+
+        async def ndjson():
+            for recording in first_page:
+                yield (json.dumps(recording) + "\n").encode()
+            async for page in pages:
+                for recording in page:
+                    yield (json.dumps(recording) + "\n").encode()
+
+        return ndjson()
+
+    return await response_cache.respond(
+        request,
+        produce,
+        media_type="application/x-ndjson",
+        stream_misses=True
+    )
         
 @app.get("/get-events")
 async def get_events(
+    request: Request,
     session_id: str | None = Query(
         None,
         description="(Optional) If set, only return errors from this session_id"
@@ -43,32 +141,373 @@ async def get_events(
         description="How many error events to fetch (max 1000)"
     )
 ):
-    return posthog.get_events(session_id=session_id, limit=limit)
+    """
+    Stream the newest exception events and their grouped unique errors as one
+    JSON object. Events are written out as PostHog's response is parsed, so the
+    first bytes go out before the whole pull has arrived.
+    """
+    async def produce():
+        events = posthog.iter_exception_events(session_id=session_id, limit=limit)
+        # Fetch the first event up front so PostHog errors still produce a proper status code
+        first_event = await anext(events, None)
+
+        async def body():
+            # Events are written out as they arrive and only kept as columns for grouping
+            batch = ErrorEventBatch()
+            yield b'{"requested_session": ' + json.dumps(session_id).encode() + b', "errors": ['
+            event = first_event
+            while event is not None:
+                yield (b", " if batch else b"") + json.dumps(event.to_dict()).encode()
+                batch.append(event)
+                event = await anext(events, None)
+            unique_errors = posthog.group_errors(batch.messages, batch.stacktraces)
+            yield f'], "fetched": {len(batch)}, "unique_errors": {json.dumps([error.to_dict() for error in unique_errors])}}}'.encode()
+
+        return body()
+
+    return await response_cache.respond(request, produce, stream_misses=True)
 
 @app.get("/get-recordings")
 async def get_recordings():
     return posthog.get_recordings()
 
 @app.get("/process-sessions-with-errors")
-async def process_sessions_with_errors():
+async def process_sessions_with_errors(
+    max_in_flight: int | None = Query(
+        None,
+        ge=1, le=256,
+        description="(Optional) How many sessions to process concurrently (1 = sequential)"
+    ),
+    date_from: str | None = Query(
+        None,
+        description="(Optional) Only process recordings that started after this date"
+    ),
+    date_to: str | None = Query(
+        None,
+        description="(Optional) Only process recordings that started before this date"
+    ),
+    batch_analysis: bool | None = Query(
+        None,
+        description="(Optional) Analyze many sessions per Gemini request"
+    ),
+    incremental: bool = Query(
+        False,
+        description="(Optional) Only process recordings newer than the last run, plus sessions still ongoing"
+    )
+):
     """
     Analyzes all session recordings, finds ones with errors,
     and enriches them with event data and a shareable replay link.
     """
-    return await posthog.analyze_recordings_for_errors()
+    return await posthog.analyze_recordings_for_errors(
+        max_sessions_in_flight=max_in_flight,
+        date_from=date_from,
+        date_to=date_to,
+        batch_analysis=batch_analysis,
+        incremental=incremental,
+        priority=PRIORITY_INTERACTIVE
+    )
+
+@app.post("/jobs/process-sessions-with-errors", status_code=202)
+async def submit_process_sessions_job(
+    max_in_flight: int | None = Query(
+        None,
+        ge=1, le=256,
+        description="(Optional) How many sessions to process concurrently (1 = sequential)"
+    ),
+    date_from: str | None = Query(
+        None,
+        description="(Optional) Only process recordings that started after this date"
+    ),
+    date_to: str | None = Query(
+        None,
+        description="(Optional) Only process recordings that started before this date"
+    ),
+    batch_analysis: bool | None = Query(
+        None,
+        description="(Optional) Analyze many sessions per Gemini request"
+    ),
+    incremental: bool = Query(
+        False,
+        description="(Optional) Only process recordings newer than the last run, plus sessions still ongoing"
+    )
+):
+    """Start the session analysis workflow in the background and return its job id"""
+    job = job_manager.submit(
+        max_sessions_in_flight=max_in_flight,
+        date_from=date_from,
+        date_to=date_to,
+        batch_analysis=batch_analysis,
+        incremental=incremental
+    )
+    return job.snapshot()
+
+@app.get("/jobs")
+async def list_jobs():
+    """List recent and running analysis jobs"""
+    return [job.snapshot() for job in job_manager.list()]
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get a job's status and progress counters"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Job {job_id} not found")
+    return job.snapshot()
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(
+    job_id: str,
+    offset: int = Query(0, ge=0, description="Index of the first result to return"),
+    limit: int = Query(100, ge=1, le=1000, description="How many results to return (max 1000)")
+):
+    """Get the results a job has produced so far"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Job {job_id} not found")
+    return {
+        **job.snapshot(),
+        "offset": offset,
+        "results": [result.to_api() for result in job.results[offset:offset + limit]]
+    }
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a running job; sessions already in flight still finish and are saved"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(404, f"Job {job_id} not found")
+    return job.snapshot()
+
+@app.get("/sessions")
+async def list_sessions(
+    columns: str | None = Query(
+        None,
+        description=f"(Optional) Comma-separated columns to return, from {','.join(database.SESSION_COLUMNS)}"
+    ),
+    limit: int = Query(100, ge=1, le=database.SESSION_PAGE_MAX_SIZE, description="How many sessions to return"),
+    cursor: str | None = Query(None, description="(Optional) next_cursor from the previous page"),
+    date_from: str | None = Query(None, description="(Optional) Only list sessions that started at or after this date"),
+    date_to: str | None = Query(None, description="(Optional) Only list sessions that started before this date"),
+    error_tag: str | None = Query(None, description="(Optional) Only list sessions tagged with this error"),
+    order: str = Query("desc", description="'desc' for newest first, 'asc' for oldest first")
+):
+    """
+    List analyzed sessions from the posthog table, one keyset page at a time.
+    Pass the returned next_cursor with the same filters and order to get the next page.
+    """
+    if order not in ("asc", "desc"):
+        raise HTTPException(422, "order must be 'asc' or 'desc'")
+    try:
+        page = await asyncio.to_thread(
+            database.list_processed_sessions,
+            columns=[column.strip() for column in columns.split(",") if column.strip()] if columns else None,
+            limit=limit,
+            cursor=cursor,
+            start_time_from=date_from,
+            start_time_to=date_to,
+            error_tag=error_tag,
+            ascending=order == "asc"
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except Exception as e:
+        raise HTTPException(502, f"Supabase error: {e}")
+    return {"sessions": page["rows"], "count": len(page["rows"]), "next_cursor": page["next_cursor"]}
+
+@app.get("/export/{table}")
+async def export_table(
+    table: str,
+    format: str = Query("ndjson", description=f"One of {', '.join(EXPORT_FORMATS)}"),
+    cursor: str | None = Query(None, description="(Optional) Resume after the row this cursor points at"),
+    date_from: str | None = Query(None, description="(Optional) Only export sessions that started at or after this date"),
+    date_to: str | None = Query(None, description="(Optional) Only export sessions that started before this date"),
+    checkpoints: bool = Query(False, description="(Optional) Follow every chunk with a _checkpoint line carrying progress and a resume cursor")
+):
+    """
+    Stream a whole table ('sessions' or 'recordings') as NDJSON or gzip-compressed
+    NDJSON, read from Supabase in range-bounded chunks so memory stays constant.
+    """
+    if table not in EXPORT_TABLES:
+        raise HTTPException(404, f"Unknown table {table}")
+    chunks = iter_export_bytes(
+        table, format, cursor=cursor, date_from=date_from, date_to=date_to, checkpoints=checkpoints
+    )
+    # Read the first chunk up front so bad parameters and Supabase errors still produce a proper status code
+    try:
+        first_chunk = await anext(chunks, b"")
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except Exception as e:
+        raise HTTPException(502, f"Supabase error: {e}")
+
+    async def body():
+        yield first_chunk
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(
+        body(),
+        media_type="application/gzip" if format == "ndjson.gz" else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{table}.{format}"'}
+    )
+
+@app.post("/exports", status_code=202)
+async def start_file_export(
+    table: str = Query(..., description=f"One of {', '.join(EXPORT_TABLES)}"),
+    format: str = Query("ndjson", description=f"One of {', '.join(EXPORT_FORMATS)}"),
+    cursor: str | None = Query(None, description="(Optional) Start after the row this cursor points at"),
+    date_from: str | None = Query(None, description="(Optional) Only export sessions that started at or after this date"),
+    date_to: str | None = Query(None, description="(Optional) Only export sessions that started before this date")
+):
+    """Export a table to a local file in the background and return the export's id"""
+    try:
+        export = export_manager.start(table, format, date_from=date_from, date_to=date_to, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return export.snapshot()
+
+@app.get("/exports")
+async def list_file_exports():
+    """List recent and running file exports"""
+    return [export.snapshot() for export in export_manager.list()]
+
+@app.get("/exports/{export_id}")
+async def get_file_export(export_id: str):
+    """Get a file export's status, rows per second and resume cursor"""
+    export = export_manager.get(export_id)
+    if export is None:
+        raise HTTPException(404, f"Export {export_id} not found")
+    return export.snapshot()
+
+@app.post("/exports/{export_id}/resume", status_code=202)
+async def resume_file_export(export_id: str):
+    """Continue a failed or cancelled file export from its last written chunk"""
+    export = export_manager.resume(export_id)
+    if export is None:
+        raise HTTPException(404, f"Export {export_id} not found")
+    return export.snapshot()
+
+@app.delete("/exports/{export_id}")
+async def cancel_file_export(export_id: str):
+    """Cancel a running file export; it can be resumed later"""
+    export = export_manager.cancel(export_id)
+    if export is None:
+        raise HTTPException(404, f"Export {export_id} not found")
+    return export.snapshot()
+
+@app.get("/errors/top")
+async def get_top_errors(
+    limit: int = Query(10, ge=1, le=1000, description="How many errors to return (max 1000)"),
+    since: str | None = Query(None, description="(Optional) Only count sessions that started after this date"),
+    until: str | None = Query(None, description="(Optional) Only count sessions that started before this date")
+):
+    """Errors seen in the most sessions, from the precomputed error index"""
+    return await asyncio.to_thread(error_index.top, limit, since, until)
+
+@app.get("/errors/{fingerprint}")
+async def get_error(fingerprint: str):
+    """Session and occurrence totals and first/last seen times for one error"""
+    error = await asyncio.to_thread(error_index.get, fingerprint)
+    if error is None:
+        raise HTTPException(404, f"Error {fingerprint} not found")
+    return error
+
+@app.get("/errors/{fingerprint}/sessions")
+async def get_error_sessions(
+    fingerprint: str,
+    offset: int = Query(0, ge=0, description="Index of the first session to return"),
+    limit: int = Query(100, ge=1, le=1000, description="How many sessions to return (max 1000)")
+):
+    """Sessions an error appeared in, newest first"""
+    return {
+        "fingerprint": fingerprint,
+        "offset": offset,
+        "sessions": await asyncio.to_thread(error_index.sessions, fingerprint, limit, offset)
+    }
+
+@app.get("/errors/{fingerprint}/trend")
+async def get_error_trend(
+    fingerprint: str,
+    bucket: str = Query("day", description=f"Bucket width, one of {', '.join(BUCKET_SECONDS)}"),
+    since: str | None = Query(None, description="(Optional) Only include sessions that started after this date"),
+    until: str | None = Query(None, description="(Optional) Only include sessions that started before this date")
+):
+    """Sessions and occurrences of an error per time bucket"""
+    if bucket not in BUCKET_SECONDS:
+        raise HTTPException(422, f"bucket must be one of {', '.join(BUCKET_SECONDS)}")
+    return {
+        "fingerprint": fingerprint,
+        "bucket": bucket,
+        "trend": await asyncio.to_thread(error_index.trend, fingerprint, bucket, since, until)
+    }
+
+@app.get("/error-index/stats")
+async def get_error_index_stats():
+    """Size of the cross-session error index"""
+    return await asyncio.to_thread(error_index.stats)
+
+@app.post("/webhooks/posthog", status_code=202)
+async def posthog_webhook(request: Request):
+    """
+    Receive batches of PostHog events. Deliveries must carry an HMAC-SHA256
+    signature of "<timestamp>.<body>" made with POSTHOG_WEBHOOK_SECRET.
+    $exception events are counted per session, and a session is analyzed once
+    it ends, goes idle or has been open for a while.
+    """
+    if not POSTHOG_WEBHOOK_SECRET:
+        raise HTTPException(503, "Webhook ingestion is not configured, set POSTHOG_WEBHOOK_SECRET")
+    body = await request.body()
+    if not verify_signature(body, request.headers.get(TIMESTAMP_HEADER), request.headers.get(SIGNATURE_HEADER)):
+        raise HTTPException(401, "Invalid or expired webhook signature")
+    try:
+        events = parse_events(json.loads(body))
+    except ValueError as e:
+        raise HTTPException(400, f"Invalid webhook payload: {e}")
+    return webhook_ingestor.ingest(events)
+
+@app.get("/webhooks/posthog/stats")
+async def get_webhook_stats():
+    """Open sessions and event counters for PostHog webhook ingestion"""
+    return webhook_ingestor.stats()
+
+@app.get("/analysis-cache/stats")
+async def get_analysis_cache_stats():
+    """Hit/miss counters for the AI error analysis cache"""
+    return analysis_cache.stats()
+
+@app.get("/response-cache/stats")
+async def get_response_cache_stats():
+    """Hit/miss counters for the read endpoint response cache"""
+    return response_cache.stats()
+
+@app.get("/gemini-scheduler/stats")
+async def get_gemini_scheduler_stats():
+    """Queue depth, retries and rate limits seen by the Gemini scheduler"""
+    return gemini_scheduler.stats()
+
+@app.get("/posthog-limiter/stats")
+async def get_posthog_limiter_stats():
+    """Current adaptive limits, queue depth and throttling per PostHog endpoint class"""
+    return posthog_limiter.stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Pipeline stage timings, cache and session counters and upstream call histograms in Prometheus format"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/enable-session-sharing/{session_id}")
 async def enable_session_sharing(session_id: str):
     """Enable sharing for a session replay and get embed code"""
-    return posthog.enable_session_sharing(session_id)
+    return await posthog.enable_session_sharing(session_id)
 
 @app.get("/get-session-share-info/{session_id}")
 async def get_session_share_info(session_id: str):
     """Get sharing information for a session replay"""
-    return posthog.get_session_share_info(session_id)
+    return await posthog.get_session_share_info(session_id)
 
 @app.get("/check-session-sharing/{session_id}")
 async def check_session_sharing(session_id: str):
     """Check if sharing is enabled and get help if not"""
-    return posthog.check_session_sharing_status(session_id)
+    return await posthog.check_session_sharing_status(session_id)
 
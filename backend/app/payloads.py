@@ -0,0 +1,108 @@
+import base64
+import hashlib
+import json
+import os
+import re
+import zlib
+from typing import Dict, Iterable, Iterator, List, Tuple
+import zstandard
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+# Typical raw bytes per stored chunk of a recording payload; chunks are between
+# half and twice this size
+RECORDING_CHUNK_SIZE = int(os.getenv('RECORDING_CHUNK_SIZE', str(256 * 1024)))
+RECORDING_ZSTD_LEVEL = int(os.getenv('RECORDING_ZSTD_LEVEL', '3'))
+
+# New chunks are written with zstd; zlib chunks stored by earlier versions stay readable
+CODEC = "zstd"
+
+# Where one JSON object or array ends and the next sibling starts, e.g. between
+# two events of a recording; chunks are only cut at these points
+_BOUNDARY = re.compile(rb'[}\]],(?=[{\[])')
+# Bytes before a boundary whose hash decides whether to cut there
+_BOUNDARY_WINDOW = 64
+# About one boundary in 32 past the minimum size is a cut
+_BOUNDARY_MASK = 0x1f
+
+class PayloadChunk:
+    """One content-addressed piece of a payload, compressed for storage"""
+
+    __slots__ = ("hash", "codec", "data")
+
+    def __init__(self, hash: str, codec: str, data: bytes):
+        self.hash = hash
+        self.codec = codec
+        self.data = data
+
+    def to_row(self) -> Dict:
+        """The recording_chunks table row; bytea goes through PostgREST as base64 text"""
+        return {"hash": self.hash, "codec": self.codec, "data": base64.b64encode(self.data).decode()}
+
+    @classmethod
+    def from_row(cls, row: Dict) -> "PayloadChunk":
+        return cls(row['hash'], row['codec'], base64.b64decode(row['data']))
+
+def compress(data: bytes, codec: str = CODEC) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=RECORDING_ZSTD_LEVEL).compress(data)
+    if codec == "zlib":
+        return zlib.compress(data, 6)
+    raise ValueError(f"Unknown codec: {codec}")
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    raise ValueError(f"Unknown codec: {codec}")
+
+def _cut_points(raw: bytes, chunk_size: int) -> Iterator[int]:
+    """
+    Content-defined chunk ends: a boundary between sibling JSON values is a cut
+    when the hash of the bytes just before it matches, so cuts follow the
+    content rather than offsets. Events added to or dropped from a recording
+    only change the chunks around them. A run with no cut is split at twice
+    `chunk_size`.
+    """
+    min_size, max_size = chunk_size // 2, chunk_size * 2
+    start = 0
+    for match in _BOUNDARY.finditer(raw):
+        end = match.end()
+        while end - start > max_size:
+            start += max_size
+            yield start
+        if end - start >= min_size and zlib.crc32(raw[max(0, end - _BOUNDARY_WINDOW):end]) & _BOUNDARY_MASK == 0:
+            start = end
+            yield end
+    while len(raw) - start > max_size:
+        start += max_size
+        yield start
+
+def split_payload(payload: Dict, chunk_size: int = RECORDING_CHUNK_SIZE) -> Tuple[List[str], List[PayloadChunk], int]:
+    """
+    Serialize a payload and cut it into content-defined chunks addressed by the
+    sha256 of their raw bytes, so a chunk shared by many payloads (or saved
+    twice, or by a recording that has since grown) has one key. Returns the
+    ordered hashes, the distinct chunks and the payload's raw size in bytes.
+    """
+    raw = json.dumps(payload, separators=(',', ':'), sort_keys=True).encode()
+    hashes = []
+    chunks = {}
+    start = 0
+    for end in [*_cut_points(raw, chunk_size), len(raw)]:
+        if end <= start:
+            continue
+        piece = raw[start:end]
+        start = end
+        digest = hashlib.sha256(piece).hexdigest()
+        hashes.append(digest)
+        if digest not in chunks:
+            chunks[digest] = PayloadChunk(digest, CODEC, compress(piece))
+    return hashes, list(chunks.values()), len(raw)
+
+def join_payload(hashes: Iterable[str], chunks: Dict[str, PayloadChunk]) -> Dict:
+    """Decompress and reassemble a payload from its ordered chunk hashes"""
+    raw = b"".join(decompress(chunks[digest].data, chunks[digest].codec) for digest in hashes)
+    return json.loads(raw)
@@ -1,41 +1,92 @@
-import requests
+import asyncio
+import httpx
+import logging
 import os
 import json
-from fastapi import HTTPException, Query
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
 from dotenv import load_dotenv
-from agents import Agent, Runner, trace, function_tool, OpenAIChatCompletionsModel
-from openai import AsyncOpenAI
 from . import database
+from .analysis_cache import analysis_cache, error_set_fingerprint
+from .cache import LRUCache, SingleFlight
+from .clients import get_gemini_client, get_gemini_model, registry, GEMINI_MODEL
+from .fingerprint import fingerprint_error, group_errors
+from .llm_scheduler import gemini_scheduler, GeminiUnavailable, PRIORITY_BATCH
+from .metrics import CACHE_REQUESTS, PIPELINE_SESSIONS, span
+from .posthog_limiter import is_retryable, posthog_limiter
+from .records import ErrorCount, ErrorEvent, ErrorEventBatch, ProcessedSession
+from .streaming_json import iter_json_array
 from pydantic import BaseModel
-# from agents.models.openai import OpenAIChatCompletionsModel
-# from agents.tools import function_tool
 
 load_dotenv(override=True)
 
+logger = logging.getLogger(__name__)
+
 api_key = os.getenv('POSTHOG_API_KEY') 
 project_api_key = os.getenv('POSTHOG_PROJECT_API_KEY')
 project_id = os.getenv('POSTHOG_PROJECT_ID')
-gemini_api_key = os.getenv('GEMINI_API_KEY')
 
-GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+POSTHOG_HOST = os.getenv('POSTHOG_HOST', 'https://us.posthog.com')
+
+POSTHOG_RECORDINGS_PAGE_SIZE = int(os.getenv('POSTHOG_RECORDINGS_PAGE_SIZE', '100'))
+
+# Incremental runs: checkpoint name and how far before the high-water mark to re-list
+PIPELINE_CHECKPOINT_NAME = 'session_analysis'
+PIPELINE_INCREMENTAL_OVERLAP = float(os.getenv('PIPELINE_INCREMENTAL_OVERLAP_SECONDS', '3600'))
+# Runs in a row a session may fail before it is dropped from the checkpoint's pending ids
+PIPELINE_PENDING_MAX_ATTEMPTS = int(os.getenv('PIPELINE_PENDING_MAX_ATTEMPTS', '5'))
+
+# Bulk exception fetch: sessions per HogQL query and rows per page
+POSTHOG_EVENTS_SESSION_CHUNK_SIZE = int(os.getenv('POSTHOG_EVENTS_SESSION_CHUNK_SIZE', '100'))
+POSTHOG_EVENTS_PAGE_SIZE = int(os.getenv('POSTHOG_EVENTS_PAGE_SIZE', '1000'))
+# /get-events: select only the exception fields through HogQL instead of full /events/ payloads
+POSTHOG_EVENTS_PROJECTED = os.getenv('POSTHOG_EVENTS_PROJECTED', 'true').lower() in ('1', 'true', 'yes')
+
+POSTHOG_EMBED_URL = "https://app.posthog.com/embedded/"
 
-# Initialize Gemini client for the agent using AsyncOpenAI
-gemini_client = AsyncOpenAI(
-    api_key=gemini_api_key,
-    base_url=GEMINI_BASE_URL
-)
+# Share info cache: access tokens are stable once issued, "not shared" answers expire quickly
+SHARE_CACHE_SIZE = int(os.getenv('SHARE_CACHE_SIZE', '10000'))
+SHARE_CACHE_TTL = float(os.getenv('SHARE_CACHE_TTL', str(24 * 3600)))
+SHARE_CACHE_NEGATIVE_TTL = float(os.getenv('SHARE_CACHE_NEGATIVE_TTL', '60'))
 
-# Create the model for the agent
-gemini_model = OpenAIChatCompletionsModel(model="gemini-2.0-flash", openai_client=gemini_client)
+# Shared PostHog HTTP client settings
+POSTHOG_TIMEOUT = float(os.getenv('POSTHOG_TIMEOUT', '30'))
+POSTHOG_CONNECT_TIMEOUT = float(os.getenv('POSTHOG_CONNECT_TIMEOUT', '5'))
+POSTHOG_MAX_CONNECTIONS = int(os.getenv('POSTHOG_MAX_CONNECTIONS', '20'))
+POSTHOG_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('POSTHOG_MAX_KEEPALIVE_CONNECTIONS', '10'))
+POSTHOG_HTTP2 = os.getenv('POSTHOG_HTTP2', 'false').lower() in ('1', 'true', 'yes')
+
+# Concurrency bounds for analyze_recordings_for_errors
+PIPELINE_MAX_SESSIONS_IN_FLIGHT = int(os.getenv('PIPELINE_MAX_SESSIONS_IN_FLIGHT', '16'))
+POSTHOG_CONCURRENCY = int(os.getenv('POSTHOG_CONCURRENCY', '8'))
+GEMINI_CONCURRENCY = int(os.getenv('GEMINI_CONCURRENCY', '4'))
+SUPABASE_CONCURRENCY = int(os.getenv('SUPABASE_CONCURRENCY', '8'))
+
+# Batched multi-session analysis settings
+GEMINI_BATCH_ANALYSIS = os.getenv('GEMINI_BATCH_ANALYSIS', 'false').lower() in ('1', 'true', 'yes')
+GEMINI_BATCH_SIZE = int(os.getenv('GEMINI_BATCH_SIZE', '10'))
+GEMINI_BATCH_MAX_INPUT_TOKENS = int(os.getenv('GEMINI_BATCH_MAX_INPUT_TOKENS', '8000'))
+GEMINI_BATCH_MAX_OUTPUT_TOKENS = int(os.getenv('GEMINI_BATCH_MAX_OUTPUT_TOKENS', '4096'))
+# How long a partial batch waits for more sessions before it is sent
+GEMINI_BATCH_LINGER = float(os.getenv('GEMINI_BATCH_LINGER', '0.5'))
+# Expected completion size of a single-session analysis, for the scheduler's token budget
+GEMINI_ANALYSIS_OUTPUT_TOKENS = int(os.getenv('GEMINI_ANALYSIS_OUTPUT_TOKENS', '300'))
 
 class ErrorAnalysisOutput(BaseModel):
     title: str
     description: str
 
-@function_tool
+class SessionErrorAnalysis(BaseModel):
+    session_id: str
+    title: str
+    description: str
+
+class BatchErrorAnalysisOutput(BaseModel):
+    results: list[SessionErrorAnalysis]
+
 def analyze_session_errors(errors: list) -> dict:
     """Analyze JavaScript console errors and generate a title and description for a bug report"""
-    error_summary = "\n".join([f"- {error['message']} (occurred {error['count']} times)" for error in errors])
+    error_summary = "\n".join([f"- {error.message} (occurred {error.count} times)" for error in errors])
     
     prompt = f"""
     Analyze these JavaScript console errors from a user session and create:
@@ -58,83 +109,285 @@ def analyze_session_errors(errors: list) -> dict:
 
 def create_analysis_agent():
     """Create an agent for analyzing session errors using Gemini API"""
+    from agents import Agent
+
     analysis_instructions = """You are an expert at analyzing JavaScript console errors and creating clear, actionable titles and descriptions for bug reports. Focus on the most impactful errors and provide insights that would help developers understand and fix the issues. MAX 2 SENTENCES\n\nUse the analyze_session_errors tool to process the errors and generate appropriate titles and descriptions."""
     
     analysis_agent = Agent(
         name="Session Error Analyzer", 
         instructions=analysis_instructions, 
-        model=gemini_model,
+        model=get_gemini_model(),
         output_type=ErrorAnalysisOutput
     )
     
     return analysis_agent
 
-def get_session_recordings():
-    response = requests.get(
-        "https://us.posthog.com/api/projects/{project_id}/session_recordings/".format(
-            project_id=project_id
+def create_batch_analysis_agent():
+    """Create an agent that analyzes the errors of several sessions in one request"""
+    from agents import Agent, ModelSettings
+
+    analysis_instructions = """You are an expert at analyzing JavaScript console errors and creating clear, actionable titles and descriptions for bug reports. You will receive the errors of several user sessions, each under its own label. For every session, focus on the most impactful errors and provide insights that would help developers understand and fix the issues. Titles are at most 60 characters, descriptions MAX 2 SENTENCES. Return exactly one result per session and set its session_id to the session's label."""
+
+    return Agent(
+        name="Batch Session Error Analyzer",
+        instructions=analysis_instructions,
+        model=get_gemini_model(),
+        output_type=BatchErrorAnalysisOutput,
+        model_settings=ModelSettings(max_tokens=GEMINI_BATCH_MAX_OUTPUT_TOKENS)
+    )
+
+_share_tokens = LRUCache(max_size=SHARE_CACHE_SIZE, ttl=SHARE_CACHE_TTL)
+_share_flight = SingleFlight()
+
+def _build_posthog_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=POSTHOG_HOST,
+        timeout=httpx.Timeout(POSTHOG_TIMEOUT, connect=POSTHOG_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=POSTHOG_MAX_CONNECTIONS,
+            max_keepalive_connections=POSTHOG_MAX_KEEPALIVE_CONNECTIONS
         ),
-        headers={"Authorization": "Bearer {}".format(api_key)},
-    ).json()
-    print(len(response['results']))
-    return response
+        http2=POSTHOG_HTTP2
+    )
+
+registry.register('posthog_http', _build_posthog_client)
+
+def get_posthog_client() -> httpx.AsyncClient:
+    """Return the shared PostHog HTTP client, creating it on first use"""
+    client = registry.get('posthog_http')
+    if client.is_closed:
+        registry.pop('posthog_http')
+        client = registry.get('posthog_http')
+    return client
 
-def get_events(session_id=None, limit=100):
+async def close_posthog_client():
+    """Close the shared PostHog HTTP client and its pooled connections"""
+    client = registry.pop('posthog_http')
+    if client is not None:
+        await client.aclose()
+
+async def _posthog_request(endpoint: str, method: str, url: str, stream: bool = False, **kwargs) -> httpx.Response:
+    """
+    Send a request with the shared client inside the adaptive limiter's budget
+    for `endpoint` ("events", "query" for HogQL, "recordings" or "sharing").
+    Throttled and failed attempts are retried; the final response is returned
+    for the caller to check. With `stream` the body is not read; the caller must
+    close the response, which also frees its limiter slot.
+    """
+    if stream:
+        def request():
+            client = get_posthog_client()
+            return client.send(client.build_request(method, url, **kwargs), stream=True)
+    else:
+        def request():
+            return get_posthog_client().request(method, url, **kwargs)
+    return await posthog_limiter.send(endpoint, request, stream=stream)
+
+async def iter_session_recording_pages(
+    date_from: str | None = None,
+    date_to: str | None = None,
+    min_console_error_count: int | None = None,
+    page_size: int | None = None,
+    session_ids: list | None = None,
+):
+    """
+    Yield pages of session recordings, following PostHog's `next` cursors until
+    the listing is exhausted. Date range, console error and session id filters
+    are sent to PostHog so only matching recordings are transferred.
+    """
     if not api_key or not project_id:
         raise HTTPException(400, "Missing POSTHOG_API_KEY or POSTHOG_PROJECT_ID")
 
-    url = f"https://us.posthog.com/api/projects/{project_id}/events/"
+    url = f"/api/projects/{project_id}/session_recordings/"
+    headers = {"Authorization": f"Bearer {api_key}"}
+    base_params = {"limit": page_size or POSTHOG_RECORDINGS_PAGE_SIZE}
+    if date_from:
+        base_params["date_from"] = date_from
+    if date_to:
+        base_params["date_to"] = date_to
+    if min_console_error_count is not None:
+        base_params["having_predicates"] = json.dumps([{
+            "key": "console_error_count",
+            "type": "recording",
+            "operator": "gte",
+            "value": min_console_error_count
+        }])
+    if session_ids:
+        base_params["session_ids"] = json.dumps(list(session_ids))
+
+    params = dict(base_params)
+    offset = 0
+    while url:
+        with span("list_recordings"):
+            resp = await _posthog_request("recordings", "GET", url, headers=headers, params=params)
+            try:
+                resp.raise_for_status()
+            except httpx.HTTPStatusError as e:
+                raise HTTPException(resp.status_code, f"PostHog API error: {e}")
+
+            body = resp.json()
+        results = body.get('results', [])
+        if results:
+            yield results
+
+        if body.get('next'):
+            # The cursor URL already carries every query parameter
+            url, params = body['next'], None
+        elif body.get('has_next') and results:
+            offset += len(results)
+            params = {**base_params, "offset": offset}
+        else:
+            url = None
+
+async def iter_session_recordings(**filters):
+    """Yield session recordings one at a time as their pages arrive"""
+    async for page in iter_session_recording_pages(**filters):
+        for recording in page:
+            yield recording
+
+def _exception_event(event_id, timestamp, session_id, props: dict) -> ErrorEvent:
+    msg, stack = _extract_exception(props)
+    return ErrorEvent(event_id, timestamp, session_id, msg, stack, fingerprint_error(msg, stack) if msg else None)
+
+async def iter_exception_events(session_id: str | None = None, limit: int = 100):
+    """
+    Yield the newest $exception events as ErrorEvent records. By default only those fields are selected
+    through HogQL and rows are parsed while the response streams in, so neither
+    full event payloads nor the whole response body are held in memory.
+    """
+    if not api_key or not project_id:
+        raise HTTPException(400, "Missing POSTHOG_API_KEY or POSTHOG_PROJECT_ID")
+
+    if not POSTHOG_EVENTS_PROJECTED:
+        async for event in _iter_exception_events_full(session_id, limit):
+            yield event
+        return
+
+    query = """
+        SELECT uuid, timestamp, properties.$session_id, properties.$exception_list,
+               properties.$exception_values, properties.$exception_stacktrace
+        FROM events
+        WHERE event = '$exception'
+    """
+    values = {"limit": limit}
+    if session_id:
+        query += " AND properties.$session_id = {session_id}"
+        values["session_id"] = session_id
+    query += " ORDER BY timestamp DESC LIMIT {limit}"
+
+    response = await _posthog_request(
+        "query", "POST", f"/api/projects/{project_id}/query/",
+        stream=True,
+        headers={"Authorization": f"Bearer {api_key}"},
+        json={"query": {"kind": "HogQLQuery", "query": query, "values": values}}
+    )
+    try:
+        if response.is_error:
+            await response.aread()
+            raise HTTPException(response.status_code, f"PostHog API error: {response.status_code} {response.text[:500]}")
+
+        async for row in iter_json_array(response.aiter_bytes(), "results"):
+            event_id, timestamp, row_session_id, exc_list, exc_values, exc_stacktrace = row
+            yield _exception_event(event_id, timestamp, row_session_id, {
+                "$exception_list": _hogql_json(exc_list),
+                "$exception_values": _hogql_json(exc_values),
+                "$exception_stacktrace": _hogql_json(exc_stacktrace)
+            })
+    finally:
+        await response.aclose()
+
+async def _iter_exception_events_full(session_id: str | None, limit: int):
+    """Yield exception events from the /events/ API, which returns every property"""
+    url = f"/api/projects/{project_id}/events/"
     headers = {"Authorization": f"Bearer {api_key}"}
     params = {"event": "$exception", "limit": limit}
     if session_id:
         params["properties.$session_id"] = session_id
 
-    resp = requests.get(url, headers=headers, params=params)
+    resp = await _posthog_request("events", "GET", url, headers=headers, params=params)
     try:
         resp.raise_for_status()
-    except requests.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         raise HTTPException(resp.status_code, f"PostHog API error: {e}")
 
-    raw = resp.json().get("results", [])
-
-    errors = []
-    for ev in raw:
+    for ev in resp.json().get("results", []):
         props = ev.get("properties", {})
+        yield _exception_event(ev.get("id"), ev.get("timestamp"), props.get("$session_id"), props)
 
-        msg = None
-        exc_list = props.get("$exception_list")
-        if isinstance(exc_list, list) and exc_list:
-            msg = exc_list[0].get("value")
-            stack = exc_list[0].get("stacktrace")
-        else:
-            vals = props.get("$exception_values")
-            msg = vals[0] if isinstance(vals, list) and vals else None
-            stack = props.get("$exception_stacktrace")
-
-        errors.append({
-            "event_id":   ev.get("id"),
-            "timestamp":  ev.get("timestamp"),
-            "session_id": props.get("$session_id"),
-            "message":    msg,
-            "stacktrace": stack
-        })
+def get_recordings(limit: int = 100):
+    return {"message": "Not implemented"}
 
+def _share_links(session_id: str, access_token: str) -> dict:
+    """Embed URL and iframe code for a shared session replay"""
+    embed_url = f"{POSTHOG_EMBED_URL}{access_token}"
     return {
-        "requested_session": session_id,
-        "fetched": len(errors),
-        "errors": errors
+        "session_id": session_id,
+        "access_token": access_token,
+        "embed_url": embed_url,
+        "iframe_code": f'<iframe allowfullscreen width="100%" height="450" frameborder="0" src="{embed_url}"></iframe>'
     }
 
-def get_recordings(limit: int = 100):
-    return {"message": "Not implemented"}
+def remember_share_link(session_id: str, embed_url: str | None):
+    """Seed the share cache from a stored embed URL such as posthog.video_link"""
+    if embed_url and embed_url.startswith(POSTHOG_EMBED_URL):
+        access_token = embed_url[len(POSTHOG_EMBED_URL):].strip('/')
+        if access_token:
+            _share_tokens.set(session_id, access_token)
 
-def enable_session_sharing(session_id: str):
-    """Enable sharing for a session replay using PostHog API"""
+async def _known_share_token(session_id: str, check_store: bool = True) -> str | None:
+    """
+    Return the cached access token for a session, "" if it is cached as not
+    shared, or None if unknown. On a memory miss the video_link stored in the
+    posthog table is used, unless `check_store` is False.
+    """
+    access_token = _share_tokens.get(session_id)
+    CACHE_REQUESTS.inc(cache="share", result="miss" if access_token is None else "hit")
+    if access_token is not None or not check_store:
+        return access_token
+
+    async def load():
+        sessions = await asyncio.to_thread(
+            database.get_sessions_by_ids, [session_id], 'session_id,video_link'
+        )
+        stored = sessions.get(session_id)
+        if stored:
+            remember_share_link(session_id, stored.get('video_link'))
+
+    await _share_flight.run(("store", session_id), load)
+    return _share_tokens.get(session_id)
+
+async def _fetch_share_status(session_id: str) -> httpx.Response:
+    """GET the sharing settings of a session, concurrent callers share one request"""
+    url = f"/api/projects/{project_id}/session_recordings/{session_id}/sharing"
+    params = {"personal_api_key": api_key}
+    return await _share_flight.run(
+        ("status", session_id),
+        lambda: _posthog_request("sharing", "GET", url, params=params)
+    )
+
+async def enable_session_sharing(session_id: str, check_store: bool = True):
+    """
+    Enable sharing for a session replay using PostHog API. A session whose access
+    token is already known is answered from the share cache without a PATCH.
+    """
     if not session_id:
         raise HTTPException(400, "Session ID is required")
-    
 
-    url = f"https://us.posthog.com/api/projects/{project_id}/session_recordings/{session_id}/sharing"
+    access_token = await _known_share_token(session_id, check_store)
+    if access_token:
+        return {**_share_links(session_id, access_token), "status": "sharing_enabled"}
+
+    result = await _share_flight.run(
+        ("enable", session_id),
+        lambda: _enable_session_sharing_live(session_id)
+    )
+    if result.get('access_token'):
+        _share_tokens.set(session_id, result['access_token'])
+    return result
+
+async def _enable_session_sharing_live(session_id: str):
+    """Enable sharing for a session replay using PostHog API"""
+    url = f"/api/projects/{project_id}/session_recordings/{session_id}/sharing"
     
     personal_api_key = api_key
     project_api_key = os.getenv('POSTHOG_PROJECT_API_KEY')
@@ -142,41 +395,22 @@ def enable_session_sharing(session_id: str):
 
     params = {"personal_api_key": personal_api_key}
     
-    print(f"Debug - Project ID: {project_id}")
-    print(f"Debug - Personal API Key: {personal_api_key[:10]}...")
-    print(f"Debug - Project API Key: {project_api_key[:10] if project_api_key else 'None'}...")
-    print(f"Debug - URL: {url}")
-    
     try:
-        response = requests.patch(
-            url,
+        response = await _posthog_request(
+            "sharing", "PATCH", url,
             params=params,
             json={"enabled": True},
             headers={"Content-type": "application/json"}
         )
         
-        print(f"Debug - Response Status: {response.status_code}")
-        print(f"Debug - Response Headers: {dict(response.headers)}")
-        
-        if response.status_code != 200:
-            print(f"Debug - Response Text: {response.text}")
-            
+        logger.debug("Enable sharing response", extra={"session_id": session_id, "status": response.status_code})
         response.raise_for_status()
         
         result = response.json()
         access_token = result.get('access_token')
         
         if access_token:
-
-            iframe_code = f'<iframe allowfullscreen width="100%" height="450" frameborder="0" src="https://app.posthog.com/embedded/{access_token}"></iframe>'
-            
-            return {
-                "session_id": session_id,
-                "access_token": access_token,
-                "embed_url": f"https://app.posthog.com/embedded/{access_token}",
-                "iframe_code": iframe_code,
-                "status": "sharing_enabled"
-            }
+            return {**_share_links(session_id, access_token), "status": "sharing_enabled"}
         else:
             return {
                 "session_id": session_id,
@@ -184,15 +418,15 @@ def enable_session_sharing(session_id: str):
                 "response": result
             }
             
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
 
-        if "403" in str(e) and project_api_key:
-            print("Trying with project API key...")
+        if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 403 and project_api_key:
+            logger.info("Personal API key was refused, trying the project API key", extra={"session_id": session_id})
             params = {"personal_api_key": project_api_key}
             
             try:
-                response = requests.patch(
-                    url,
+                response = await _posthog_request(
+                    "sharing", "PATCH", url,
                     params=params,
                     json={"enabled": True},
                     headers={"Content-type": "application/json"}
@@ -203,82 +437,75 @@ def enable_session_sharing(session_id: str):
                 access_token = result.get('access_token')
                 
                 if access_token:
-                    iframe_code = f'<iframe allowfullscreen width="100%" height="450" frameborder="0" src="https://app.posthog.com/embedded/{access_token}"></iframe>'
-                    
-                    return {
-                        "session_id": session_id,
-                        "access_token": access_token,
-                        "embed_url": f"https://app.posthog.com/embedded/{access_token}",
-                        "iframe_code": iframe_code,
-                        "status": "sharing_enabled_with_project_key"
-                    }
-            except requests.exceptions.RequestException as e2:
+                    return {**_share_links(session_id, access_token), "status": "sharing_enabled_with_project_key"}
+            except httpx.HTTPError as e2:
                 raise HTTPException(status_code=500, detail=f"Both API keys failed. Personal key error: {str(e)}, Project key error: {str(e2)}")
         
         raise HTTPException(status_code=500, detail=f"Failed to enable sharing: {str(e)}")
 
-def get_session_share_info(session_id: str):
-    """Get sharing information for a session replay"""
+async def get_session_share_info(session_id: str):
+    """Get sharing information for a session replay, from the share cache when known"""
     if not session_id:
         raise HTTPException(400, "Session ID is required")
-    
 
-    url = f"https://us.posthog.com/api/projects/{project_id}/session_recordings/{session_id}/sharing"
-    params = {"personal_api_key": api_key}
-    
+    access_token = await _known_share_token(session_id)
+    if access_token == "":
+        return {
+            "session_id": session_id,
+            "sharing_enabled": False,
+            "message": "Sharing not enabled for this session"
+        }
+    if access_token:
+        return {**_share_links(session_id, access_token), "sharing_enabled": True}
+
     try:
-        response = requests.get(url, params=params)
+        response = await _fetch_share_status(session_id)
         response.raise_for_status()
         
         result = response.json()
         access_token = result.get('access_token')
         
         if access_token:
-            iframe_code = f'<iframe allowfullscreen width="100%" height="450" frameborder="0" src="https://app.posthog.com/embedded/{access_token}"></iframe>'
-            
-            return {
-                "session_id": session_id,
-                "access_token": access_token,
-                "embed_url": f"https://app.posthog.com/embedded/{access_token}",
-                "iframe_code": iframe_code,
-                "sharing_enabled": True
-            }
+            _share_tokens.set(session_id, access_token)
+            return {**_share_links(session_id, access_token), "sharing_enabled": True}
         else:
+            _share_tokens.set(session_id, "", ttl=SHARE_CACHE_NEGATIVE_TTL)
             return {
                 "session_id": session_id,
                 "sharing_enabled": False,
                 "message": "Sharing not enabled for this session"
             }
             
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Failed to get sharing info: {str(e)}")
 
-def check_session_sharing_status(session_id: str):
-    """Check if sharing is already enabled for a session"""
+async def check_session_sharing_status(session_id: str):
+    """Check if sharing is already enabled for a session, from the share cache when known"""
     if not session_id:
         raise HTTPException(400, "Session ID is required")
-    
-    url = f"https://us.posthog.com/api/projects/{project_id}/session_recordings/{session_id}/sharing"
-    params = {"personal_api_key": api_key}
-    
+
+    access_token = await _known_share_token(session_id)
+    if access_token == "":
+        return {
+            "session_id": session_id,
+            "sharing_enabled": False,
+            "message": "Sharing not enabled for this session"
+        }
+    if access_token:
+        return {**_share_links(session_id, access_token), "sharing_enabled": True}
+
     try:
-        response = requests.get(url, params=params)
+        response = await _fetch_share_status(session_id)
         
         if response.status_code == 200:
             result = response.json()
             access_token = result.get('access_token')
             
             if access_token:
-                iframe_code = f'<iframe allowfullscreen width="100%" height="450" frameborder="0" src="https://app.posthog.com/embedded/{access_token}"></iframe>'
-                
-                return {
-                    "session_id": session_id,
-                    "sharing_enabled": True,
-                    "access_token": access_token,
-                    "embed_url": f"https://app.posthog.com/embedded/{access_token}",
-                    "iframe_code": iframe_code
-                }
+                _share_tokens.set(session_id, access_token)
+                return {**_share_links(session_id, access_token), "sharing_enabled": True}
             else:
+                _share_tokens.set(session_id, "", ttl=SHARE_CACHE_NEGATIVE_TTL)
                 return {
                     "session_id": session_id,
                     "sharing_enabled": False,
@@ -300,7 +527,7 @@ def check_session_sharing_status(session_id: str):
                 ]
             }
             
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return {
             "session_id": session_id,
             "sharing_enabled": False,
@@ -313,118 +540,490 @@ def check_session_sharing_status(session_id: str):
             }
         }
     
-async def analyze_recordings_for_errors():
+# Session ids claimed by a running pipeline, shared by every run in this process
+_sessions_in_progress: set = set()
+
+class PipelineLimits:
+    """Concurrency bounds for a single run of the analysis pipeline"""
+
+    def __init__(self, sessions_in_flight=None, posthog=None, gemini=None, supabase=None):
+        self.sessions = asyncio.Semaphore(sessions_in_flight or PIPELINE_MAX_SESSIONS_IN_FLIGHT)
+        self.posthog = asyncio.Semaphore(posthog or POSTHOG_CONCURRENCY)
+        self.gemini = asyncio.Semaphore(gemini or GEMINI_CONCURRENCY)
+        self.supabase = asyncio.Semaphore(supabase or SUPABASE_CONCURRENCY)
+
+def _is_completed(recording: dict, existing_session: dict | None) -> bool:
+    """True if the session is already stored and PostHog no longer reports it as ongoing"""
+    # Default to ongoing if PostHog doesn't say
+    return bool(existing_session) and not recording.get('ongoing', True)
+
+async def _process_recording(
+    recording: dict,
+    existing_session: dict | None,
+    error_events: ErrorEventBatch | None,
+    limits: PipelineLimits,
+    writer: database.SessionWriter,
+    batcher: "AnalysisBatcher | None" = None,
+    priority: int = PRIORITY_BATCH,
+    reprocess: bool = False,
+):
     """
-    The main workflow, now with AI agent analysis for titles and descriptions.
+    Runs the per-session part of the pipeline: sharing and AI analysis, then
+    queues the result on `writer` for a batched upsert. `existing_session` is the
+    row already stored for this session, if any, and `error_events` its
+    exception events as returned by get_errors_for_sessions, or None if they
+    could not be fetched, which fails the session. When `batcher` is
+    given the analysis is sent to Gemini together with other sessions'. Raises
+    GeminiUnavailable if Gemini stays rate limited, so the session is retried
+    later instead of being saved with a generic title. With `reprocess` a
+    stored session is analyzed again even if it looks completed. Returns a
+    ProcessedSession, or None if skipped.
     """
-    print("Starting analysis...")
-    all_recordings_response = get_session_recordings()
-    all_recordings = all_recordings_response.get('results', [])
-    print(f"Found {len(all_recordings)} total recordings.")
+    session_id = recording.get('id')
+    if not session_id:
+        return None
 
-    if not all_recordings:
-        return []
+    logger.debug("Processing session", extra={"session_id": session_id})
 
-    recordings_with_errors = [
-        rec for rec in all_recordings if rec.get('console_error_count', 0) > 0
-    ]
-    print(f"Found {len(recordings_with_errors)} recordings with console_error_count > 0.")
+    # Check if session already exists in database AND is completed
+    if existing_session and not reprocess:
+        # Check if session is completed (ongoing=false and end_time exists)
+        if _is_completed(recording, existing_session):
+            logger.debug("Session already stored and completed, skipping AI generation", extra={"session_id": session_id})
+            # Use existing data
+            return ProcessedSession(
+                session_id=session_id,
+                errors=[ErrorCount(fingerprint_error(error), error) for error in existing_session.get('error_tags', [])],
+                embed_url=existing_session.get('video_link'),
+                title=existing_session.get('title', f"Session {session_id} - Console Errors"),
+                description=existing_session.get('description', f"Session with console errors."),
+                start_time=existing_session.get('start_time'),
+                end_time=existing_session.get('end_time')
+            )
+        logger.debug("Session stored but still ongoing, reprocessing", extra={"session_id": session_id})
 
-    if not recordings_with_errors:
-        return []
-    
-    simplified_error_sessions = []
-    
-    for recording in recordings_with_errors:
-        session_id = recording.get('id')
-        if not session_id:
-            continue
+    if error_events is None:
+        raise HTTPException(503, f"Errors for session {session_id} could not be fetched from PostHog")
 
-        print(f"--- Processing session: {session_id} ---")
-
-        # Check if session already exists in database AND is completed
-        existing_session = database.get_session_by_id(session_id)
-        if existing_session:
-            # Check if session is completed (ongoing=false and end_time exists)
-            ongoing = recording.get('ongoing', True)  # Default to True if not found
-            print(ongoing)
-            if not ongoing:
-                print(f"Session {session_id} already exists in database and is completed (ongoing=false, end_time exists), skipping AI generation.")
-                # Use existing data
-                session_object = {
-                    "session_id": session_id,
-                    "errors": [{"message": error, "count": 1} for error in existing_session.get('error_tags', [])],
-                    "embed_url": existing_session.get('video_link'),
-                    "title": existing_session.get('title', f"Session {session_id} - Console Errors"),
-                    "description": existing_session.get('description', f"Session with console errors."),
-                    "start_time": existing_session.get('start_time'),
-                    "end_time": existing_session.get('end_time')
-                }
-                simplified_error_sessions.append(session_object)
-                continue
+    logger.debug("Fetched raw error messages", extra={"session_id": session_id, "errors": len(error_events)})
+
+    if not error_events:
+        logger.debug("No error messages found, skipping", extra={"session_id": session_id})
+        return None
+
+    # Group by fingerprint so ids, URLs and positions don't split one bug into many
+    unique_errors = group_errors(error_events.messages, error_events.stacktraces)
+
+    if not unique_errors:
+        logger.debug("No unique errors could be parsed, skipping", extra={"session_id": session_id})
+        return None
+
+    return await _analyze_session(recording, unique_errors, limits, writer, batcher, priority)
+
+async def _analyze_session(
+    recording: dict,
+    unique_errors: list,
+    limits: PipelineLimits,
+    writer: database.SessionWriter,
+    batcher: "AnalysisBatcher | None" = None,
+    priority: int = PRIORITY_BATCH,
+) -> ProcessedSession:
+    """Share the replay, have Gemini title the grouped errors and queue the session on `writer`"""
+    session_id = recording['id']
+
+    # Known tokens were seeded from the stored rows, skip the per-session DB check
+    async with limits.posthog:
+        with span("sharing"):
+            share_info = await enable_session_sharing(session_id, check_store=False)
+
+    # Use AI agent to generate title and description
+    try:
+        with span("llm"):
+            if batcher is not None:
+                ai_analysis = await batcher.analyze(unique_errors)
             else:
-                print(f"Session {session_id} exists in database but is ongoing or missing end_time, will process for updates.")
+                async with limits.gemini:
+                    ai_analysis = await analyze_errors_with_agent(unique_errors, priority)
+    except GeminiUnavailable:
+        raise
+    except Exception as e:
+        logger.warning("AI analysis failed, using a generic title", extra={"session_id": session_id, "error": str(e)})
+        ai_analysis = {
+            "title": f"Session {session_id} - Console Errors",
+            "description": f"Session with {len(unique_errors)} different types of console errors."
+        }
 
-        error_messages = get_errors_for_session(session_id=session_id)
-        print(f"Found {len(error_messages)} raw error messages for this session.")
+    session_object = ProcessedSession(
+        session_id=session_id,
+        errors=unique_errors,
+        embed_url=share_info.get('embed_url'),
+        title=ai_analysis.get('title', f"Session {session_id} - Console Errors"),
+        description=ai_analysis.get('description', f"Session with console errors."),
+        start_time=recording.get('start_time'),
+        end_time=recording.get('end_time')
+    )
 
-        if not error_messages:
-            print("No error messages found, skipping.")
-            continue
+    # Queue the processed session for the next batched upsert
+    await writer.add(session_object)
 
-        share_info = enable_session_sharing(session_id)
-        
-        error_counts = {}
-        for message in error_messages:
-            if message:
-                error_counts[message] = error_counts.get(message, 0) + 1
-        
-        unique_errors = [
-            {"message": msg, "count": count} for msg, count in error_counts.items()
-        ]
-        
-        if not unique_errors:
-            print(f"No unique errors could be parsed for session {session_id}, skipping.")
-            continue
+    return session_object
+
+async def analyze_pushed_sessions(sessions: list, priority: int = PRIORITY_BATCH) -> tuple:
+    """
+    Analyze sessions whose errors were pushed to us (see app.webhooks) rather
+    than listed from PostHog. `sessions` holds (recording, errors) pairs, where
+    the recording has an id, start_time and end_time and errors are ErrorCount
+    records. Errors already stored for a session are kept next to the new ones.
+    Returns ({session_id: ProcessedSession or exception}, busy_ids); sessions
+    another run is working on are left alone and listed in busy_ids.
+    """
+    busy = [recording['id'] for recording, _ in sessions if recording['id'] in _sessions_in_progress]
+    sessions = [(recording, errors) for recording, errors in sessions if recording['id'] not in _sessions_in_progress]
+    if not sessions:
+        return {}, busy
+    session_ids = [recording['id'] for recording, _ in sessions]
+    _sessions_in_progress.update(session_ids)
+
+    limits = PipelineLimits()
+    try:
+        async with limits.supabase:
+            with span("db_lookup"):
+                existing_sessions = await asyncio.to_thread(database.get_sessions_by_ids, session_ids)
+        for session_id, existing_session in existing_sessions.items():
+            remember_share_link(session_id, existing_session.get('video_link'))
+
+        async def run(recording, errors):
+            existing_session = existing_sessions.get(recording['id'])
+            if existing_session:
+                seen = {error.fingerprint for error in errors}
+                for tag in existing_session.get('error_tags') or []:
+                    fingerprint = fingerprint_error(tag)
+                    if fingerprint not in seen:
+                        seen.add(fingerprint)
+                        errors.append(ErrorCount(fingerprint, tag))
+                stored_start = _parse_time(existing_session.get('start_time'))
+                if stored_start and stored_start < (_parse_time(recording.get('start_time')) or stored_start):
+                    recording = {**recording, 'start_time': existing_session['start_time']}
+            async with limits.sessions:
+                try:
+                    result = await _analyze_session(recording, errors, limits, writer, priority=priority)
+                except Exception:
+                    PIPELINE_SESSIONS.inc(outcome="failed")
+                    raise
+            PIPELINE_SESSIONS.inc(outcome="done")
+            return result
+
+        async with database.SessionWriter() as writer:
+            results = await asyncio.gather(
+                *(run(recording, errors) for recording, errors in sessions),
+                return_exceptions=True
+            )
+    finally:
+        _sessions_in_progress.difference_update(session_ids)
+
+    return dict(zip(session_ids, results)), busy
+
+async def analyze_recordings_for_errors(
+    max_sessions_in_flight: int | None = None,
+    posthog_concurrency: int | None = None,
+    gemini_concurrency: int | None = None,
+    supabase_concurrency: int | None = None,
+    date_from: str | None = None,
+    date_to: str | None = None,
+    batch_analysis: bool | None = None,
+    incremental: bool = False,
+    progress=None,
+    priority: int = PRIORITY_BATCH,
+):
+    """
+    The main workflow, now with AI agent analysis for titles and descriptions.
+
+    Recordings with console errors are pulled page by page and each session is
+    started as soon as a slot is free, bounded by `max_sessions_in_flight`, with
+    separate limits on calls to PostHog, Gemini and Supabase. PostHog calls go
+    through the shared async client; blocking Supabase calls run in threads.
+    Results keep the order of the input recordings; a session that fails is
+    logged and dropped without cancelling the others. Pass
+    `max_sessions_in_flight=1` to process sessions one at a time, and
+    `batch_analysis=True` to analyze many sessions per Gemini request. If the
+    run is cancelled, listing stops but sessions already started still finish
+    and are saved before the cancellation propagates.
+
+    With `incremental=True` the run starts from the persisted checkpoint: only
+    recordings that started after the last high-water mark (minus a small
+    overlap) are listed, plus the sessions that were still ongoing or failed
+    last time, which are analyzed again whatever their stored state. A session
+    that fails PIPELINE_PENDING_MAX_ATTEMPTS runs in a row is dropped. The
+    checkpoint is advanced once the listing completes.
+
+    `progress`, if given, is told about every session as it finishes through
+    session_done(result), session_skipped(session_id, result) and
+    session_failed(session_id, error), with results as ProcessedSession records. Sessions already being processed by
+    another run are skipped, so overlapping runs never work on the same session.
+
+    Gemini calls queue on the process-wide scheduler with `priority`, so a run
+    someone is waiting on can go ahead of background jobs.
+    """
+    logger.info("Starting analysis", extra={"incremental": incremental})
+    limits = PipelineLimits(
+        sessions_in_flight=max_sessions_in_flight,
+        posthog=posthog_concurrency,
+        gemini=gemini_concurrency,
+        supabase=supabase_concurrency,
+    )
+
+    writer = database.SessionWriter()
+    if batch_analysis is None:
+        batch_analysis = GEMINI_BATCH_ANALYSIS
+    batcher = AnalysisBatcher(limit=limits.gemini, priority=priority) if batch_analysis else None
 
-        # Use AI agent to generate title and description
-        print(f"Generating AI analysis for session {session_id}...")
+    def needs_processing(recording, existing_session):
+        return recording['id'] in reprocess_ids or not _is_completed(recording, existing_session)
+
+    async def run_bounded(recording, existing_session, error_events):
+        session_id = recording['id']
         try:
-            ai_analysis = await analyze_errors_with_agent(unique_errors)
-            print(f"AI analysis completed for session {session_id}")
+            result = await _process_recording(
+                recording, existing_session, error_events, limits, writer, batcher, priority,
+                reprocess=session_id in reprocess_ids
+            )
         except Exception as e:
-            print(f"AI analysis failed for session {session_id}: {e}")
-            ai_analysis = {
-                "title": f"Session {session_id} - Console Errors",
-                "description": f"Session with {len(unique_errors)} different types of console errors."
-            }
+            PIPELINE_SESSIONS.inc(outcome="failed")
+            if progress is not None:
+                progress.session_failed(session_id, e)
+            raise
+        finally:
+            _sessions_in_progress.discard(session_id)
+            limits.sessions.release()
 
-        session_object = {
-            "session_id": session_id,
-            "errors": unique_errors,
-            "embed_url": share_info.get('embed_url'),
-            "title": ai_analysis.get('title', f"Session {session_id} - Console Errors"),
-            "description": ai_analysis.get('description', f"Session with console errors."),
-            "start_time": recording.get('start_time'),
-            "end_time": recording.get('end_time')
-        }
-        simplified_error_sessions.append(session_object)
+        if result is None or not needs_processing(recording, existing_session):
+            PIPELINE_SESSIONS.inc(outcome="skipped")
+            if progress is not None:
+                progress.session_skipped(session_id, result)
+        else:
+            PIPELINE_SESSIONS.inc(outcome="done")
+            if progress is not None:
+                progress.session_done(result)
+        return result
 
-        # Save the processed session to the database
-        database.save_processed_session(session_object)
-        
-    print("Analysis complete.")
+    checkpoint = None
+    # Sessions the last incremental run left pending: analyzed again even if
+    # they now look completed, since they were stored while ongoing or failed
+    reprocess_ids = set()
+    if incremental:
+        try:
+            checkpoint = await asyncio.to_thread(database.get_checkpoint, PIPELINE_CHECKPOINT_NAME) or {}
+        except Exception as e:
+            # Starting from an empty checkpoint would re-list and re-analyze everything
+            logger.error("Error getting checkpoint", extra={"checkpoint": PIPELINE_CHECKPOINT_NAME, "error": str(e)})
+            raise HTTPException(503, f"Pipeline checkpoint could not be read: {e}")
+        reprocess_ids.update(checkpoint.get('pending_ids') or [])
+        pages = _iter_incremental_pages(checkpoint, date_to)
+    else:
+        pages = iter_session_recording_pages(
+            date_from=date_from,
+            date_to=date_to,
+            min_console_error_count=1
+        )
+
+    recordings_with_errors = []
+    busy_recordings = []
+    tasks = []
+    seen_ids = set()
+    claimed_ids = set()
+    try:
+        async for page in pages:
+            page = [
+                rec for rec in page
+                if rec.get('id') and rec.get('console_error_count', 0) > 0 and rec['id'] not in seen_ids
+            ]
+            seen_ids.update(rec['id'] for rec in page)
+
+            # Leave sessions that another run is working on to that run
+            busy = [rec for rec in page if rec['id'] in _sessions_in_progress]
+            if busy:
+                logger.info("Skipping sessions already being processed by another run", extra={"sessions": len(busy)})
+                PIPELINE_SESSIONS.inc(len(busy), outcome="busy")
+                busy_recordings.extend(busy)
+                page = [rec for rec in page if rec['id'] not in _sessions_in_progress]
+                if progress is not None:
+                    for rec in busy:
+                        progress.session_skipped(rec['id'], None)
+            if not page:
+                continue
+            claimed_ids.update(rec['id'] for rec in page)
+            _sessions_in_progress.update(rec['id'] for rec in page)
+
+            # One batched lookup per page instead of one query per session
+            async with limits.supabase:
+                with span("db_lookup"):
+                    existing_sessions = await asyncio.to_thread(
+                        database.get_sessions_by_ids, [rec['id'] for rec in page]
+                    )
+
+            for session_id, existing_session in existing_sessions.items():
+                remember_share_link(session_id, existing_session.get('video_link'))
+
+            # One bulk exception query for every session that needs (re)processing
+            to_fetch = [
+                rec['id'] for rec in page
+                if needs_processing(rec, existing_sessions.get(rec['id']))
+            ]
+            async with limits.posthog:
+                with span("fetch_errors"):
+                    session_errors = await get_errors_for_sessions(to_fetch)
+
+            for recording in page:
+                # Wait for a free slot before pulling more recordings from PostHog
+                await limits.sessions.acquire()
+                recordings_with_errors.append(recording)
+                tasks.append(asyncio.create_task(run_bounded(
+                    recording,
+                    existing_sessions.get(recording['id']),
+                    # None marks a session whose errors PostHog would not give us
+                    session_errors.get(recording['id']) if recording['id'] in to_fetch else ErrorEventBatch()
+                )))
+    except BaseException:
+        # Release claims taken for a page whose sessions never started
+        started = {rec['id'] for rec in recordings_with_errors}
+        _sessions_in_progress.difference_update(claimed_ids - started)
+        raise
+    finally:
+        # Let sessions already started finish even if listing failed or the run
+        # was cancelled. Shielded, so a cancel that arrives while waiting here
+        # does not reach the session tasks; it is raised once they are saved.
+        gathered = asyncio.gather(*tasks, return_exceptions=True)
+        cancelled = False
+        while True:
+            try:
+                results = await asyncio.shield(gathered)
+                break
+            except asyncio.CancelledError:
+                cancelled = True
+        try:
+            if batcher is not None:
+                await batcher.close()
+        finally:
+            await writer.close()
+        if cancelled:
+            raise asyncio.CancelledError()
+
+    logger.info("Listed recordings with console errors", extra={"recordings": len(recordings_with_errors)})
+
+    simplified_error_sessions = []
+    for recording, result in zip(recordings_with_errors, results):
+        if isinstance(result, BaseException):
+            logger.warning("Processing failed", extra={"session_id": recording.get('id'), "error": str(result)})
+            continue
+        if result is not None:
+            simplified_error_sessions.append(result.to_api())
+
+    if checkpoint is not None:
+        await asyncio.to_thread(
+            database.save_checkpoint,
+            PIPELINE_CHECKPOINT_NAME,
+            _next_checkpoint(checkpoint, recordings_with_errors, results, busy_recordings)
+        )
+
+    logger.info("Analysis complete", extra={
+        "rows_written": writer.rows_written,
+        "batches": len(writer.flush_counts),
+        "rows_failed": writer.rows_failed
+    })
     return simplified_error_sessions
 
-def get_errors_for_session(session_id: str) -> list:
+async def _iter_incremental_pages(checkpoint: dict, date_to: str | None = None):
+    """Yield the pages an incremental run needs: left-over sessions first, then new recordings"""
+    pending_ids = checkpoint.get('pending_ids') or []
+    for start in range(0, len(pending_ids), POSTHOG_EVENTS_SESSION_CHUNK_SIZE):
+        async for page in iter_session_recording_pages(
+            session_ids=pending_ids[start:start + POSTHOG_EVENTS_SESSION_CHUNK_SIZE],
+            min_console_error_count=1
+        ):
+            yield page
+
+    date_from = None
+    high_water_mark = _parse_time(checkpoint.get('high_water_mark'))
+    if high_water_mark:
+        # Re-list a small window so recordings PostHog ingested late are not missed
+        date_from = (high_water_mark - timedelta(seconds=PIPELINE_INCREMENTAL_OVERLAP)).isoformat()
+
+    async for page in iter_session_recording_pages(
+        date_from=date_from,
+        date_to=date_to,
+        min_console_error_count=1
+    ):
+        yield page
+
+def _next_checkpoint(checkpoint: dict, recordings: list, results: list, busy: list = ()) -> dict:
+    """
+    Advance the high-water mark to the newest recording start time seen and keep
+    the ids of sessions that are still ongoing or failed, and of `busy` ones
+    another run held, to revisit next run. Failures in a row are counted per
+    session; one that reaches PIPELINE_PENDING_MAX_ATTEMPTS is dropped.
+    """
+    high_water_mark = _parse_time(checkpoint.get('high_water_mark'))
+    previous_attempts = checkpoint.get('pending_attempts') or {}
+    pending_ids = []
+    attempts = {}
+    for recording, result in zip(recordings, results):
+        session_id = recording['id']
+        start_time = _parse_time(recording.get('start_time'))
+        if start_time and (high_water_mark is None or start_time > high_water_mark):
+            high_water_mark = start_time
+        if isinstance(result, BaseException):
+            failures = previous_attempts.get(session_id, 0) + 1
+            if failures >= PIPELINE_PENDING_MAX_ATTEMPTS:
+                logger.warning("Session kept failing, dropping it from the checkpoint", extra={
+                    "session_id": session_id, "attempts": failures
+                })
+                continue
+            attempts[session_id] = failures
+            pending_ids.append(session_id)
+        elif recording.get('ongoing', True):
+            pending_ids.append(session_id)
+    # Not processed by this run, so they are not done yet either
+    for recording in busy:
+        pending_ids.append(recording['id'])
+        if recording['id'] in previous_attempts:
+            attempts[recording['id']] = previous_attempts[recording['id']]
+
+    return {
+        "high_water_mark": high_water_mark.isoformat() if high_water_mark else None,
+        "pending_ids": list(dict.fromkeys(pending_ids)),
+        "pending_attempts": attempts
+    }
+
+def _parse_time(value: str | None) -> datetime | None:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def _extract_exception(props: dict) -> tuple:
+    """Return the (message, stacktrace) of the first exception in an event's properties"""
+    exc_list = props.get("$exception_list")
+    if isinstance(exc_list, list) and exc_list:
+        return exc_list[0].get("value"), exc_list[0].get("stacktrace")
+    vals = props.get("$exception_values")
+    msg = vals[0] if isinstance(vals, list) and vals else None
+    return msg, props.get("$exception_stacktrace")
+
+async def get_errors_for_session(session_id: str) -> ErrorEventBatch:
     """
     A corrected, lean function to get only the error messages for a single session.
     This version correctly filters by event properties and parses the error message.
+    Returns the session's exception events as one ErrorEventBatch.
+    Raises HTTPException if PostHog still fails after the limiter's retries, so
+    a session's errors are never silently reported as empty.
     """
     if not api_key or not project_id:
         raise HTTPException(400, "Missing PostHog credentials")
 
-    url = f"https://us.posthog.com/api/projects/{project_id}/events/"
+    url = f"/api/projects/{project_id}/events/"
     headers = {"Authorization": f"Bearer {api_key}"}
     
 
@@ -436,34 +1035,124 @@ def get_errors_for_session(session_id: str) -> list:
     }
 
     try:
-        response = requests.get(url, headers=headers, params=params)
+        response = await _posthog_request("events", "GET", url, headers=headers, params=params)
         response.raise_for_status()
         
         results = response.json().get('results', [])
         
-        error_messages = []
+        error_events = ErrorEventBatch()
         for event in results:
-            props = event.get('properties', {})
-            msg = None
-            exc_list = props.get("$exception_list")
-            if isinstance(exc_list, list) and exc_list:
-                msg = exc_list[0].get("value")
-            else:
-                vals = props.get("$exception_values")
-                msg = vals[0] if isinstance(vals, list) and vals else None
-            
+            msg, stack = _extract_exception(event.get('properties', {}))
             if msg:
-                error_messages.append(msg)
+                error_events.add(event.get('id'), event.get('timestamp'), session_id, msg, stack)
         
-        return error_messages
+        return error_events
+
+    except httpx.HTTPError as e:
+        status_code = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else 503
+        raise HTTPException(status_code, f"Failed to fetch events for session {session_id}: {e}")
+
+async def get_errors_for_sessions(session_ids: list) -> dict:
+    """
+    Fetch the exception messages of many sessions with HogQL queries instead of
+    one /events/ request per session. Returns {session_id: ErrorEventBatch}, the
+    same batches get_errors_for_session builds, filled row by row. Results are paged with LIMIT/OFFSET so
+    sessions with many errors are not truncated. If PostHog rejects a query
+    (e.g. a 400), that chunk falls back to per-session requests. If it is rate
+    limited, failing or unreachable, the chunk's sessions are left out of the
+    result so they fail and the next run picks them up; sessions whose errors
+    could not be fetched are never reported as empty.
+    """
+    if not api_key or not project_id:
+        raise HTTPException(400, "Missing PostHog credentials")
 
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching events for session {session_id}: {e}")
-        return []
+    session_ids = list(dict.fromkeys(session_id for session_id in session_ids if session_id))
+    errors_by_session = {session_id: ErrorEventBatch() for session_id in session_ids}
+
+    for start in range(0, len(session_ids), POSTHOG_EVENTS_SESSION_CHUNK_SIZE):
+        chunk = session_ids[start:start + POSTHOG_EVENTS_SESSION_CHUNK_SIZE]
+        try:
+            async for row in _iter_exception_rows(chunk):
+                session_id, exc_list, exc_values, exc_stacktrace = row
+                msg, stack = _extract_exception({
+                    "$exception_list": _hogql_json(exc_list),
+                    "$exception_values": _hogql_json(exc_values),
+                    "$exception_stacktrace": _hogql_json(exc_stacktrace)
+                })
+                if msg and session_id in errors_by_session:
+                    errors_by_session[session_id].add(None, None, session_id, msg, stack)
+        except httpx.HTTPError as e:
+            if is_retryable(e):
+                # Already retried by the limiter; one request per session would
+                # only add load, leave the chunk for the next run instead
+                logger.error(
+                    "Bulk exception query failed, leaving its sessions for the next run",
+                    extra={"sessions": len(chunk), "error": str(e)}
+                )
+                for session_id in chunk:
+                    del errors_by_session[session_id]
+                continue
+            logger.warning(
+                "Bulk exception query rejected, falling back to per-session requests",
+                extra={"sessions": len(chunk), "error": str(e)}
+            )
+            for session_id in chunk:
+                try:
+                    errors_by_session[session_id] = await get_errors_for_session(session_id)
+                except HTTPException as e:
+                    logger.error("Giving up on errors for session", extra={"session_id": session_id, "error": e.detail})
+                    del errors_by_session[session_id]
+
+    return errors_by_session
+
+async def _iter_exception_rows(session_ids: list):
+    """Yield (session_id, $exception_list, $exception_values, $exception_stacktrace) rows, page by page"""
+    query = """
+        SELECT properties.$session_id, properties.$exception_list,
+               properties.$exception_values, properties.$exception_stacktrace
+        FROM events
+        WHERE event = '$exception' AND properties.$session_id IN {session_ids}
+        ORDER BY timestamp ASC, uuid ASC
+        LIMIT {limit} OFFSET {offset}
+    """
+    headers = {"Authorization": f"Bearer {api_key}"}
+    offset = 0
+    while True:
+        response = await _posthog_request(
+            "query", "POST", f"/api/projects/{project_id}/query/",
+            headers=headers,
+            json={
+                "query": {
+                    "kind": "HogQLQuery",
+                    "query": query,
+                    "values": {
+                        "session_ids": session_ids,
+                        "limit": POSTHOG_EVENTS_PAGE_SIZE,
+                        "offset": offset
+                    }
+                }
+            }
+        )
+        response.raise_for_status()
+        rows = response.json().get('results', [])
+        for row in rows:
+            yield row
+        if len(rows) < POSTHOG_EVENTS_PAGE_SIZE:
+            return
+        offset += len(rows)
+
+def _hogql_json(value):
+    """HogQL returns nested properties as JSON text, decode them back into objects"""
+    if isinstance(value, str) and value[:1] in ('[', '{'):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
 
 def direct_gemini_analysis(errors: list) -> dict:
     """Direct Gemini API call as fallback when agents library fails"""
-    error_summary = "\n".join([f"- {error['message']} (occurred {error['count']} times)" for error in errors])
+    error_summary = "\n".join([f"- {error.message} (occurred {error.count} times)" for error in errors])
     
     prompt = f"""
     Analyze these JavaScript console errors from a user session and create:
@@ -483,8 +1172,8 @@ def direct_gemini_analysis(errors: list) -> dict:
     """
     
     try:
-        response = gemini_client.chat.completions.create(
-            model="gemini-2.0-flash",
+        response = get_gemini_client().chat.completions.create(
+            model=GEMINI_MODEL,
             messages=[
                 {"role": "user", "content": prompt}
             ],
@@ -512,39 +1201,218 @@ def direct_gemini_analysis(errors: list) -> dict:
             }
             
     except Exception as e:
-        print(f"Direct Gemini API call failed: {e}")
+        logger.error("Direct Gemini API call failed", extra={"error": str(e)})
         return {
             "title": "Session Console Errors",
             "description": f"Session with {len(errors)} different types of console errors."
         }
 
-async def analyze_errors_with_agent(errors: list) -> dict:
-    """Use the OpenAI Agent SDK to analyze errors and generate title/description"""
+def _error_summary(errors: list) -> str:
+    return "\n".join([f"- {error.message} (occurred {error.count} times)" for error in errors])
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token count for prompt budgeting, about four characters per token"""
+    return len(text) // 4 + 1
+
+async def _run_analysis_agent(errors: list, priority: int = PRIORITY_BATCH) -> dict | None:
+    """Run the analysis agent once, returning None if it produced no structured output"""
+    from agents import Runner
+
+    # Create the agent
+    agent = create_analysis_agent()
+
+    # Prepare the error data for the agent
+    error_summary = _error_summary(errors)
+
+    # Run the agent with the errors using the correct Runner pattern
+    prompt = f"Analyze these JavaScript console errors and create a title and description for a bug report:\n\n{error_summary}"
+    result = await gemini_scheduler.run(
+        lambda: Runner.run(agent, prompt),
+        tokens=_estimate_tokens(prompt) + GEMINI_ANALYSIS_OUTPUT_TOKENS,
+        priority=priority
+    )
+
+    # Use structured output
+    if result and hasattr(result, 'final_output') and result.final_output:
+        return {
+            "title": result.final_output.title,
+            "description": result.final_output.description
+        }
+    return None
+
+async def analyze_errors_with_agent(errors: list, priority: int = PRIORITY_BATCH) -> dict:
+    """
+    Use the OpenAI Agent SDK to analyze errors and generate title/description.
+    Results are cached by error set, so a signature that was already analysed
+    never calls Gemini again; fallback answers are not cached. Rate limits are
+    retried by the scheduler and raise GeminiUnavailable once it gives up.
+    """
+    cached = await analysis_cache.get(errors)
+    if cached is not None:
+        return cached
+
     try:
-        # Create the agent
-        agent = create_analysis_agent()
-        
-        # Prepare the error data for the agent
-        error_summary = "\n".join([f"- {error['message']} (occurred {error['count']} times)" for error in errors])
-        
-        # Run the agent with the errors using the correct Runner pattern
-        result = await Runner.run(agent, f"Analyze these JavaScript console errors and create a title and description for a bug report:\n\n{error_summary}")
-        
-        # Use structured output
-        if result and hasattr(result, 'final_output') and result.final_output:
-            return {
-                "title": result.final_output.title,
-                "description": result.final_output.description
-            }
-        else:
-            return {
-                "title": "Session Console Errors",
-                "description": f"Session with {len(errors)} different types of console errors."
-            }
-            
+        analysis = await _run_analysis_agent(errors, priority)
+    except GeminiUnavailable:
+        raise
     except Exception as e:
-        print(f"Agent analysis failed: {e}")
+        logger.warning("Agent analysis failed", extra={"error": str(e)})
+        analysis = None
+
+    if analysis is None:
         return {
             "title": "Session Console Errors",
             "description": f"Session with {len(errors)} different types of console errors."
-        }
\ No newline at end of file
+        }
+
+    await analysis_cache.set(errors, analysis)
+    return analysis
+
+async def _run_batch_analysis_agent(error_sets: list, priority: int = PRIORITY_BATCH) -> dict:
+    """
+    Analyze several sessions' errors in one Gemini request. Returns a dict mapping
+    the index of each error set to its {title, description}; entries the model
+    left out or returned malformed are missing from the dict.
+    """
+    from agents import Runner
+
+    sections = [
+        f"Session S{index + 1}:\n{_error_summary(errors)}" for index, errors in enumerate(error_sets)
+    ]
+    prompt = (
+        "Analyze the JavaScript console errors of each session below and create a title and "
+        "description for a bug report per session:\n\n" + "\n\n".join(sections)
+    )
+
+    agent = create_batch_analysis_agent()
+    result = await gemini_scheduler.run(
+        lambda: Runner.run(agent, prompt),
+        tokens=_estimate_tokens(prompt) + GEMINI_BATCH_MAX_OUTPUT_TOKENS,
+        priority=priority
+    )
+    if not (result and getattr(result, 'final_output', None)):
+        return {}
+
+    analyses = {}
+    for item in result.final_output.results:
+        label = item.session_id.strip().upper().removeprefix("SESSION").strip().removeprefix("S")
+        if not label.isdigit():
+            continue
+        index = int(label) - 1
+        if 0 <= index < len(error_sets) and item.title and item.description:
+            analyses[index] = {"title": item.title, "description": item.description}
+    return analyses
+
+class AnalysisBatcher:
+    """
+    Collects analysis requests from concurrently running sessions and sends them
+    to Gemini together. A batch is sent once it holds `batch_size` error sets,
+    would exceed `max_input_tokens`, or has waited `linger` seconds. Identical
+    error sets share one slot, cached analyses skip the batch entirely, and any
+    session the batch answer does not cover falls back to a single-session call.
+    If Gemini stays rate limited the whole batch fails with GeminiUnavailable
+    rather than multiplying the load with per-session fallbacks.
+    """
+
+    def __init__(
+        self,
+        batch_size: int | None = None,
+        max_input_tokens: int | None = None,
+        linger: float | None = None,
+        limit: asyncio.Semaphore | None = None,
+        priority: int = PRIORITY_BATCH,
+    ):
+        self.batch_size = batch_size or GEMINI_BATCH_SIZE
+        self.max_input_tokens = max_input_tokens or GEMINI_BATCH_MAX_INPUT_TOKENS
+        self.linger = GEMINI_BATCH_LINGER if linger is None else linger
+        self.limit = limit or asyncio.Semaphore(GEMINI_CONCURRENCY)
+        self.priority = priority
+        self.batches_sent = 0
+        self.fallbacks = 0
+        self._pending: list = []
+        self._pending_tokens = 0
+        self._futures: dict = {}
+        self._timer: asyncio.TimerHandle | None = None
+        # Batches in flight; the loop only keeps weak references to tasks
+        self._tasks: set = set()
+
+    async def analyze(self, errors: list) -> dict:
+        """Return the {title, description} for one session's errors"""
+        cached = await analysis_cache.get(errors)
+        if cached is not None:
+            return cached
+
+        fingerprint = error_set_fingerprint(errors)
+        future = self._futures.get(fingerprint)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._futures[fingerprint] = future
+            self._enqueue(fingerprint, errors)
+        return await asyncio.shield(future)
+
+    def _enqueue(self, fingerprint: str, errors: list):
+        tokens = _estimate_tokens(_error_summary(errors))
+        if self._pending and self._pending_tokens + tokens > self.max_input_tokens:
+            self._flush()
+
+        self._pending.append((fingerprint, errors))
+        self._pending_tokens += tokens
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.linger, self._flush)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending, self._pending_tokens = self._pending, [], 0
+        if batch:
+            task = asyncio.create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def close(self):
+        """Send whatever is still pending and wait for every batch in flight"""
+        self._flush()
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _run_batch(self, batch: list):
+        error_sets = [errors for _, errors in batch]
+        try:
+            async with self.limit:
+                analyses = await _run_batch_analysis_agent(error_sets, self.priority)
+            self.batches_sent += 1
+        except GeminiUnavailable as e:
+            for fingerprint, _ in batch:
+                future = self._futures.pop(fingerprint)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        except Exception as e:
+            logger.warning("Batch analysis failed", extra={"sessions": len(batch), "error": str(e)})
+            analyses = {}
+
+        async def resolve(index, fingerprint, errors):
+            future = self._futures[fingerprint]
+            try:
+                analysis = analyses.get(index)
+                if analysis is not None:
+                    await analysis_cache.set(errors, analysis)
+                else:
+                    self.fallbacks += 1
+                    async with self.limit:
+                        analysis = await analyze_errors_with_agent(errors, self.priority)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                return
+            finally:
+                del self._futures[fingerprint]
+            if not future.done():
+                future.set_result(analysis)
+
+        await asyncio.gather(*(
+            resolve(index, fingerprint, errors) for index, (fingerprint, errors) in enumerate(batch)
+        ))
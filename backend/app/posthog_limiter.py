@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict
+import httpx
+from dotenv import load_dotenv
+from .backoff import jittered_backoff, retry_after_seconds
+from .metrics import UPSTREAM_SECONDS, metrics, outcome_of
+
+load_dotenv(override=True)
+
+logger = logging.getLogger(__name__)
+
+# Adaptive in-flight limit per endpoint class
+POSTHOG_LIMIT_INITIAL = float(os.getenv('POSTHOG_LIMIT_INITIAL', '4'))
+POSTHOG_LIMIT_MIN = float(os.getenv('POSTHOG_LIMIT_MIN', '1'))
+POSTHOG_LIMIT_MAX = float(os.getenv('POSTHOG_LIMIT_MAX', '16'))
+# Responses slower than this shrink the limit instead of growing it
+POSTHOG_LATENCY_TARGET = float(os.getenv('POSTHOG_LATENCY_TARGET', '2'))
+# HogQL queries run server-side before the first byte comes back, so they get a looser target
+POSTHOG_QUERY_LATENCY_TARGET = float(os.getenv('POSTHOG_QUERY_LATENCY_TARGET', '15'))
+POSTHOG_MAX_RETRIES = int(os.getenv('POSTHOG_MAX_RETRIES', '4'))
+POSTHOG_BACKOFF_BASE = float(os.getenv('POSTHOG_BACKOFF_BASE', '0.5'))
+POSTHOG_BACKOFF_MAX = float(os.getenv('POSTHOG_BACKOFF_MAX', '30'))
+
+ENDPOINT_CLASSES = ("events", "query", "recordings", "sharing")
+LATENCY_TARGETS = {"query": POSTHOG_QUERY_LATENCY_TARGET}
+
+# Multiplicative decrease factors
+_THROTTLE_DECREASE = 0.5
+_ERROR_DECREASE = 0.75
+_SLOW_DECREASE = 0.9
+
+class AdaptiveLimiter:
+    """
+    Bounds in-flight requests with an additive-increase, multiplicative-decrease
+    limit. Every fast success grows the limit by 1/limit (about one slot per
+    round trip of the whole window); a 429 halves it, a server error or timeout
+    cuts it by a quarter and a response slower than `latency_target` trims it a
+    little. Decreases are applied at most once per `latency_target`, so a burst
+    of 429s from one window counts once. A Retry-After pauses new requests
+    until it has passed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: float = POSTHOG_LIMIT_INITIAL,
+        min_limit: float = POSTHOG_LIMIT_MIN,
+        max_limit: float = POSTHOG_LIMIT_MAX,
+        latency_target: float = POSTHOG_LATENCY_TARGET,
+    ):
+        self.name = name
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.retries = 0
+        self.latency_ewma = 0.0
+        self._waiters: deque = deque()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+
+    async def acquire(self):
+        await self.wait_if_paused()
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Handed a slot just as we were cancelled, give it back
+                self.release()
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    async def wait_if_paused(self):
+        delay = self._paused_until - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._paused_until - time.monotonic()
+
+    def on_success(self, latency: float):
+        self.latency_ewma = latency if not self.latency_ewma else 0.8 * self.latency_ewma + 0.2 * latency
+        if latency > self.latency_target:
+            self._decrease(_SLOW_DECREASE)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake()
+
+    def on_throttle(self, retry_after: float | None):
+        self.throttled += 1
+        self._decrease(_THROTTLE_DECREASE)
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+    def on_error(self):
+        self.errors += 1
+        self._decrease(_ERROR_DECREASE)
+
+    def _decrease(self, factor: float):
+        now = time.monotonic()
+        if now - self._last_decrease < self.latency_target:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * factor)
+
+    def stats(self) -> Dict:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": sum(1 for future in self._waiters if not future.done()),
+            "requests": self.requests,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "errors": self.errors,
+            "latency_ewma_seconds": round(self.latency_ewma, 4),
+            "paused_for": max(0.0, self._paused_until - time.monotonic())
+        }
+
+def _is_retryable_status(status_code: int) -> bool:
+    return status_code == 429 or status_code >= 500
+
+def is_retryable(error: httpx.HTTPError) -> bool:
+    """True for errors a later attempt may not hit: rate limits, server errors and transport failures"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return _is_retryable_status(error.response.status_code)
+    return isinstance(error, httpx.TransportError)
+
+def _hold_until_closed(response: httpx.Response, limiter: AdaptiveLimiter) -> httpx.Response:
+    """Release the limiter slot only when a streamed response is closed, so its body counts as in flight"""
+    aclose = response.aclose
+    released = False
+
+    async def aclose_and_release():
+        nonlocal released
+        try:
+            await aclose()
+        finally:
+            if not released:
+                released = True
+                limiter.release()
+
+    response.aclose = aclose_and_release
+    return response
+
+class PostHogLimiter:
+    """
+    Shared limiter for PostHog API calls with one AdaptiveLimiter per endpoint
+    class, so a throttled recordings listing does not starve event queries or
+    sharing calls, and slow HogQL queries only shrink their own limit. 429s, 5xx responses and transport errors are retried with
+    jittered exponential backoff that honors Retry-After.
+    """
+
+    def __init__(self, max_retries: int = POSTHOG_MAX_RETRIES):
+        self.max_retries = max_retries
+        self.limiters = {
+            name: AdaptiveLimiter(name, latency_target=LATENCY_TARGETS.get(name, POSTHOG_LATENCY_TARGET))
+            for name in ENDPOINT_CLASSES
+        }
+
+    async def send(self, endpoint: str, request: Callable[[], Awaitable[httpx.Response]], stream: bool = False) -> httpx.Response:
+        """
+        Run `request()` within the budget of `endpoint`, retrying throttled and
+        failed attempts. Once retries are exhausted the last response is returned
+        (callers still check its status) or the last transport error is raised.
+        With `stream`, the returned response keeps its slot until it is closed.
+        """
+        limiter = self.limiters[endpoint]
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            await limiter.acquire()
+            held = False
+            try:
+                # A Retry-After may have arrived while this request was queued
+                await limiter.wait_if_paused()
+                limiter.requests += 1
+                started = time.monotonic()
+                try:
+                    response = await request()
+                except httpx.TransportError:
+                    UPSTREAM_SECONDS.observe(time.monotonic() - started, upstream="posthog", endpoint=endpoint, outcome="error")
+                    limiter.on_error()
+                    if last_attempt:
+                        raise
+                    retry_after = None
+                else:
+                    UPSTREAM_SECONDS.observe(
+                        time.monotonic() - started,
+                        upstream="posthog",
+                        endpoint=endpoint,
+                        outcome=outcome_of(response.status_code)
+                    )
+                    if not _is_retryable_status(response.status_code):
+                        limiter.on_success(time.monotonic() - started)
+                        held = stream
+                        return _hold_until_closed(response, limiter) if stream else response
+                    retry_after = retry_after_seconds(response.headers)
+                    if response.status_code == 429:
+                        limiter.on_throttle(retry_after)
+                    else:
+                        limiter.on_error()
+                    if last_attempt:
+                        held = stream
+                        return _hold_until_closed(response, limiter) if stream else response
+                    # Streamed responses hold their connection until closed
+                    await response.aclose()
+            finally:
+                if not held:
+                    limiter.release()
+
+            limiter.retries += 1
+            delay = jittered_backoff(attempt, POSTHOG_BACKOFF_BASE, POSTHOG_BACKOFF_MAX, retry_after)
+            logger.warning(
+                "PostHog request failed, retrying",
+                extra={"endpoint": endpoint, "attempt": attempt + 1, "retry_in": round(delay, 2)}
+            )
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict:
+        return {name: limiter.stats() for name, limiter in self.limiters.items()}
+
+posthog_limiter = PostHogLimiter()
+
+metrics.gauge(
+    "loopy_posthog_limiter",
+    "Adaptive PostHog limiter state per endpoint class: current limit, requests in flight and waiting",
+    ["endpoint", "state"],
+    lambda: {
+        (endpoint, state): stats[state]
+        for endpoint, stats in posthog_limiter.stats().items()
+        for state in ("limit", "in_flight", "waiting")
+    }
+)
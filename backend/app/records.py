@@ -0,0 +1,138 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List
+
+# Compact records passed around the pipeline instead of per-item dicts. Each one
+# serializes straight to the API shape (to_dict / to_api) and, for sessions, to
+# the posthog table row (to_row).
+
+@dataclass(slots=True)
+class ErrorEvent:
+    """One $exception event reduced to the fields the app uses"""
+
+    event_id: str | None
+    timestamp: str | None
+    session_id: str | None
+    message: str | None
+    stacktrace: object = None
+    fingerprint: str | None = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "event_id": self.event_id,
+            "timestamp": self.timestamp,
+            "session_id": self.session_id,
+            "message": self.message,
+            "stacktrace": self.stacktrace,
+            "fingerprint": self.fingerprint
+        }
+
+@dataclass(slots=True)
+class ErrorCount:
+    """A distinct error of a session: its fingerprint, representative message and occurrences"""
+
+    fingerprint: str | None
+    message: str
+    count: int = 1
+
+    def to_dict(self) -> Dict:
+        return {"fingerprint": self.fingerprint, "message": self.message, "count": self.count}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ErrorCount":
+        return cls(data.get('fingerprint'), data['message'], data.get('count', 1))
+
+@dataclass(slots=True)
+class ProcessedSession:
+    """An analyzed session as returned by the pipeline and stored in the posthog table"""
+
+    session_id: str
+    errors: List[ErrorCount] = field(default_factory=list)
+    embed_url: str | None = None
+    title: str | None = None
+    description: str | None = None
+    start_time: str | None = None
+    end_time: str | None = None
+
+    def to_api(self) -> Dict:
+        return {
+            "session_id": self.session_id,
+            "errors": [error.to_dict() for error in self.errors],
+            "embed_url": self.embed_url,
+            "title": self.title,
+            "description": self.description,
+            "start_time": self.start_time,
+            "end_time": self.end_time
+        }
+
+    def to_row(self) -> Dict:
+        """The posthog table row, with one error tag per fingerprint and empty fields dropped"""
+        error_tags = {}
+        for error in self.errors:
+            error_tags.setdefault(error.fingerprint or error.message, error.message)
+
+        row = {
+            'video_link': self.embed_url,
+            'session_id': self.session_id,
+            'error_tags': list(error_tags.values()),
+            'title': self.title,
+            'description': self.description,
+            'start_time': self.start_time,
+            'end_time': self.end_time
+        }
+        return {k: v for k, v in row.items() if v is not None}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ProcessedSession":
+        """Build from the API shape; errors may be dicts or ErrorCount records"""
+        return cls(
+            session_id=data.get('session_id'),
+            errors=[
+                error if isinstance(error, ErrorCount) else ErrorCount.from_dict(error)
+                for error in data.get('errors', [])
+            ],
+            embed_url=data.get('embed_url'),
+            title=data.get('title'),
+            description=data.get('description'),
+            start_time=data.get('start_time'),
+            end_time=data.get('end_time')
+        )
+
+class ErrorEventBatch:
+    """
+    Columnar container for many error events: one list per field instead of one
+    object per event, so bulk work such as grouping reads whole columns. Rows
+    are materialized as ErrorEvent records only when iterated.
+    """
+
+    __slots__ = ("event_ids", "timestamps", "session_ids", "messages", "stacktraces", "fingerprints")
+
+    def __init__(self, events: Iterable[ErrorEvent] = ()):
+        self.event_ids: List = []
+        self.timestamps: List = []
+        self.session_ids: List = []
+        self.messages: List = []
+        self.stacktraces: List = []
+        self.fingerprints: List = []
+        for event in events:
+            self.append(event)
+
+    def add(self, event_id, timestamp, session_id, message, stacktrace=None, fingerprint=None):
+        self.event_ids.append(event_id)
+        self.timestamps.append(timestamp)
+        self.session_ids.append(session_id)
+        self.messages.append(message)
+        self.stacktraces.append(stacktrace)
+        self.fingerprints.append(fingerprint)
+
+    def append(self, event: ErrorEvent):
+        self.add(event.event_id, event.timestamp, event.session_id, event.message, event.stacktrace, event.fingerprint)
+
+    def __len__(self) -> int:
+        return len(self.event_ids)
+
+    def __iter__(self) -> Iterator[ErrorEvent]:
+        for row in zip(self.event_ids, self.timestamps, self.session_ids, self.messages, self.stacktraces, self.fingerprints):
+            yield ErrorEvent(*row)
+
+    def to_dicts(self) -> List[Dict]:
+        return [event.to_dict() for event in self]
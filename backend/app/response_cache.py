@@ -0,0 +1,283 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from .cache import LRUCache, SingleFlight
+from .metrics import CACHE_REQUESTS
+
+load_dotenv(override=True)
+
+logger = logging.getLogger(__name__)
+
+# 'memory' or 'disk'
+RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '512'))
+RESPONSE_CACHE_DIR = os.getenv('RESPONSE_CACHE_DIR', '.cache/responses')
+# How long past its TTL an entry may still be served while it is refreshed in the background
+RESPONSE_CACHE_STALE_SECONDS = float(os.getenv('RESPONSE_CACHE_STALE_SECONDS', '300'))
+# Bodies larger than this are passed through without being cached
+RESPONSE_CACHE_MAX_BODY_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BODY_BYTES', str(1024 * 1024)))
+
+# Per-route freshness, in seconds
+ROUTE_TTLS = {
+    "/get-session-recordings": float(os.getenv('RESPONSE_CACHE_TTL_RECORDINGS', '30')),
+    "/get-events": float(os.getenv('RESPONSE_CACHE_TTL_EVENTS', '30')),
+}
+
+class CachedResponse:
+    """A response body stored in the cache with its media type and ETag"""
+
+    __slots__ = ("body", "media_type", "etag", "created_at")
+
+    def __init__(self, body: bytes, media_type: str, etag: str | None = None, created_at: float | None = None):
+        self.body = body
+        self.media_type = media_type
+        self.etag = etag or '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.created_at = time.time() if created_at is None else created_at
+
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+class UncachedBody:
+    """
+    A body that outgrew the cache's size limit: the chunks read so far and the
+    iterator with the rest. Only one caller can take it and send it on.
+    """
+
+    __slots__ = ("head", "rest", "taken")
+
+    def __init__(self, head: list, rest: AsyncIterator[bytes]):
+        self.head = head
+        self.rest = rest
+        self.taken = False
+
+    def take(self) -> bool:
+        taken, self.taken = self.taken, True
+        return not taken
+
+    async def __aiter__(self):
+        for chunk in self.head:
+            yield chunk
+        async for chunk in self.rest:
+            yield chunk
+
+    async def aclose(self):
+        if hasattr(self.rest, "aclose"):
+            await self.rest.aclose()
+
+class MemoryBackend:
+    """Keeps cached responses in an in-process LRU"""
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE):
+        self._entries = LRUCache(max_size=max_size)
+
+    async def get(self, key: str) -> CachedResponse | None:
+        return self._entries.get(key)
+
+    async def set(self, key: str, entry: CachedResponse, ttl: float):
+        self._entries.set(key, entry, ttl=ttl)
+
+class DiskBackend:
+    """
+    Keeps cached responses as files in a local directory, one file per key: a
+    JSON header line followed by the raw body. The oldest files are removed
+    once there are more than `max_entries`.
+    """
+
+    def __init__(self, directory: str = RESPONSE_CACHE_DIR, max_entries: int = RESPONSE_CACHE_SIZE):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def _read(self, key: str) -> CachedResponse | None:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if header['expires_at'] <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return CachedResponse(body, header['media_type'], header['etag'], header['created_at'])
+
+    def _write(self, key: str, entry: CachedResponse, ttl: float):
+        header = {
+            "media_type": entry.media_type,
+            "etag": entry.etag,
+            "created_at": entry.created_at,
+            "expires_at": entry.created_at + ttl
+        }
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(header).encode() + b"\n")
+            f.write(entry.body)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        entries = [entry for entry in os.scandir(self.directory) if entry.is_file()]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    async def get(self, key: str) -> CachedResponse | None:
+        return await asyncio.to_thread(self._read, key)
+
+    async def set(self, key: str, entry: CachedResponse, ttl: float):
+        await asyncio.to_thread(self._write, key, entry, ttl)
+
+def cache_key(request: Request) -> str:
+    """Route path plus its query parameters in a stable order"""
+    params = sorted(request.query_params.multi_items())
+    return request.url.path + "?" + "&".join(f"{k}={v}" for k, v in params)
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+class ResponseCache:
+    """
+    Caches read-only route responses with per-route TTLs. Fresh entries are
+    served directly; entries past their TTL but within the stale window are
+    served immediately while one background refresh replaces them. Responses
+    carry an ETag and a matching If-None-Match gets a 304 with no body.
+    Concurrent misses for one key share a single call to the route, and bodies
+    over `max_body_bytes` are passed through uncached.
+    """
+
+    def __init__(self, backend, stale_seconds: float = RESPONSE_CACHE_STALE_SECONDS, max_body_bytes: int = RESPONSE_CACHE_MAX_BODY_BYTES):
+        self.backend = backend
+        self.stale_seconds = stale_seconds
+        self.max_body_bytes = max_body_bytes
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.uncached = 0
+        self._flight = SingleFlight()
+        self._refreshing: Dict[str, asyncio.Task] = {}
+
+    async def respond(
+        self,
+        request: Request,
+        produce: Callable[[], Awaitable[AsyncIterator[bytes]]],
+        media_type: str = "application/json",
+        ttl: float | None = None,
+        stream_misses: bool = False,
+    ) -> Response:
+        """
+        Answer request from the cache, or from `produce` on a miss. `produce` is
+        awaited to get an async iterator of body chunks, so it can raise an HTTP
+        error before any byte is sent. A miss is read up to `max_body_bytes`,
+        cached and served whole with its ETag. A larger body is not cached: with
+        `stream_misses` it is streamed to the client from the bytes read so far
+        instead of being buffered to the end.
+        """
+        key = cache_key(request)
+        ttl = ROUTE_TTLS.get(request.url.path, 30.0) if ttl is None else ttl
+
+        entry = await self.backend.get(key)
+        if entry is not None and entry.age() < ttl:
+            self.hits += 1
+            CACHE_REQUESTS.inc(cache="response", result="hit")
+            return self._serve(request, entry, ttl, "HIT")
+        if entry is not None and entry.age() < ttl + self.stale_seconds:
+            self.stale_hits += 1
+            CACHE_REQUESTS.inc(cache="response", result="stale")
+            self._refresh_later(key, produce, media_type, ttl)
+            return self._serve(request, entry, ttl, "STALE")
+
+        self.misses += 1
+        CACHE_REQUESTS.inc(cache="response", result="miss")
+        result = await self._flight.run(key, lambda: self._fill(key, produce, media_type, ttl))
+        if isinstance(result, CachedResponse):
+            return self._serve(request, result, ttl, "MISS")
+
+        # Too large to cache: whoever takes the leader's body sends it on, the
+        # other callers for this key run the route themselves
+        self.uncached += 1
+        chunks = result if result.take() else await produce()
+        if stream_misses:
+            return StreamingResponse(chunks, media_type=media_type, headers={"X-Cache": "MISS"})
+        body = b"".join([chunk async for chunk in chunks])
+        return Response(body, media_type=media_type, headers={"X-Cache": "MISS"})
+
+    def _serve(self, request: Request, entry: CachedResponse, ttl: float, status: str) -> Response:
+        max_age = max(0, int(ttl - entry.age()))
+        headers = {
+            "ETag": entry.etag,
+            "Cache-Control": f"private, max-age={max_age}, stale-while-revalidate={int(self.stale_seconds)}",
+            "X-Cache": status
+        }
+        if _etag_matches(request.headers.get("if-none-match"), entry.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(entry.body, media_type=entry.media_type, headers=headers)
+
+    async def _fill(self, key: str, produce, media_type: str, ttl: float) -> CachedResponse | UncachedBody:
+        """Read and cache the route's body, or stop at the size limit and hand back what was read"""
+        chunks = await produce()
+        buffered, size = [], 0
+        async for chunk in chunks:
+            buffered.append(chunk)
+            size += len(chunk)
+            if size > self.max_body_bytes:
+                return UncachedBody(buffered, chunks)
+        entry = CachedResponse(b"".join(buffered), media_type)
+        await self.backend.set(key, entry, ttl + self.stale_seconds)
+        return entry
+
+    def _refresh_later(self, key: str, produce, media_type: str, ttl: float):
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                result = await self._flight.run(key, lambda: self._fill(key, produce, media_type, ttl))
+                if isinstance(result, UncachedBody) and result.take():
+                    await result.aclose()
+            except Exception as e:
+                logger.warning("Background refresh failed", extra={"key": key, "error": str(e)})
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+    def stats(self) -> Dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "uncached": self.uncached
+        }
+
+def create_backend(name: str = RESPONSE_CACHE_BACKEND):
+    """Build the configured response cache backend"""
+    if name == "disk":
+        return DiskBackend()
+    if name == "memory":
+        return MemoryBackend()
+    raise ValueError(f"Unknown response cache backend: {name}")
+
+response_cache = ResponseCache(create_backend())
@@ -0,0 +1,138 @@
+import codecs
+import json
+from typing import AsyncIterator, List
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+_DELIMITERS = _WHITESPACE + ",:]}"
+
+class JSONArrayStream:
+    """
+    Incremental parser for the array stored under one key of a top-level JSON
+    object, e.g. the "results" of a PostHog response. Feed it bytes as they
+    arrive and it returns every element completed so far; other top-level
+    values are skipped and only the unparsed tail is kept in memory.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._state = "object"
+        self._current_key = None
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def feed(self, data: bytes) -> List:
+        if self._state == "done":
+            return []
+        self._buffer = self._buffer[self._pos:] + self._utf8.decode(data)
+        self._pos = 0
+        items = []
+        while self._step(items):
+            pass
+        return items
+
+    def close(self):
+        """Raise ValueError if the document ended before the array did"""
+        self.feed(b"")
+        if self._state != "done":
+            raise ValueError(f"Truncated JSON while reading '{self.key}'")
+
+    def _skip(self, characters: str = _WHITESPACE) -> str | None:
+        buffer = self._buffer
+        while self._pos < len(buffer) and buffer[self._pos] in characters:
+            self._pos += 1
+        return buffer[self._pos] if self._pos < len(buffer) else None
+
+    def _decode(self):
+        """
+        Decode the value at the current position. A value is only accepted once
+        a delimiter follows it, so a number split across chunks is not cut short.
+        Returns (value, True), or (None, False) when more bytes are needed.
+        """
+        try:
+            value, end = _decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            return None, False
+        if end >= len(self._buffer) or self._buffer[end] not in _DELIMITERS:
+            return None, False
+        self._pos = end
+        return value, True
+
+    def _step(self, items: list) -> bool:
+        """Advance the state machine once; False when more input is needed"""
+        state = self._state
+        if state == "object":
+            char = self._skip()
+            if char is None:
+                return False
+            if char != "{":
+                raise ValueError("Expected a JSON object")
+            self._pos += 1
+            self._state = "key"
+        elif state == "key":
+            char = self._skip(_WHITESPACE + ",")
+            if char is None:
+                return False
+            if char == "}":
+                self._state = "done"
+                return False
+            key, complete = self._decode()
+            if not complete:
+                return False
+            self._current_key = key
+            self._state = "colon"
+        elif state == "colon":
+            char = self._skip()
+            if char is None:
+                return False
+            if char != ":":
+                raise ValueError("Expected ':' after an object key")
+            self._pos += 1
+            self._state = "array" if self._current_key == self.key else "value"
+        elif state == "value":
+            if self._skip() is None:
+                return False
+            _, complete = self._decode()
+            if not complete:
+                return False
+            self._state = "key"
+        elif state == "array":
+            char = self._skip()
+            if char is None:
+                return False
+            if char != "[":
+                # null or another non-array value: nothing to yield
+                self._state = "value"
+                return True
+            self._pos += 1
+            self._state = "element"
+        elif state == "element":
+            char = self._skip(_WHITESPACE + ",")
+            if char is None:
+                return False
+            if char == "]":
+                # Everything after the array is of no interest
+                self._state = "done"
+                return False
+            item, complete = self._decode()
+            if not complete:
+                return False
+            items.append(item)
+        else:
+            return False
+        return True
+
+async def iter_json_array(chunks: AsyncIterator[bytes], key: str):
+    """Yield the elements of the top-level `key` array as the response body streams in"""
+    parser = JSONArrayStream(key)
+    async for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+        if parser.done:
+            return
+    parser.close()
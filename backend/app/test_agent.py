@@ -2,25 +2,16 @@ import asyncio
 import os
 import json
 from dotenv import load_dotenv
-from agents import Agent, Runner, trace, function_tool, OpenAIChatCompletionsModel
+from agents import Agent, Runner, function_tool, OpenAIChatCompletionsModel
 from openai import AsyncOpenAI
 from pydantic import BaseModel
+from .clients import GEMINI_BASE_URL, GEMINI_MODEL
 
 # Load environment variables
 load_dotenv(override=True)
 
 # Get Gemini API key
 gemini_api_key = os.getenv('GEMINI_API_KEY')
-GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
-
-# Initialize Gemini client for the agent using AsyncOpenAI
-gemini_client = AsyncOpenAI(
-    api_key=gemini_api_key,
-    base_url=GEMINI_BASE_URL
-)
-
-# Create the model for the agent
-gemini_model = OpenAIChatCompletionsModel(model="gemini-2.0-flash", openai_client=gemini_client)
 
 class ErrorAnalysisOutput(BaseModel):
     title: str
@@ -49,6 +40,18 @@ def analyze_session_errors(errors: list) -> dict:
     
     return {"prompt": prompt, "errors_count": len(errors)}
 
+def create_gemini_model():
+    """
+    Gemini model with its own client and retries; the shared client leaves
+    retries to the app's scheduler, which this script doesn't go through
+    """
+    gemini_client = AsyncOpenAI(
+        api_key=gemini_api_key,
+        base_url=GEMINI_BASE_URL,
+        max_retries=3
+    )
+    return OpenAIChatCompletionsModel(model=GEMINI_MODEL, openai_client=gemini_client)
+
 def create_analysis_agent():
     """Create an agent for analyzing session errors using Gemini API"""
     analysis_instructions = """You are an expert at analyzing JavaScript console errors and creating clear, actionable titles and descriptions for bug reports. Focus on the most impactful errors and provide insights that would help developers understand and fix the issues. MAX 2 SENTENCES\n\nUse the analyze_session_errors tool to process the errors and generate appropriate titles and descriptions."""
@@ -56,7 +59,7 @@ def create_analysis_agent():
     analysis_agent = Agent(
         name="Session Error Analyzer", 
         instructions=analysis_instructions, 
-        model=gemini_model,
+        model=create_gemini_model(),
         output_type=ErrorAnalysisOutput
     )
     
@@ -129,5 +132,6 @@ async def main():
     
     print("\n✅ Test completed!")
 
+# Run from backend/ with: python -m app.test_agent
 if __name__ == "__main__":
     asyncio.run(main()) 
\ No newline at end of file
@@ -0,0 +1,282 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import time
+from typing import Dict, List
+from dotenv import load_dotenv
+from . import posthog
+from .fingerprint import fingerprint_error
+from .metrics import WEBHOOK_EVENTS, metrics
+from .records import ErrorCount
+
+load_dotenv(override=True)
+
+logger = logging.getLogger(__name__)
+
+# Shared secret PostHog signs deliveries with; ingestion is off while it is empty
+POSTHOG_WEBHOOK_SECRET = os.getenv('POSTHOG_WEBHOOK_SECRET', '')
+# How far a delivery's timestamp may be from our clock, against replays
+WEBHOOK_SIGNATURE_TOLERANCE = float(os.getenv('WEBHOOK_SIGNATURE_TOLERANCE', '300'))
+# A session is analyzed once no event arrived for this long...
+WEBHOOK_SESSION_IDLE_SECONDS = float(os.getenv('WEBHOOK_SESSION_IDLE_SECONDS', '30'))
+# ...or once it has been accumulating for this long, so long sessions still report
+WEBHOOK_SESSION_MAX_SECONDS = float(os.getenv('WEBHOOK_SESSION_MAX_SECONDS', '600'))
+# Events that mark the end of a session and flush it right away
+WEBHOOK_SESSION_END_EVENTS = set(os.getenv('WEBHOOK_SESSION_END_EVENTS', '$session_end').split(','))
+# Open sessions kept in memory; past this the oldest are flushed early
+WEBHOOK_MAX_SESSIONS = int(os.getenv('WEBHOOK_MAX_SESSIONS', '10000'))
+# How often the flusher looks for sessions to analyze
+WEBHOOK_FLUSH_INTERVAL = float(os.getenv('WEBHOOK_FLUSH_INTERVAL', '1'))
+
+SIGNATURE_HEADER = "X-Webhook-Signature"
+TIMESTAMP_HEADER = "X-Webhook-Timestamp"
+
+def sign(body: bytes, timestamp: str, secret: str = POSTHOG_WEBHOOK_SECRET) -> str:
+    """Signature header value for a delivery: sha256=HMAC(secret, "<timestamp>.<body>")"""
+    digest = hmac.new(secret.encode(), timestamp.encode() + b"." + body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+def verify_signature(body: bytes, timestamp: str | None, signature: str | None, secret: str = POSTHOG_WEBHOOK_SECRET) -> bool:
+    """Check a delivery's signature and that its timestamp is recent"""
+    if not secret or not timestamp or not signature:
+        return False
+    try:
+        sent_at = float(timestamp)
+    except ValueError:
+        return False
+    if abs(time.time() - sent_at) > WEBHOOK_SIGNATURE_TOLERANCE:
+        return False
+    return hmac.compare_digest(sign(body, timestamp, secret), signature)
+
+def parse_events(payload) -> List[Dict]:
+    """
+    Events from a delivery: a single event, a list of them, or a {"batch": [...]}
+    or {"events": [...]} envelope. Events wrapped as {"event": {...}}, as
+    PostHog webhook destinations send them, are unwrapped.
+    """
+    if isinstance(payload, dict):
+        payload = payload.get('batch') or payload.get('events') or [payload]
+    if not isinstance(payload, list):
+        raise ValueError("Expected an event, a list of events or a batch")
+    events = []
+    for item in payload:
+        if isinstance(item, dict) and isinstance(item.get('event'), dict):
+            item = item['event']
+        if isinstance(item, dict):
+            events.append(item)
+    return events
+
+class SessionAccumulator:
+    """Error counts of one session gathered from webhook deliveries since its last flush"""
+
+    __slots__ = ("session_id", "errors", "events", "first_timestamp", "last_timestamp", "opened_at", "updated_at", "ended", "retry_at")
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.errors: Dict[str, ErrorCount] = {}
+        self.events = 0
+        self.first_timestamp: str | None = None
+        self.last_timestamp: str | None = None
+        self.opened_at = time.monotonic()
+        self.updated_at = self.opened_at
+        self.ended = False
+        self.retry_at = 0.0
+
+    def add(self, message: str, stacktrace=None, timestamp: str | None = None):
+        fingerprint = fingerprint_error(message, stacktrace)
+        error = self.errors.get(fingerprint)
+        if error is None:
+            self.errors[fingerprint] = ErrorCount(fingerprint, message)
+        else:
+            error.count += 1
+        self.events += 1
+        self.seen(timestamp)
+
+    def seen(self, timestamp: str | None):
+        self.updated_at = time.monotonic()
+        if timestamp:
+            # ISO-8601 UTC timestamps sort as text
+            if self.first_timestamp is None or timestamp < self.first_timestamp:
+                self.first_timestamp = timestamp
+            if self.last_timestamp is None or timestamp > self.last_timestamp:
+                self.last_timestamp = timestamp
+
+    def merge(self, other: "SessionAccumulator"):
+        """Fold in errors that arrived for the same session while this one was being flushed"""
+        for fingerprint, error in other.errors.items():
+            if fingerprint in self.errors:
+                self.errors[fingerprint].count += error.count
+            else:
+                self.errors[fingerprint] = error
+        self.events += other.events
+        self.seen(other.first_timestamp)
+        self.seen(other.last_timestamp)
+        self.ended = self.ended or other.ended
+
+    def due(self, now: float) -> bool:
+        if now < self.retry_at:
+            return False
+        return (
+            self.ended
+            or now - self.updated_at >= WEBHOOK_SESSION_IDLE_SECONDS
+            or now - self.opened_at >= WEBHOOK_SESSION_MAX_SECONDS
+        )
+
+    def recording(self) -> Dict:
+        """The recording fields the pipeline needs, as far as the events tell"""
+        return {
+            "id": self.session_id,
+            "start_time": self.first_timestamp,
+            "end_time": self.last_timestamp,
+            "ongoing": not self.ended
+        }
+
+class WebhookIngestor:
+    """
+    Accumulates $exception events pushed by PostHog per session and sends a
+    session to the analysis pipeline once it ends, goes idle or has been open
+    for WEBHOOK_SESSION_MAX_SECONDS. Sessions that cannot be analyzed yet
+    (another run holds them, or Gemini is unavailable) stay queued for the next
+    round. State is in memory, so pending sessions are flushed on shutdown.
+    """
+
+    def __init__(self):
+        self.sessions: Dict[str, SessionAccumulator] = {}
+        self.received = 0
+        self.accepted = 0
+        self.ignored = 0
+        self.flushed = 0
+        self.failed = 0
+        self._flush_lock = asyncio.Lock()
+        self._flushing: asyncio.Task | None = None
+
+    def ingest(self, events: List[Dict]) -> Dict:
+        """Add a delivery's events to their sessions' accumulators"""
+        accepted = ignored = 0
+        for event in events:
+            name = event.get('event')
+            props = event.get('properties') or {}
+            session_id = props.get('$session_id')
+            if not session_id:
+                ignored += 1
+                continue
+            if name == '$exception':
+                message, stacktrace = posthog._extract_exception(props)
+                if not message:
+                    ignored += 1
+                    continue
+                accumulator = self.sessions.get(session_id)
+                if accumulator is None:
+                    accumulator = self.sessions[session_id] = SessionAccumulator(session_id)
+                accumulator.add(message, stacktrace, event.get('timestamp'))
+                accepted += 1
+            elif name in WEBHOOK_SESSION_END_EVENTS and session_id in self.sessions:
+                self.sessions[session_id].ended = True
+                self.sessions[session_id].seen(event.get('timestamp'))
+                accepted += 1
+            else:
+                ignored += 1
+
+        self.received += len(events)
+        self.accepted += accepted
+        self.ignored += ignored
+        WEBHOOK_EVENTS.inc(accepted, result="accepted")
+        WEBHOOK_EVENTS.inc(ignored, result="ignored")
+        return {"received": len(events), "accepted": accepted, "ignored": ignored}
+
+    def _take_due(self, force: bool) -> List[SessionAccumulator]:
+        now = time.monotonic()
+        due = [acc for acc in self.sessions.values() if force or acc.due(now)]
+        overflow = len(self.sessions) - len(due) - WEBHOOK_MAX_SESSIONS
+        if overflow > 0:
+            waiting = sorted((acc for acc in self.sessions.values() if not acc.due(now)), key=lambda acc: acc.opened_at)
+            due.extend(waiting[:overflow])
+        for accumulator in due:
+            del self.sessions[accumulator.session_id]
+        return due
+
+    def _requeue(self, accumulator: SessionAccumulator):
+        # Back off for one idle period instead of retrying on every tick
+        accumulator.retry_at = time.monotonic() + WEBHOOK_SESSION_IDLE_SECONDS
+        newer = self.sessions.get(accumulator.session_id)
+        if newer is not None:
+            accumulator.merge(newer)
+        self.sessions[accumulator.session_id] = accumulator
+
+    async def flush(self, force: bool = False) -> int:
+        """Analyze every session that is due, or all of them with `force`; returns how many were saved"""
+        async with self._flush_lock:
+            due = self._take_due(force)
+            if not due:
+                return 0
+            try:
+                results, busy = await posthog.analyze_pushed_sessions(
+                    [(acc.recording(), list(acc.errors.values())) for acc in due]
+                )
+            except BaseException:
+                # Nothing is known to be saved, so every taken session goes back,
+                # also when the flush is cancelled
+                for accumulator in due:
+                    self._requeue(accumulator)
+                raise
+
+        saved = 0
+        for accumulator in due:
+            result = results.get(accumulator.session_id)
+            if isinstance(result, BaseException):
+                self.failed += 1
+                logger.warning("Pushed session failed, will retry", extra={"session_id": accumulator.session_id, "error": str(result)})
+                self._requeue(accumulator)
+            elif accumulator.session_id in busy:
+                self._requeue(accumulator)
+            else:
+                saved += 1
+        self.flushed += saved
+        if saved:
+            logger.info("Analyzed pushed sessions", extra={"sessions": saved, "pending": len(self.sessions)})
+        return saved
+
+    async def run(self, interval: float = WEBHOOK_FLUSH_INTERVAL):
+        """Flush due sessions every `interval` seconds until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            # Shielded, so cancelling this loop at shutdown lets a running flush finish
+            self._flushing = asyncio.ensure_future(self.flush())
+            try:
+                await asyncio.shield(self._flushing)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Webhook flush failed", extra={"error": str(e)})
+
+    async def close(self):
+        """Wait for a flush in progress, then analyze every session still open"""
+        if self._flushing is not None and not self._flushing.done():
+            try:
+                await self._flushing
+            except Exception as e:
+                logger.error("Webhook flush failed", extra={"error": str(e)})
+        await self.flush(force=True)
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": bool(POSTHOG_WEBHOOK_SECRET),
+            "open_sessions": len(self.sessions),
+            "pending_errors": sum(len(acc.errors) for acc in self.sessions.values()),
+            "received": self.received,
+            "accepted": self.accepted,
+            "ignored": self.ignored,
+            "flushed": self.flushed,
+            "failed": self.failed
+        }
+
+webhook_ingestor = WebhookIngestor()
+
+metrics.gauge(
+    "loopy_webhook_open_sessions",
+    "Sessions accumulating pushed errors and not yet analyzed",
+    [],
+    lambda: {(): len(webhook_ingestor.sessions)}
+)
@@ -0,0 +1,366 @@
+"""
+Local stand-ins for the services the backend talks to, served from one
+process under three path prefixes:
+
+    /posthog   session_recordings listing, /events/, HogQL /query/ (bulk and projected) and sharing
+    /gemini    OpenAI-compatible /chat/completions answering with structured JSON
+    /supabase  a PostgREST-compatible /rest/v1/{table} over in-memory tables
+
+Each service has its own latency and error-rate knobs. Data volume is set with
+--sessions; every session gets --errors-per-session exceptions drawn from
+--distinct-errors message templates. Request counts are available at /__stats.
+
+Run from backend/:
+
+    python -m benchmarks.fakes --port 8765 --sessions 1000 --posthog-latency 0.05
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+BASE_TIME = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+# Primary keys of the tables the backend uses
+TABLE_KEYS = {"posthog": "session_id", "recordings": "id", "pipeline_checkpoints": "name"}
+
+class FakeData:
+    """Deterministic sessions and exceptions derived from the session index"""
+
+    def __init__(self, sessions: int, errors_per_session: int, distinct_errors: int, ongoing_fraction: float):
+        self.sessions = sessions
+        self.errors_per_session = errors_per_session
+        self.distinct_errors = max(1, distinct_errors)
+        self.ongoing_every = int(1 / ongoing_fraction) if ongoing_fraction > 0 else 0
+        self.shared: set = set()
+
+    def session_id(self, index: int) -> str:
+        return f"bench-{index:07d}"
+
+    def index_of(self, session_id: str) -> int | None:
+        match = re.fullmatch(r"bench-(\d+)", session_id or "")
+        if not match or int(match.group(1)) >= self.sessions:
+            return None
+        return int(match.group(1))
+
+    def recording(self, index: int) -> dict:
+        start = BASE_TIME + timedelta(seconds=index)
+        return {
+            "id": self.session_id(index),
+            "distinct_id": f"user-{index % 997}",
+            "start_time": start.isoformat(),
+            "end_time": (start + timedelta(minutes=5)).isoformat(),
+            "recording_duration": 300,
+            "console_error_count": self.errors_per_session,
+            "ongoing": bool(self.ongoing_every) and index % self.ongoing_every == 0
+        }
+
+    def errors(self, index: int) -> list:
+        """(message, exception_list) pairs; messages embed per-session noise the fingerprinter strips"""
+        errors = []
+        for n in range(self.errors_per_session):
+            template = (index * 7 + n) % self.distinct_errors
+            message = (
+                f"TypeError: Cannot read properties of undefined (reading 'field{template}') "
+                f"at https://app.example.com/assets/main.{index:x}.js:{100 + n}:{17 + template}"
+            )
+            errors.append((message, [{"type": "TypeError", "value": message}]))
+        return errors
+
+class ServiceKnobs:
+    def __init__(self, latency: float, error_rate: float, error_status: int, retry_after: float):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+
+def _filter_value(value: str):
+    """Split a PostgREST filter like 'eq.x' or 'in.(a,b)' into (operator, operand)"""
+    operator, _, operand = value.partition(".")
+    if operator == "in":
+        items = operand.strip("()")
+        return operator, [item.strip().strip('"') for item in items.split(",")] if items else []
+    return operator, operand
+
+def select_columns(query: str) -> list:
+    """The column expressions of a HogQL query's SELECT list"""
+    match = re.search(r"\bSELECT\b(.*?)\bFROM\b", query, re.IGNORECASE | re.DOTALL)
+    return [column.strip() for column in match.group(1).split(",")] if match else []
+
+def _matches(row: dict, filters: list) -> bool:
+    for column, (operator, operand) in filters:
+        value = row.get(column)
+        text = None if value is None else str(value)
+        if operator == "eq" and text != operand:
+            return False
+        if operator == "neq" and text == operand:
+            return False
+        if operator == "in" and text not in operand:
+            return False
+        if operator in ("gt", "gte", "lt", "lte"):
+            if text is None:
+                return False
+            if operator == "gt" and not text > operand:
+                return False
+            if operator == "gte" and not text >= operand:
+                return False
+            if operator == "lt" and not text < operand:
+                return False
+            if operator == "lte" and not text <= operand:
+                return False
+    return True
+
+def create_app(data: FakeData, knobs: dict) -> FastAPI:
+    app = FastAPI()
+    tables = {name: {} for name in TABLE_KEYS}
+    counts = Counter()
+
+    @app.middleware("http")
+    async def inject(request: Request, call_next):
+        service = request.url.path.strip("/").split("/", 1)[0]
+        service_knobs = knobs.get(service)
+        if service_knobs is None:
+            return await call_next(request)
+        counts[service] += 1
+        if service_knobs.latency:
+            await asyncio.sleep(service_knobs.latency * random.uniform(0.5, 1.5))
+        if service_knobs.error_rate and random.random() < service_knobs.error_rate:
+            counts[f"{service}_errors"] += 1
+            headers = {}
+            if service_knobs.error_status == 429:
+                headers["Retry-After"] = str(service_knobs.retry_after)
+            return JSONResponse(
+                {"message": "injected failure", "code": str(service_knobs.error_status)},
+                status_code=service_knobs.error_status,
+                headers=headers
+            )
+        return await call_next(request)
+
+    @app.get("/__stats")
+    async def stats():
+        return {"requests": dict(counts), "rows": {name: len(rows) for name, rows in tables.items()}}
+
+    @app.get("/__health")
+    async def health():
+        return {"ok": True}
+
+    # PostHog
+
+    @app.get("/posthog/api/projects/{project_id}/session_recordings/")
+    async def session_recordings(request: Request, project_id: str):
+        params = request.query_params
+        limit = int(params.get("limit", 100))
+        offset = int(params.get("offset", 0))
+        if params.get("session_ids"):
+            indexes = [data.index_of(sid) for sid in json.loads(params["session_ids"])]
+            indexes = [index for index in indexes if index is not None]
+        else:
+            indexes = range(data.sessions)
+        page = [data.recording(index) for index in indexes[offset:offset + limit]]
+        has_next = offset + limit < len(indexes)
+        next_url = None
+        if has_next:
+            next_url = str(request.url.include_query_params(offset=offset + limit))
+        return {"results": page, "has_next": has_next, "next": next_url}
+
+    @app.get("/posthog/api/projects/{project_id}/events/")
+    async def events(request: Request, project_id: str):
+        params = request.query_params
+        limit = int(params.get("limit", 100))
+        session_id = params.get("properties.$session_id")
+        if params.get("properties"):
+            for prop in json.loads(params["properties"]):
+                if prop.get("key") == "$session_id":
+                    session_id = prop.get("value")
+        indexes = [data.index_of(session_id)] if session_id else range(min(data.sessions, limit))
+        results = []
+        for index in indexes:
+            if index is None:
+                continue
+            for n, (_, exception_list) in enumerate(data.errors(index)):
+                results.append({
+                    "id": f"{data.session_id(index)}-{n}",
+                    "timestamp": (BASE_TIME + timedelta(seconds=index, milliseconds=n)).isoformat(),
+                    "properties": {"$session_id": data.session_id(index), "$exception_list": exception_list}
+                })
+        return {"results": results[:limit]}
+
+    @app.post("/posthog/api/projects/{project_id}/query/")
+    async def query(request: Request, project_id: str):
+        body = (await request.json())["query"]
+        values = body.get("values", {})
+        rows = []
+        columns = select_columns(body["query"])
+        if columns and columns[0] == "uuid":
+            # Projected exception events for /get-events, newest first
+            if values.get("session_id"):
+                indexes = [data.index_of(values["session_id"])]
+            else:
+                indexes = range(data.sessions - 1, max(-1, data.sessions - 1 - values.get("limit", 100)), -1)
+            for index in indexes:
+                if index is None:
+                    continue
+                for n, (_, exception_list) in enumerate(data.errors(index)):
+                    timestamp = (BASE_TIME + timedelta(seconds=index, milliseconds=n)).isoformat()
+                    rows.append([f"{data.session_id(index)}-{n}", timestamp, data.session_id(index),
+                                 json.dumps(exception_list), None, None])
+            return {"results": rows[:values.get("limit", len(rows))]}
+
+        for session_id in values.get("session_ids", []):
+            index = data.index_of(session_id)
+            if index is None:
+                continue
+            for _, exception_list in data.errors(index):
+                rows.append([session_id, json.dumps(exception_list), None, None])
+        offset = values.get("offset", 0)
+        return {"results": rows[offset:offset + values.get("limit", len(rows))]}
+
+    @app.get("/posthog/api/projects/{project_id}/session_recordings/{session_id}/sharing")
+    async def sharing_status(project_id: str, session_id: str):
+        enabled = session_id in data.shared
+        return {"enabled": enabled, "access_token": f"share-{session_id}" if enabled else None}
+
+    @app.patch("/posthog/api/projects/{project_id}/session_recordings/{session_id}/sharing")
+    async def enable_sharing(project_id: str, session_id: str):
+        data.shared.add(session_id)
+        return {"enabled": True, "access_token": f"share-{session_id}"}
+
+    # Gemini
+
+    @app.post("/gemini/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = "\n".join(
+            message["content"] for message in body.get("messages", [])
+            if message.get("role") == "user" and isinstance(message.get("content"), str)
+        )
+        labels = re.findall(r"Session (S\d+):", prompt)
+        if labels:
+            content = {"results": [
+                {"session_id": label, "title": f"Bug report {label}", "description": f"Errors seen in {label}."}
+                for label in labels
+            ]}
+        else:
+            content = {"title": "Undefined property access", "description": "A component reads a field of an undefined value."}
+        completion = json.dumps(content)
+        return {
+            "id": f"chatcmpl-{random.getrandbits(64):x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": completion},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(completion) // 4,
+                "total_tokens": (len(prompt) + len(completion)) // 4
+            }
+        }
+
+    # Supabase (PostgREST)
+
+    def table_filters(request: Request) -> list:
+        reserved = {"select", "on_conflict", "columns", "limit", "offset", "order"}
+        return [
+            (column, _filter_value(value))
+            for column, value in request.query_params.multi_items()
+            if column not in reserved
+        ]
+
+    def project(row: dict, select: str) -> dict:
+        if not select or select == "*":
+            return dict(row)
+        return {column: row.get(column) for column in select.split(",")}
+
+    @app.get("/supabase/rest/v1/{table}")
+    async def select_rows(request: Request, table: str):
+        rows = tables.setdefault(table, {})
+        filters = table_filters(request)
+        select = request.query_params.get("select", "*")
+        result = [project(row, select) for row in rows.values() if _matches(row, filters)]
+        limit = request.query_params.get("limit")
+        return result[:int(limit)] if limit else result
+
+    @app.post("/supabase/rest/v1/{table}")
+    async def insert_rows(request: Request, table: str):
+        rows = tables.setdefault(table, {})
+        payload = await request.json()
+        payload = payload if isinstance(payload, list) else [payload]
+        key = request.query_params.get("on_conflict") or TABLE_KEYS.get(table, "id")
+        upsert = "resolution=merge-duplicates" in request.headers.get("prefer", "")
+        written = []
+        for row in payload:
+            row_key = row.get(key) or f"row-{len(rows)}"
+            if row_key in rows and not upsert:
+                return JSONResponse({"message": "duplicate key value", "code": "23505"}, status_code=409)
+            rows[row_key] = {**rows.get(row_key, {}), **row}
+            written.append(rows[row_key])
+        return JSONResponse(written, status_code=201)
+
+    @app.patch("/supabase/rest/v1/{table}")
+    async def update_rows(request: Request, table: str):
+        rows = tables.setdefault(table, {})
+        updates = await request.json()
+        filters = table_filters(request)
+        updated = []
+        for row in rows.values():
+            if _matches(row, filters):
+                row.update(updates)
+                updated.append(dict(row))
+        return updated
+
+    @app.delete("/supabase/rest/v1/{table}")
+    async def delete_rows(request: Request, table: str):
+        rows = tables.setdefault(table, {})
+        filters = table_filters(request)
+        deleted = [key for key, row in rows.items() if _matches(row, filters)]
+        return [rows.pop(key) for key in deleted]
+
+    return app
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Knobs shared by this server and the benchmark driver"""
+    parser.add_argument("--errors-per-session", type=int, default=5)
+    parser.add_argument("--distinct-errors", type=int, default=50, help="Distinct error templates across all sessions")
+    parser.add_argument("--ongoing-fraction", type=float, default=0.0, help="Share of recordings reported as ongoing")
+    for service, latency, status in (("posthog", 0.02, 429), ("gemini", 0.2, 429), ("supabase", 0.01, 503)):
+        parser.add_argument(f"--{service}-latency", type=float, default=latency, help="Mean added latency in seconds")
+        parser.add_argument(f"--{service}-error-rate", type=float, default=0.0, help="Share of requests that fail")
+        parser.add_argument(f"--{service}-error-status", type=int, default=status)
+    parser.add_argument("--retry-after", type=float, default=0, help="Retry-After sent with injected 429s")
+
+def knobs_from_args(args) -> dict:
+    return {
+        service: ServiceKnobs(
+            getattr(args, f"{service}_latency"),
+            getattr(args, f"{service}_error_rate"),
+            getattr(args, f"{service}_error_status"),
+            args.retry_after
+        )
+        for service in ("posthog", "gemini", "supabase")
+    }
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--sessions", type=int, default=1000)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    data = FakeData(args.sessions, args.errors_per_session, args.distinct_errors, args.ongoing_fraction)
+    uvicorn.run(create_app(data, knobs_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+Offline end-to-end benchmark of the analysis pipeline and read routes.
+
+For each scale a fresh fake PostHog/Gemini/Supabase server (benchmarks.fakes)
+is started with that many sessions, then a fresh interpreter points the app at
+it, runs analyze_recordings_for_errors once and drives the read routes through
+the ASGI app. Throughput and p50/p95/p99 latency are reported per stage:
+
+    pipeline            the whole run
+    session             one session through _process_recording
+    posthog.<class>     one PostHog request (events, recordings, sharing) incl. retries
+    posthog.errors_bulk one bulk exception fetch for a page of sessions
+    gemini              one Gemini call through the scheduler, incl. queueing
+    supabase.lookup     one batched session lookup
+    supabase.write      one batched session upsert
+    route <path>        one request to a FastAPI route
+
+backend/.env is never read, so real credentials are not used.
+
+Run from backend/:
+
+    python -m benchmarks.pipeline --scales 10,1000
+    python -m benchmarks.pipeline --scales 10,1000,100000 --write-baseline benchmarks/pipeline_baseline.json
+    python -m benchmarks.pipeline --scales 10,1000 --baseline benchmarks/pipeline_baseline.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+import httpx
+from . import fakes
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentiles(samples: list) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "p50": at(0.50),
+        "p95": at(0.95),
+        "p99": at(0.99)
+    }
+
+class StageTimer:
+    """Collects wall-clock samples per stage by wrapping module attributes"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def wrap_async(self, owner, attr: str, stage):
+        original = getattr(owner, attr)
+
+        async def timed(*args, **kwargs):
+            name = stage(*args, **kwargs) if callable(stage) else stage
+            started = time.perf_counter()
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                self.samples[name].append(time.perf_counter() - started)
+
+        setattr(owner, attr, timed)
+
+    def wrap_sync(self, owner, attr: str, stage: str):
+        original = getattr(owner, attr)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.samples[stage].append(time.perf_counter() - started)
+
+        setattr(owner, attr, timed)
+
+    def summary(self) -> dict:
+        return {stage: percentiles(samples) for stage, samples in sorted(self.samples.items())}
+
+def _configure_environment(fake_url: str, args):
+    """Point the app at the fakes; must run before any app module is imported"""
+    import dotenv
+
+    # Module-level load_dotenv(override=True) calls would pull real credentials from backend/.env
+    dotenv.load_dotenv = lambda *a, **k: False
+    os.environ.update({
+        "POSTHOG_HOST": f"{fake_url}/posthog",
+        "POSTHOG_API_KEY": "phx_bench",
+        "POSTHOG_PROJECT_ID": "1",
+        "GEMINI_BASE_URL": f"{fake_url}/gemini/",
+        "GEMINI_API_KEY": "bench",
+        "SUPABASE_URL": f"{fake_url}/supabase",
+        "SUPABASE_KEY": "bench.bench.bench",
+        "ANALYSIS_CACHE_PATH": "",
+        "ERROR_INDEX_PATH": "",
+        "ERROR_INDEX_BACKFILL": "false",
+        "RESPONSE_CACHE_BACKEND": "memory",
+        "PIPELINE_SCHEDULE_SECONDS": "0",
+        "GEMINI_REQUESTS_PER_MINUTE": str(args.gemini_rpm),
+        "GEMINI_TOKENS_PER_MINUTE": str(args.gemini_tpm),
+        "OPENAI_AGENTS_DISABLE_TRACING": "1",
+    })
+
+async def _drive_routes(app, session_ids: list, requests: int, concurrency: int, timer: StageTimer) -> dict:
+    """Hit the read routes through the ASGI app and return requests/s per route"""
+    transport = httpx.ASGITransport(app=app)
+    paths = [
+        ("/get-session-recordings", [{"min_console_errors": 1}] * 3),
+        ("/get-events", [{"session_id": session_ids[n % len(session_ids)]} for n in range(requests)]),
+        ("/check-session-sharing/{session_id}", [{"session_id": session_ids[n % len(session_ids)]} for n in range(requests)]),
+    ]
+    throughput = {}
+    limit = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for path, calls in paths:
+            async def call(params):
+                url = path
+                if "{session_id}" in path:
+                    url, params = path.format(**params), None
+                async with limit:
+                    started = time.perf_counter()
+                    response = await client.get(url, params=params)
+                    timer.samples[f"route {path}"].append(time.perf_counter() - started)
+                    response.raise_for_status()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(call(params) for params in calls))
+            throughput[path] = len(calls) / (time.perf_counter() - started)
+    return throughput
+
+async def _probe(args) -> dict:
+    _configure_environment(args.fake_url, args)
+
+    from app import database, main, posthog
+
+    timer = StageTimer()
+    timer.wrap_async(posthog, "_posthog_request", lambda endpoint, *a, **k: f"posthog.{endpoint}")
+    timer.wrap_async(posthog, "get_errors_for_sessions", "posthog.errors_bulk")
+    timer.wrap_async(posthog, "_process_recording", "session")
+    timer.wrap_async(posthog.gemini_scheduler, "run", "gemini")
+    timer.wrap_sync(database, "get_sessions_by_ids", "supabase.lookup")
+    timer.wrap_sync(database, "save_processed_sessions", "supabase.write")
+
+    started = time.perf_counter()
+    results = await posthog.analyze_recordings_for_errors(
+        max_sessions_in_flight=args.max_in_flight,
+        batch_analysis=args.batch_analysis
+    )
+    elapsed = time.perf_counter() - started
+    timer.samples["pipeline"].append(elapsed)
+
+    session_ids = [result["session_id"] for result in results] or ["bench-0000000"]
+    route_throughput = await _drive_routes(main.app, session_ids, args.route_requests, args.route_concurrency, timer)
+    await posthog.close_posthog_client()
+
+    return {
+        "sessions": len(results),
+        "pipeline_seconds": elapsed,
+        "sessions_per_second": len(results) / elapsed if elapsed else None,
+        "route_requests_per_second": route_throughput,
+        "stages": timer.summary(),
+        "gemini_scheduler": posthog.gemini_scheduler.stats(),
+        "posthog_limiter": posthog.posthog_limiter.stats()
+    }
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _fake_arguments(args) -> list:
+    forwarded = ["--errors-per-session", str(args.errors_per_session),
+                 "--distinct-errors", str(args.distinct_errors),
+                 "--ongoing-fraction", str(args.ongoing_fraction),
+                 "--retry-after", str(args.retry_after)]
+    for service in ("posthog", "gemini", "supabase"):
+        for knob in ("latency", "error_rate", "error_status"):
+            forwarded += [f"--{service}-{knob.replace('_', '-')}", str(getattr(args, f"{service}_{knob}"))]
+    return forwarded
+
+def run_scale(sessions: int, args) -> dict:
+    """Start the fakes with `sessions` sessions and run one probe against them"""
+    port = _free_port()
+    fake_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fakes", "--port", str(port), "--sessions", str(sessions)] + _fake_arguments(args),
+        cwd=BACKEND_DIR
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(f"{fake_url}/__health").raise_for_status()
+                break
+            except httpx.HTTPError:
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise RuntimeError("Fake services did not start")
+                time.sleep(0.1)
+
+        # App logs go to stderr (stray prints are moved there by the probe), which is dropped here
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.pipeline", "--probe", "--fake-url", fake_url] + sys.argv[1:],
+            cwd=BACKEND_DIR,
+            env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1"),
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL if not args.verbose else None,
+            text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result["upstream"] = httpx.get(f"{fake_url}/__stats").json()
+        return result
+    finally:
+        server.terminate()
+        server.wait()
+
+def compare(baseline: dict, results: dict, tolerance: float) -> dict:
+    """Regressions of pipeline time and per-stage p95 beyond `tolerance`, keyed by scale"""
+    regressions = {}
+    for scale, result in results.items():
+        expected = baseline.get(scale)
+        if not expected:
+            continue
+        checks = {"pipeline_seconds": (expected.get("pipeline_seconds"), result["pipeline_seconds"])}
+        for stage, summary in result["stages"].items():
+            if "p95" in summary and "p95" in expected.get("stages", {}).get(stage, {}):
+                checks[f"{stage} p95"] = (expected["stages"][stage]["p95"], summary["p95"])
+        found = {
+            metric: {"baseline": before, "current": after}
+            for metric, (before, after) in checks.items()
+            if before and after > before * (1 + tolerance)
+        }
+        if found:
+            regressions[scale] = found
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="10,1000,100000", help="Comma separated session counts")
+    parser.add_argument("--max-in-flight", type=int, default=None)
+    parser.add_argument("--batch-analysis", action="store_true")
+    parser.add_argument("--gemini-rpm", type=float, default=0, help="Scheduler request budget, 0 = unlimited")
+    parser.add_argument("--gemini-tpm", type=float, default=0, help="Scheduler token budget, 0 = unlimited")
+    parser.add_argument("--route-requests", type=int, default=200, help="Requests per per-session route")
+    parser.add_argument("--route-concurrency", type=int, default=16)
+    parser.add_argument("--baseline", help="Compare against this JSON baseline and fail on regressions")
+    parser.add_argument("--write-baseline", help="Write the results of this run as a JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown over the baseline (0.25 = 25%%)")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's log output")
+    parser.add_argument("--probe", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--fake-url", help=argparse.SUPPRESS)
+    fakes.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.probe:
+        with contextlib.redirect_stdout(sys.stderr):
+            result = asyncio.run(_probe(args))
+        print(json.dumps(result))
+        return
+
+    results = {}
+    for scale in args.scales.split(","):
+        results[scale] = run_scale(int(scale), args)
+        print(f"{scale} sessions: {results[scale]['pipeline_seconds']:.2f}s "
+              f"({results[scale]['sessions_per_second']:.1f} sessions/s)", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+    if args.write_baseline:
+        with open(args.write_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.tolerance)
+        if regressions:
+            print(json.dumps({"regressions": regressions}, indent=2))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
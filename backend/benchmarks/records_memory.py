@@ -0,0 +1,123 @@
+"""
+Memory benchmark for the pipeline's record types.
+
+Builds the same synthetic error events, error counts and processed sessions as
+plain dicts, as the slotted records in app.records, and (for events) as an
+ErrorEventBatch, and reports the bytes tracemalloc sees allocated for each.
+Field values are built up front so mostly the containers are measured.
+
+Run from backend/:
+
+    python -m benchmarks.records_memory --items 100000
+"""
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+
+from app.records import ErrorCount, ErrorEvent, ErrorEventBatch, ProcessedSession
+
+def _fields(count: int) -> list:
+    return [
+        (
+            f"evt-{i}",
+            f"2024-01-01T00:00:{i % 60:02d}Z",
+            f"session-{i // 10}",
+            f"TypeError: Cannot read properties of undefined (reading 'x{i % 50}')",
+            None,
+            f"{i % 50:016x}"
+        )
+        for i in range(count)
+    ]
+
+def _measure(build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        built = build()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del built
+    return after - before
+
+def _event_dict(event_id, timestamp, session_id, message, stacktrace, fingerprint) -> dict:
+    return {
+        "event_id": event_id,
+        "timestamp": timestamp,
+        "session_id": session_id,
+        "message": message,
+        "stacktrace": stacktrace,
+        "fingerprint": fingerprint
+    }
+
+def _session_dict(index: int, errors: list) -> dict:
+    return {
+        "session_id": f"session-{index}",
+        "errors": errors,
+        "embed_url": "https://example.com/embed/token",
+        "title": "Checkout crashes on undefined cart",
+        "description": "The cart object is read before it is loaded.",
+        "start_time": "2024-01-01T00:00:00Z",
+        "end_time": "2024-01-01T00:05:00Z"
+    }
+
+def _session_record(index: int, errors: list) -> ProcessedSession:
+    return ProcessedSession(
+        session_id=f"session-{index}",
+        errors=errors,
+        embed_url="https://example.com/embed/token",
+        title="Checkout crashes on undefined cart",
+        description="The cart object is read before it is loaded.",
+        start_time="2024-01-01T00:00:00Z",
+        end_time="2024-01-01T00:05:00Z"
+    )
+
+def run(items: int) -> dict:
+    rows = _fields(items)
+    sessions = max(1, items // 10)
+
+    def batch():
+        events = ErrorEventBatch()
+        for row in rows:
+            events.add(*row)
+        return events
+
+    results = {
+        "error_events": {
+            "dict": _measure(lambda: [_event_dict(*row) for row in rows]),
+            "record": _measure(lambda: [ErrorEvent(*row) for row in rows]),
+            "batch": _measure(batch)
+        },
+        "error_counts": {
+            "dict": _measure(lambda: [
+                {"fingerprint": row[5], "message": row[3], "count": 1} for row in rows
+            ]),
+            "record": _measure(lambda: [ErrorCount(row[5], row[3]) for row in rows])
+        },
+        "processed_sessions": {
+            "dict": _measure(lambda: [
+                _session_dict(i, [{"fingerprint": "0" * 16, "message": "Error", "count": 3}]) for i in range(sessions)
+            ]),
+            "record": _measure(lambda: [
+                _session_record(i, [ErrorCount("0" * 16, "Error", 3)]) for i in range(sessions)
+            ])
+        }
+    }
+    for name, sizes in results.items():
+        count = sessions if name == "processed_sessions" else items
+        sizes["items"] = count
+        sizes["bytes_per_item"] = {kind: round(size / count, 1) for kind, size in sizes.items() if kind != "items"}
+        sizes["record_vs_dict"] = round(sizes["record"] / sizes["dict"], 3)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100000, help="Error events and counts to build; sessions are a tenth of this")
+    args = parser.parse_args()
+    print(json.dumps(run(args.items), indent=2))
+
+if __name__ == "__main__":
+    sys.exit(main())
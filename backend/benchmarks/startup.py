@@ -0,0 +1,126 @@
+"""
+Cold-start benchmark for the FastAPI app.
+
+Each run starts a fresh interpreter, imports app.main and serves one request
+to "/" through the ASGI app, reporting the import time and the time from
+interpreter start to the first response. Client build times from the lazy
+registry are reported separately because they happen off the request path;
+the probe waits for the warm-up to finish before reading them.
+
+The probe runs with placeholder credentials and without backend/.env, local
+caches on disk or the error index backfill, so every run starts the same way
+and no network calls are made.
+
+Run from backend/:
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --runs 5 --baseline benchmarks/startup_baseline.json
+    python -m benchmarks.startup --runs 5 --write-baseline benchmarks/startup_baseline.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Environment of each probe: placeholders the clients can be built from, and
+# nothing that reads or writes state outside the process
+PROBE_ENVIRONMENT = {
+    "POSTHOG_HOST": "http://127.0.0.1:9/posthog",
+    "POSTHOG_API_KEY": "phx_bench",
+    "POSTHOG_PROJECT_ID": "1",
+    "GEMINI_BASE_URL": "http://127.0.0.1:9/gemini/",
+    "GEMINI_API_KEY": "bench",
+    "SUPABASE_URL": "http://127.0.0.1:9/supabase",
+    "SUPABASE_KEY": "bench.bench.bench",
+    "ANALYSIS_CACHE_PATH": "",
+    "ERROR_INDEX_PATH": "",
+    "ERROR_INDEX_BACKFILL": "false",
+    "RESPONSE_CACHE_BACKEND": "memory",
+    "PIPELINE_SCHEDULE_SECONDS": "0",
+    "POSTHOG_WEBHOOK_SECRET": "",
+    "OPENAI_AGENTS_DISABLE_TRACING": "1",
+}
+
+PROBE = r"""
+import dotenv
+# Module-level load_dotenv(override=True) calls would pull real credentials from backend/.env
+dotenv.load_dotenv = lambda *a, **k: False
+
+import asyncio, json, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+
+from fastapi.testclient import TestClient
+from app.clients import registry
+
+with TestClient(app.main.app) as client:
+    first_response = time.perf_counter()
+    response = client.get("/")
+    responded = time.perf_counter()
+    status = response.status_code
+
+# The lifespan's warm-up task may still be running or have been cancelled at
+# shutdown; build whatever is left so every client has a build time
+asyncio.run(registry.warm_up())
+
+print(json.dumps({
+    "import_seconds": imported - started,
+    "first_request_seconds": responded - started,
+    "request_seconds": responded - first_response,
+    "status": status,
+    "client_build_seconds": registry.build_times,
+}))
+"""
+
+def run_once() -> dict:
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1", **PROBE_ENVIRONMENT)
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=backend_dir,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def summarize(runs: list) -> dict:
+    return {
+        metric: statistics.median(run[metric] for run in runs)
+        for metric in ("import_seconds", "first_request_seconds", "request_seconds")
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--baseline", help="Compare against this JSON baseline and fail on regressions")
+    parser.add_argument("--write-baseline", help="Write the medians of this run as a JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown over the baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    summary = summarize(runs)
+    print(json.dumps({"median": summary, "runs": runs}, indent=2))
+
+    if args.write_baseline:
+        with open(args.write_baseline, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = {
+            metric: {"baseline": baseline[metric], "current": value}
+            for metric, value in summary.items()
+            if metric in baseline and value > baseline[metric] * (1 + args.tolerance)
+        }
+        if regressions:
+            print(json.dumps({"regressions": regressions}, indent=2))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+from app import posthog
+from app.analysis_cache import AnalysisCache, SQLiteAnalysisStore, error_set_fingerprint
+from app.cache import LRUCache
+from app.records import ErrorCount
+
+ERRORS = [ErrorCount(None, "TypeError: Cannot read properties of undefined (reading 'id')", 3)]
+OTHER_ERRORS = [ErrorCount(None, "ReferenceError: process is not defined")]
+ANALYSIS = {"title": "Cart crashes", "description": "The cart is read before it loads."}
+
+def test_error_set_fingerprint_ignores_counts_order_and_volatile_parts():
+    first = [ErrorCount(None, "Order 123456 failed", 1), ErrorCount(None, "Status 404")]
+    second = [ErrorCount(None, "Status 404", 9), ErrorCount(None, "Order 654321 failed")]
+    assert error_set_fingerprint(first) == error_set_fingerprint(second)
+    assert error_set_fingerprint(first) != error_set_fingerprint(OTHER_ERRORS)
+
+def test_hits_and_misses_are_counted():
+    async def scenario():
+        cache = AnalysisCache(LRUCache(max_size=10))
+        assert await cache.get(ERRORS) is None
+        await cache.set(ERRORS, ANALYSIS)
+        assert await cache.get(ERRORS) == ANALYSIS
+        return cache.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["hits"], stats["store_hits"], stats["misses"]) == (1, 0, 1)
+
+def test_memory_tier_expires_and_evicts_least_recently_used():
+    memory = LRUCache(max_size=2, ttl=0.05)
+    memory.set("a", 1)
+    memory.set("b", 2)
+    memory.get("a")
+    memory.set("c", 3)
+    assert "b" not in memory and "a" in memory and "c" in memory
+    time.sleep(0.06)
+    assert memory.get("a") is None
+    assert memory.stats()["evictions"] == 2
+
+def test_store_hits_are_promoted_into_memory(tmp_path):
+    async def scenario():
+        store = SQLiteAnalysisStore(str(tmp_path / "analysis.sqlite3"))
+        await AnalysisCache(LRUCache(max_size=10), store).set(ERRORS, ANALYSIS)
+        # A new process: empty memory tier, same file
+        cache = AnalysisCache(LRUCache(max_size=10), store)
+        assert await cache.get(ERRORS) == ANALYSIS
+        assert await cache.get(ERRORS) == ANALYSIS
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert (cache.hits, cache.store_hits, cache.misses) == (2, 1, 0)
+
+def test_store_rows_expire_after_ttl(tmp_path):
+    store = SQLiteAnalysisStore(str(tmp_path / "analysis.sqlite3"), ttl=60)
+    store.set("key", ANALYSIS)
+    assert store.get("key") == ANALYSIS
+    store._connection().execute("UPDATE analysis_cache SET created_at = ?", (time.time() - 61,))
+    assert store.get("key") is None
+    assert store._connection().execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0] == 0
+
+def test_store_evicts_least_recently_used_rows(tmp_path):
+    store = SQLiteAnalysisStore(str(tmp_path / "analysis.sqlite3"), max_rows=2)
+    store.set("a", {"n": 1})
+    store.set("b", {"n": 2})
+    conn = store._connection()
+    conn.execute("UPDATE analysis_cache SET accessed_at = accessed_at - 10 WHERE fingerprint = 'b'")
+    store.set("c", {"n": 3})
+    assert store.get("b") is None
+    assert store.get("a") == {"n": 1} and store.get("c") == {"n": 3}
+
+def test_fallback_analyses_are_not_cached(monkeypatch):
+    calls = []
+
+    async def failing_agent(errors, priority):
+        calls.append(errors)
+        raise RuntimeError("model returned garbage")
+
+    async def working_agent(errors, priority):
+        calls.append(errors)
+        return ANALYSIS
+
+    cache = AnalysisCache(LRUCache(max_size=10))
+    monkeypatch.setattr(posthog, "analysis_cache", cache)
+
+    async def scenario():
+        monkeypatch.setattr(posthog, "_run_analysis_agent", failing_agent)
+        fallback = await posthog.analyze_errors_with_agent(ERRORS)
+        assert fallback["title"] == "Session Console Errors"
+        assert len(cache.memory) == 0
+
+        monkeypatch.setattr(posthog, "_run_analysis_agent", working_agent)
+        assert await posthog.analyze_errors_with_agent(ERRORS) == ANALYSIS
+        assert await posthog.analyze_errors_with_agent(ERRORS) == ANALYSIS
+
+    asyncio.run(scenario())
+    # The fallback did not stick, the real answer did
+    assert len(calls) == 2
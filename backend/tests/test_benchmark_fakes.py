@@ -0,0 +1,50 @@
+from fastapi.testclient import TestClient
+
+from benchmarks.fakes import FakeData, create_app, select_columns
+
+BULK_QUERY = """
+    SELECT properties.$session_id, properties.$exception_list,
+           properties.$exception_values, properties.$exception_stacktrace
+    FROM events
+    WHERE event = '$exception' AND properties.$session_id IN {session_ids}
+    ORDER BY timestamp ASC, uuid ASC
+    LIMIT {limit} OFFSET {offset}
+"""
+
+PROJECTED_QUERY = """
+    SELECT uuid, timestamp, properties.$session_id, properties.$exception_list,
+           properties.$exception_values, properties.$exception_stacktrace
+    FROM events
+    WHERE event = '$exception'
+    ORDER BY timestamp DESC LIMIT {limit}
+"""
+
+def _query(client: TestClient, query: str, values: dict) -> list:
+    response = client.post("/posthog/api/projects/1/query/", json={"query": {"kind": "HogQLQuery", "query": query, "values": values}})
+    assert response.status_code == 200
+    return response.json()["results"]
+
+def test_select_columns():
+    assert select_columns(BULK_QUERY)[0] == "properties.$session_id"
+    assert select_columns(PROJECTED_QUERY)[:2] == ["uuid", "timestamp"]
+    assert select_columns("no select here") == []
+
+def test_query_answers_by_select_list():
+    data = FakeData(sessions=3, errors_per_session=2, distinct_errors=2, ongoing_fraction=0)
+    client = TestClient(create_app(data, {}))
+
+    # The bulk query orders by uuid too, yet gets its own four-column rows
+    rows = _query(client, BULK_QUERY, {"session_ids": [data.session_id(0), data.session_id(2)], "limit": 100, "offset": 0})
+    assert [len(row) for row in rows] == [4] * 4
+    assert {row[0] for row in rows} == {data.session_id(0), data.session_id(2)}
+
+    rows = _query(client, PROJECTED_QUERY, {"limit": 3})
+    assert [len(row) for row in rows] == [6] * 3
+
+def test_bulk_query_pages_with_limit_and_offset():
+    data = FakeData(sessions=2, errors_per_session=3, distinct_errors=2, ongoing_fraction=0)
+    client = TestClient(create_app(data, {}))
+    values = {"session_ids": [data.session_id(0), data.session_id(1)], "limit": 4}
+    first = _query(client, BULK_QUERY, {**values, "offset": 0})
+    second = _query(client, BULK_QUERY, {**values, "offset": 4})
+    assert (len(first), len(second)) == (4, 2)
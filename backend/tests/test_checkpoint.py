@@ -0,0 +1,75 @@
+import asyncio
+
+from app import database, posthog
+from app.posthog import _next_checkpoint
+from app.records import ErrorCount, ErrorEventBatch, ProcessedSession
+
+def _recording(session_id, start_time=None, ongoing=False):
+    return {"id": session_id, "start_time": start_time, "ongoing": ongoing}
+
+def test_high_water_mark_moves_to_newest_start_time():
+    checkpoint = {"high_water_mark": "2025-01-01T00:00:00+00:00"}
+    recordings = [_recording("a", "2025-01-02T00:00:00Z"), _recording("b", "2024-12-31T00:00:00Z")]
+    state = _next_checkpoint(checkpoint, recordings, [None, None])
+    assert state == {"high_water_mark": "2025-01-02T00:00:00+00:00", "pending_ids": [], "pending_attempts": {}}
+
+def test_high_water_mark_never_moves_back():
+    checkpoint = {"high_water_mark": "2025-01-05T00:00:00+00:00"}
+    state = _next_checkpoint(checkpoint, [_recording("a", "2025-01-02T00:00:00Z")], [None])
+    assert state["high_water_mark"] == "2025-01-05T00:00:00+00:00"
+
+def test_ongoing_failed_and_busy_sessions_stay_pending():
+    recordings = [
+        _recording("done", "2025-01-01T00:00:00Z"),
+        _recording("ongoing", "2025-01-01T00:01:00Z", ongoing=True),
+        _recording("failed", "2025-01-01T00:02:00Z"),
+    ]
+    results = [object(), object(), RuntimeError("boom")]
+    busy = [_recording("busy"), _recording("ongoing")]
+    state = _next_checkpoint({}, recordings, results, busy)
+    assert state["pending_ids"] == ["ongoing", "failed", "busy"]
+
+def test_empty_run_keeps_the_mark():
+    assert _next_checkpoint({}, [], []) == {"high_water_mark": None, "pending_ids": [], "pending_attempts": {}}
+
+def test_sessions_that_keep_failing_are_dropped(monkeypatch):
+    monkeypatch.setattr(posthog, "PIPELINE_PENDING_MAX_ATTEMPTS", 3)
+    recordings = [_recording("flaky"), _recording("broken"), _recording("busy")]
+    checkpoint = {"pending_ids": ["flaky", "broken", "busy"], "pending_attempts": {"flaky": 1, "broken": 2, "busy": 2}}
+    state = _next_checkpoint(checkpoint, recordings[:2], [RuntimeError("boom"), RuntimeError("boom")], recordings[2:])
+    assert state["pending_ids"] == ["flaky", "busy"]
+    # A run that did not get to a busy session does not count against it
+    assert state["pending_attempts"] == {"flaky": 2, "busy": 2}
+
+def test_pending_sessions_are_reprocessed_even_if_they_look_completed(monkeypatch):
+    analyzed = []
+    saved_checkpoints = []
+    # Stored while ongoing last run, PostHog now reports it as finished
+    stored = {"late": {"session_id": "late", "error_tags": ["TypeError: boom"], "video_link": None}}
+
+    async def pages(session_ids=None, **filters):
+        if session_ids:
+            yield [{"id": session_id, "console_error_count": 2, "ongoing": False} for session_id in session_ids]
+
+    async def errors_for(session_ids):
+        batches = {}
+        for session_id in session_ids:
+            batches[session_id] = ErrorEventBatch()
+            batches[session_id].add(None, None, session_id, "TypeError: boom")
+            batches[session_id].add(None, None, session_id, "ReferenceError: late is not defined")
+        return batches
+
+    async def analyze(recording, unique_errors, limits, writer, batcher=None, priority=None):
+        analyzed.append((recording["id"], len(unique_errors)))
+        return ProcessedSession(recording["id"], unique_errors)
+
+    monkeypatch.setattr(posthog, "iter_session_recording_pages", pages)
+    monkeypatch.setattr(posthog, "get_errors_for_sessions", errors_for)
+    monkeypatch.setattr(posthog, "_analyze_session", analyze)
+    monkeypatch.setattr(database, "get_checkpoint", lambda name: {"high_water_mark": None, "pending_ids": ["late"]})
+    monkeypatch.setattr(database, "save_checkpoint", lambda name, state: saved_checkpoints.append(state))
+    monkeypatch.setattr(database, "get_sessions_by_ids", lambda session_ids, columns=None: stored)
+
+    asyncio.run(posthog.analyze_recordings_for_errors(incremental=True, batch_analysis=False))
+    assert analyzed == [("late", 2)]
+    assert saved_checkpoints[-1]["pending_ids"] == []
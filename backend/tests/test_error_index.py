@@ -0,0 +1,38 @@
+import threading
+
+from app import database
+from app.error_index import ErrorIndex
+
+ROWS = [
+    {"session_id": f"s{i}", "error_tags": ["TypeError: boom"], "start_time": f"2026-01-0{i + 1}T00:00:00Z", "end_time": None}
+    for i in range(5)
+]
+
+def _fake_pages(calls, stop=None, stop_after=None):
+    def list_processed_sessions(columns, limit, cursor, ascending):
+        start = int(cursor or 0)
+        calls.append(start)
+        if stop is not None and len(calls) == stop_after:
+            stop.set()
+        end = start + limit
+        return {"rows": ROWS[start:end], "next_cursor": str(end) if end < len(ROWS) else None}
+    return list_processed_sessions
+
+def test_backfill_stops_between_pages_and_resumes(monkeypatch):
+    index = ErrorIndex("")
+    monkeypatch.setattr(database, "error_index", index)
+    calls = []
+    stop = threading.Event()
+    monkeypatch.setattr(database, "list_processed_sessions", _fake_pages(calls, stop, stop_after=1))
+
+    assert database.backfill_error_index(page_size=2, stop=stop) == 2
+    assert index.backfill_state() == {"cursor": "2", "done": False}
+
+    assert database.backfill_error_index(page_size=2) == 3
+    assert calls == [0, 2, 4]
+    assert index.backfill_state()["done"]
+    assert index.top()[0]["sessions"] == 5
+
+    # A finished backfill is not run again
+    assert database.backfill_error_index(page_size=2) == 0
+    assert calls == [0, 2, 4]
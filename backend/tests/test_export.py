@@ -0,0 +1,29 @@
+import asyncio
+
+from app import database, export
+
+def _chunk_sizes(monkeypatch, table, chunk_size=None):
+    limits = []
+
+    def fetch_chunk(table, cursor, limit, date_from, date_to):
+        limits.append(limit)
+        return ([{"id": "r"}], "next") if len(limits) == 1 else ([], None)
+
+    monkeypatch.setattr(export, "_fetch_chunk", fetch_chunk)
+
+    async def drain():
+        return [rows async for rows, _ in export.iter_export_chunks(table, chunk_size=chunk_size)]
+
+    asyncio.run(drain())
+    return limits
+
+def test_recordings_are_read_in_small_chunks(monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_RECORDINGS_CHUNK_SIZE", 20)
+    assert _chunk_sizes(monkeypatch, "recordings") == [20, 20]
+    assert _chunk_sizes(monkeypatch, "recordings", chunk_size=5) == [5, 5]
+    assert _chunk_sizes(monkeypatch, "recordings", chunk_size=500) == [20, 20]
+
+def test_sessions_use_the_export_chunk_size(monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_CHUNK_SIZE", 300)
+    monkeypatch.setattr(database, "SESSION_PAGE_MAX_SIZE", 1000)
+    assert _chunk_sizes(monkeypatch, "sessions") == [300, 300]
@@ -0,0 +1,44 @@
+from app.fingerprint import ErrorFingerprinter, normalize_message
+
+def test_ids_are_normalized():
+    assert normalize_message("User 3f2b8c1e-9a4d-4e1b-8c2f-1a2b3c4d5e6f not found") == "User <uuid> not found"
+    assert normalize_message("Chunk 9f8e7d6c5b failed") == "Chunk <hex> failed"
+    assert normalize_message("Order 123456789 was cancelled") == "Order <n> was cancelled"
+    assert normalize_message("GET https://api.example.com/v1/users?id=42 failed") == "GET <url> failed"
+
+def test_positions_are_normalized():
+    assert normalize_message("Unexpected token at app.js:12:345") == "Unexpected token at app.js:<line>:<col>"
+    assert normalize_message("SyntaxError at line 12") == "SyntaxError at <pos>"
+
+def test_http_status_codes_are_kept():
+    assert normalize_message("Request failed with status code 404") == "Request failed with status code 404"
+    assert normalize_message("Request failed with status code 500") == "Request failed with status code 500"
+
+def test_react_error_codes_are_kept():
+    assert normalize_message("Minified React error #418; visit https://react.dev/errors/418") == "Minified React error #418; visit <url>"
+    assert normalize_message("Minified React error #423") == "Minified React error #423"
+
+def test_abbreviations_are_kept():
+    message = "Invalid value, e.g. an empty string (i.e. nothing)"
+    assert normalize_message(message) == message
+
+def test_minified_names_are_normalized():
+    assert normalize_message("TypeError: t is not a function") == normalize_message("TypeError: e is not a function")
+    assert normalize_message("TypeError: n.Ab is not a function") == "TypeError: n.<sym> is not a function"
+    assert normalize_message("ReferenceError: $ is not defined") == "ReferenceError: <sym> is not defined"
+    assert normalize_message("Cannot read properties of undefined (reading 'x')") == "Cannot read properties of undefined (reading '<sym>')"
+
+def test_readable_names_are_kept():
+    assert normalize_message("TypeError: items.map is not a function") == "TypeError: items.map is not a function"
+    assert normalize_message("ReferenceError: process is not defined") == "ReferenceError: process is not defined"
+    assert normalize_message("Cannot read properties of null (reading 'user')") == "Cannot read properties of null (reading 'user')"
+
+def test_short_codes_get_their_own_fingerprint():
+    fingerprinter = ErrorFingerprinter(use_stacktrace=False)
+    assert fingerprinter.fingerprint("Request failed with status code 404") != fingerprinter.fingerprint("Request failed with status code 500")
+    assert fingerprinter.fingerprint("Order 123456789 was cancelled") == fingerprinter.fingerprint("Order 987654321 was cancelled")
+
+def test_group_counts_variants_of_one_error():
+    fingerprinter = ErrorFingerprinter(use_stacktrace=False)
+    groups = fingerprinter.group(["Order 111111 failed", "Order 222222 failed", "Order 222222 failed", "", "Status 404"])
+    assert [(group.message, group.count) for group in groups] == [("Order 222222 failed", 3), ("Status 404", 1)]
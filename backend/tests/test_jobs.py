@@ -0,0 +1,58 @@
+import asyncio
+
+from app import database, posthog
+from app.jobs import JobManager
+from app.records import ErrorCount, ErrorEventBatch, ProcessedSession
+
+def _recording(index: int) -> dict:
+    return {"id": f"session-{index}", "console_error_count": 1, "ongoing": False, "start_time": f"2025-01-01T00:00:0{index}+00:00"}
+
+def test_cancel_lets_sessions_in_flight_finish_and_be_saved(monkeypatch):
+    saved = []
+    gate = {}
+
+    async def pages(**filters):
+        yield [_recording(index) for index in range(3)]
+
+    async def errors_for(session_ids):
+        batches = {}
+        for session_id in session_ids:
+            batches[session_id] = ErrorEventBatch()
+            batches[session_id].add(None, None, session_id, "TypeError: boom")
+        return batches
+
+    async def analyze(recording, unique_errors, limits, writer, batcher=None, priority=None):
+        gate["started"] += 1
+        if gate["started"] == 3:
+            gate["all_started"].set()
+        await gate["release"].wait()
+        session = ProcessedSession(recording["id"], [ErrorCount("f", "TypeError: boom")])
+        await writer.add(session)
+        return session
+
+    def save(sessions):
+        saved.extend(session.session_id for session in sessions)
+        return len(sessions)
+
+    monkeypatch.setattr(posthog, "iter_session_recording_pages", pages)
+    monkeypatch.setattr(posthog, "get_errors_for_sessions", errors_for)
+    monkeypatch.setattr(posthog, "_analyze_session", analyze)
+    monkeypatch.setattr(database, "get_sessions_by_ids", lambda session_ids, columns=None: {})
+    monkeypatch.setattr(database, "save_processed_sessions", save)
+
+    async def scenario():
+        gate.update(started=0, all_started=asyncio.Event(), release=asyncio.Event())
+        manager = JobManager()
+        job = manager.submit(batch_analysis=False)
+        # Listing is over and every session is waiting on its analysis
+        await gate["all_started"].wait()
+        manager.cancel(job.id)
+        await asyncio.sleep(0)
+        gate["release"].set()
+        await asyncio.gather(job.task, return_exceptions=True)
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == "cancelled"
+    assert (job.done, job.failed) == (3, 0)
+    assert sorted(saved) == ["session-0", "session-1", "session-2"]
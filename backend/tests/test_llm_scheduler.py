@@ -0,0 +1,23 @@
+import pytest
+
+from app.llm_scheduler import TokenBucket
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(rate_per_minute=60)
+    assert bucket.wait_time(60) == 0
+    bucket.consume(60)
+    assert bucket.wait_time(30) == pytest.approx(30, abs=0.1)
+    # Half a minute later half the bucket is back
+    bucket._updated -= 30
+    assert bucket.wait_time(30) == pytest.approx(0, abs=0.1)
+
+def test_token_bucket_caps_requests_at_its_capacity():
+    bucket = TokenBucket(rate_per_minute=60)
+    bucket.consume(60)
+    # Asking for more than a minute's worth waits for a full bucket, not forever
+    assert bucket.wait_time(600) == pytest.approx(60, abs=0.1)
+
+def test_token_bucket_without_a_rate_never_waits():
+    bucket = TokenBucket(rate_per_minute=0)
+    bucket.consume(100)
+    assert bucket.wait_time(100) == 0
@@ -0,0 +1,45 @@
+import json
+
+from app.payloads import CODEC, PayloadChunk, compress, decompress, join_payload, split_payload
+
+def _recording(events: list) -> dict:
+    return {"id": "recording-1", "events": events}
+
+def _events(count: int, start: int = 0) -> list:
+    return [{"type": 3, "timestamp": 1700000000000 + i, "data": {"source": i % 7, "text": f"event {i} " * (i % 40)}} for i in range(start, start + count)]
+
+def _by_hash(chunks) -> dict:
+    return {chunk.hash: chunk for chunk in chunks}
+
+def test_payload_round_trips():
+    payload = _recording(_events(3000))
+    hashes, chunks, size = split_payload(payload, chunk_size=8 * 1024)
+    assert size == len(json.dumps(payload, separators=(',', ':'), sort_keys=True).encode())
+    assert len(hashes) > 1
+    assert join_payload(hashes, _by_hash(chunks)) == payload
+
+def test_chunks_stay_within_bounds():
+    chunk_size = 8 * 1024
+    hashes, chunks, _ = split_payload(_recording(_events(3000)), chunk_size=chunk_size)
+    sizes = [len(decompress(_by_hash(chunks)[digest].data, CODEC)) for digest in hashes]
+    assert max(sizes) <= chunk_size * 2
+    assert min(sizes[:-1]) >= chunk_size // 2
+
+def test_inserted_event_only_changes_nearby_chunks():
+    events = _events(3000)
+    before, _, _ = split_payload(_recording(events), chunk_size=8 * 1024)
+    after, _, _ = split_payload(_recording(events[:1500] + [{"type": 9}] + events[1500:]), chunk_size=8 * 1024)
+    # Fixed-size chunks would all shift after the insertion
+    assert len(set(before) & set(after)) >= len(before) * 0.9
+
+def test_payload_without_boundaries_is_split_at_twice_the_chunk_size():
+    hashes, chunks, size = split_payload({"blob": "x" * 100_000}, chunk_size=10_000)
+    assert len(hashes) == -(-size // 20_000)
+    # Identical pieces are stored once
+    assert len(chunks) < len(hashes)
+    assert join_payload(hashes, _by_hash(chunks)) == {"blob": "x" * 100_000}
+
+def test_chunk_rows_round_trip():
+    chunk = PayloadChunk("abc", "zlib", compress(b"hello", "zlib"))
+    restored = PayloadChunk.from_row(chunk.to_row())
+    assert (restored.hash, restored.codec, decompress(restored.data, restored.codec)) == ("abc", "zlib", b"hello")
@@ -0,0 +1,55 @@
+import asyncio
+
+import pytest
+
+from app.posthog_limiter import AdaptiveLimiter
+
+def _limiter(**kwargs) -> AdaptiveLimiter:
+    return AdaptiveLimiter("test", **{"initial": 4, "min_limit": 1, "max_limit": 16, "latency_target": 2, **kwargs})
+
+def test_fast_successes_grow_the_limit_additively():
+    limiter = _limiter()
+    limiter.on_success(0.1)
+    assert limiter.limit == pytest.approx(4.25)
+    for _ in range(1000):
+        limiter.on_success(0.1)
+    assert limiter.limit == 16
+
+def test_throttling_halves_the_limit_once_per_window():
+    limiter = _limiter()
+    limiter.on_throttle(None)
+    assert limiter.limit == 2
+    # A burst of 429s from the same window counts once
+    limiter.on_throttle(None)
+    assert limiter.limit == 2
+    assert limiter.throttled == 2
+
+def test_errors_and_slow_responses_shrink_the_limit_down_to_the_minimum():
+    limiter = _limiter()
+    limiter.on_error()
+    assert limiter.limit == 3
+    limiter._last_decrease = 0.0
+    limiter.on_success(5.0)
+    assert limiter.limit == pytest.approx(2.7)
+    for _ in range(50):
+        limiter._last_decrease = 0.0
+        limiter.on_throttle(None)
+    assert limiter.limit == 1
+
+def test_retry_after_pauses_new_requests():
+    limiter = _limiter()
+    limiter.on_throttle(30)
+    assert limiter.stats()["paused_for"] > 29
+
+def test_slots_are_handed_to_waiters_in_order():
+    async def scenario():
+        limiter = _limiter(initial=1)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        assert not waiter.done() and limiter.stats()["waiting"] == 1
+        limiter.release()
+        await waiter
+        assert limiter.in_flight == 1
+
+    asyncio.run(scenario())
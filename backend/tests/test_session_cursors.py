@@ -0,0 +1,27 @@
+import pytest
+
+from app.database import _quote, decode_session_cursor, encode_session_cursor
+
+def test_cursor_round_trips_in_its_own_order():
+    cursor = encode_session_cursor("2025-01-01T00:00:00+00:00", "session-1", ascending=True)
+    assert decode_session_cursor(cursor, ascending=True) == ("2025-01-01T00:00:00+00:00", "session-1")
+    assert "=" not in cursor
+
+def test_cursor_of_a_session_without_start_time():
+    cursor = encode_session_cursor(None, "session-2")
+    assert decode_session_cursor(cursor) == (None, "session-2")
+
+def test_cursor_from_the_other_order_is_rejected():
+    cursor = encode_session_cursor("2025-01-01T00:00:00+00:00", "session-1", ascending=False)
+    with pytest.raises(ValueError):
+        decode_session_cursor(cursor, ascending=True)
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "W10", "WzEsMiwiZGVzYyJd"])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_session_cursor(cursor)
+
+def test_quote_protects_postgrest_delimiters():
+    assert _quote("a,b(c)") == '"a,b(c)"'
+    assert _quote('say "hi"') == '"say \\"hi\\""'
+    assert _quote("back\\slash") == '"back\\\\slash"'
@@ -0,0 +1,37 @@
+import asyncio
+
+import httpx
+
+from app import posthog
+from app.records import ErrorEventBatch
+
+def _failing_query(status_code):
+    async def rows(session_ids):
+        request = httpx.Request("POST", "https://posthog.test/api/projects/1/query/")
+        raise httpx.HTTPStatusError("failed", request=request, response=httpx.Response(status_code, request=request))
+        yield
+    return rows
+
+def _fetch(monkeypatch, status_code):
+    fallback = []
+
+    async def per_session(session_id):
+        fallback.append(session_id)
+        return ErrorEventBatch()
+
+    monkeypatch.setattr(posthog, "api_key", "phx_test")
+    monkeypatch.setattr(posthog, "project_id", "1")
+    monkeypatch.setattr(posthog, "_iter_exception_rows", _failing_query(status_code))
+    monkeypatch.setattr(posthog, "get_errors_for_session", per_session)
+    return asyncio.run(posthog.get_errors_for_sessions(["a", "b"])), fallback
+
+def test_rejected_queries_fall_back_to_per_session_requests(monkeypatch):
+    errors, fallback = _fetch(monkeypatch, 400)
+    assert fallback == ["a", "b"]
+    assert sorted(errors) == ["a", "b"]
+
+def test_throttled_or_failing_queries_leave_sessions_for_the_next_run(monkeypatch):
+    for status_code in (429, 503):
+        errors, fallback = _fetch(monkeypatch, status_code)
+        assert fallback == []
+        assert errors == {}
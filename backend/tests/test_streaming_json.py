@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+import pytest
+
+from app.streaming_json import JSONArrayStream, iter_json_array
+
+def _feed_in_pieces(data: bytes, key: str, size: int) -> list:
+    parser = JSONArrayStream(key)
+    items = []
+    for start in range(0, len(data), size):
+        items.extend(parser.feed(data[start:start + size]))
+    parser.close()
+    return items
+
+def test_elements_survive_any_split():
+    document = {"columns": ["a", "b"], "results": [[1, "x"], {"n": 12345.5}, "é ü", None, -7], "hasMore": False}
+    data = json.dumps(document, ensure_ascii=False).encode()
+    for size in (1, 2, 3, 7, len(data)):
+        assert _feed_in_pieces(data, "results", size) == document["results"]
+
+def test_number_split_across_chunks_is_not_cut_short():
+    parser = JSONArrayStream("results")
+    assert parser.feed(b'{"results": [12') == []
+    assert parser.feed(b'34, 5') == [1234]
+    assert parser.feed(b']}') == [5]
+    assert parser.done
+
+def test_other_keys_are_skipped():
+    data = b'{"next": {"a": [1, 2]}, "count": 3, "results": [{"id": 1}]}'
+    assert _feed_in_pieces(data, "results", 4) == [{"id": 1}]
+
+def test_missing_or_null_array_yields_nothing():
+    assert _feed_in_pieces(b'{"results": null}', "results", 3) == []
+    assert _feed_in_pieces(b'{"other": []}', "results", 3) == []
+
+def test_truncated_document_raises():
+    parser = JSONArrayStream("results")
+    parser.feed(b'{"results": [1, 2')
+    with pytest.raises(ValueError):
+        parser.close()
+
+def test_not_an_object_raises():
+    with pytest.raises(ValueError):
+        JSONArrayStream("results").feed(b'[1, 2]')
+
+def test_iter_json_array_stops_after_the_array():
+    async def chunks():
+        yield b'{"results": ["a",'
+        yield b' "b"], "rest": '
+        raise AssertionError("read past the array")
+
+    async def collect():
+        return [item async for item in iter_json_array(chunks(), "results")]
+
+    assert asyncio.run(collect()) == ["a", "b"]